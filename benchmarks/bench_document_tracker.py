@@ -0,0 +1,120 @@
+# bench_document_tracker.py
+"""
+Benchmark change detection in document_tracker on a synthetic directory tree.
+
+Example:
+    python benchmarks/bench_document_tracker.py --files 20000 --dirs 500 --input-dirs 4
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from ollama_rag.configs import REQUIRED_EXTS
+from ollama_rag.document_tracker import scan_files
+
+
+def legacy_scan(input_dirs, required_exts, recursive):
+    """The os.walk + os.path.getmtime scan used before scan_files."""
+    files = {}
+    for input_dir in input_dirs:
+        for root, dirs, names in os.walk(input_dir):
+            for file in names:
+                if any(file.lower().endswith(ext) for ext in required_exts):
+                    file_path = os.path.join(root, file)
+                    files[file_path] = os.path.getmtime(file_path)
+            if not recursive:
+                break
+    return files
+
+
+def make_corpus(root, num_files, num_dirs, num_input_dirs):
+    """Create num_files small files spread over num_dirs folders in each input dir."""
+    exts = [".txt", ".md", ".pdf", ".docx", ".png", ".tmp"]
+    input_dirs = []
+    files_per_input = max(1, num_files // num_input_dirs)
+    dirs_per_input = max(1, num_dirs // num_input_dirs)
+    for i in range(num_input_dirs):
+        input_dir = os.path.join(root, f"input_{i}")
+        for j in range(files_per_input):
+            sub_dir = os.path.join(input_dir, f"dir_{j % dirs_per_input}")
+            os.makedirs(sub_dir, exist_ok=True)
+            with open(
+                os.path.join(sub_dir, f"file_{j}{exts[j % len(exts)]}"), "w"
+            ) as f:
+                f.write("x")
+        input_dirs.append(input_dir)
+    return input_dirs
+
+
+def timed(label, func, repeat):
+    """Run func repeat times and print the best wall time."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<40} {best * 1000:10.1f} ms  ({len(result)} files)")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark document change detection.")
+    parser.add_argument("--files", type=int, default=20000, help="Number of files.")
+    parser.add_argument("--dirs", type=int, default=500, help="Number of folders.")
+    parser.add_argument(
+        "--input-dirs", type=int, default=4, help="Number of input directories."
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement.")
+    parser.add_argument(
+        "--root", type=str, default=None, help="Existing folder to scan instead."
+    )
+    args = parser.parse_args()
+
+    tmp_root = None
+    if args.root:
+        input_dirs = [args.root]
+    else:
+        tmp_root = tempfile.mkdtemp(prefix="ollama_rag_bench_")
+        input_dirs = make_corpus(tmp_root, args.files, args.dirs, args.input_dirs)
+
+    try:
+        legacy = timed(
+            "os.walk + getmtime (legacy)",
+            lambda: legacy_scan(input_dirs, REQUIRED_EXTS, True),
+            args.repeat,
+        )
+        scanned = timed(
+            "scan_files",
+            lambda: scan_files(input_dirs, REQUIRED_EXTS, True),
+            args.repeat,
+        )
+        timed(
+            "scan_files, parallel input dirs",
+            lambda: scan_files(input_dirs, REQUIRED_EXTS, True, num_workers=4),
+            args.repeat,
+        )
+        snapshot = {}
+        scan_files(input_dirs, REQUIRED_EXTS, True, snapshot=snapshot)
+        timed(
+            "scan_files, pruned with warm snapshot",
+            lambda: scan_files(
+                input_dirs,
+                REQUIRED_EXTS,
+                True,
+                snapshot=snapshot,
+                prune_unchanged_dirs=True,
+            ),
+            args.repeat,
+        )
+        assert set(legacy) == set(scanned), "scan results differ from the legacy scan"
+    finally:
+        if tmp_root:
+            shutil.rmtree(tmp_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# bench_embedding_backends.py
+"""
+Compare embedding backends on the same corpus: throughput, memory and retrieval recall.
+
+The documents are split into chunks as the indexer does. For a sample of chunks, one of
+their sentences is used as a query whose relevant chunk is the one it came from. Each
+backend runs in a fresh Python process, which embeds every chunk and query and reports
+chunks/s, peak memory and recall@k. Overlap is the share of each backend's top-k
+results also found by the first (baseline) backend.
+
+Backends are given as "<backend>[:<model>]", where backend is "huggingface", "onnx" or
+"onnx-int8", and model defaults to EMBEDDING_MODEL_NAME.
+
+Example:
+    python benchmarks/bench_embedding_backends.py --input-dir documents \\
+        --backends huggingface onnx-int8 huggingface:BAAI/bge-small-en-v1.5
+"""
+
+import argparse
+import json
+import random
+import re
+import subprocess
+import sys
+import tempfile
+
+from ollama_rag.configs import EMBEDDING_MODEL_NAME, EMBED_BATCH_SIZE
+
+WORKER = """
+import json, resource, sys, time
+import numpy as np
+from ollama_rag.models import setup_embedding_model
+
+spec, data_path, batch_size, top_k = sys.argv[1:5]
+with open(data_path) as f:
+    data = json.load(f)
+backend, _, model_name = spec.partition(":")
+start = time.perf_counter()
+embed_model = setup_embedding_model(
+    model_name=model_name,
+    embed_batch_size=int(batch_size),
+    cache_dir=None,
+    lazy=False,
+    backend="onnx" if backend.startswith("onnx") else backend,
+    onnx_quantize=backend == "onnx-int8",
+)
+embed_model.get_text_embedding("warm up")
+load_s = time.perf_counter() - start
+
+start = time.perf_counter()
+chunks = np.array(embed_model.get_text_embedding_batch(data["chunks"]), dtype=np.float32)
+embed_s = time.perf_counter() - start
+queries = np.array(
+    [embed_model.get_query_embedding(query) for query in data["queries"]],
+    dtype=np.float32,
+)
+top = np.argsort(-(queries @ chunks.T), axis=1)[:, : int(top_k)]
+hits = [relevant in row for relevant, row in zip(data["relevant"], top.tolist())]
+print(json.dumps({
+    "load_s": load_s,
+    "embed_s": embed_s,
+    "chunks_per_s": len(data["chunks"]) / embed_s,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "dim": int(chunks.shape[1]),
+    "recall": sum(hits) / len(hits),
+    "top_k": top.tolist(),
+}))
+"""
+
+
+def make_dataset(input_dir, max_chunks, num_queries, seed):
+    """Split the documents of input_dir into chunks and derive one query per sampled chunk."""
+    from llama_index.core.node_parser import SentenceSplitter
+
+    from ollama_rag.data_loader import load_data
+
+    documents = load_data([input_dir])
+    nodes = SentenceSplitter().get_nodes_from_documents(documents)
+    chunks = [node.get_content() for node in nodes][:max_chunks]
+
+    rng = random.Random(seed)
+    queries, relevant = [], []
+    for i in rng.sample(range(len(chunks)), min(num_queries, len(chunks))):
+        sentences = [
+            sentence.strip()
+            for sentence in re.split(r"(?<=[.!?])\s+", chunks[i])
+            if 5 <= len(sentence.split()) <= 40
+        ]
+        if sentences:
+            queries.append(rng.choice(sentences))
+            relevant.append(i)
+    return {"chunks": chunks, "queries": queries, "relevant": relevant}
+
+
+def run(spec, data_path, batch_size, top_k):
+    """Benchmark one backend in a fresh interpreter and return its JSON report."""
+    output = subprocess.run(
+        [sys.executable, "-c", WORKER, spec, data_path, str(batch_size), str(top_k)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding backends.")
+    parser.add_argument(
+        "--input-dir", required=True, help="Directory of the benchmark documents."
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=["huggingface", "onnx", "onnx-int8"],
+        help="Backends to compare; the first one is the baseline.",
+    )
+    parser.add_argument("--max-chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    dataset = make_dataset(args.input_dir, args.max_chunks, args.queries, args.seed)
+    print(
+        f"{len(dataset['chunks'])} chunks, {len(dataset['queries'])} queries, "
+        f"recall@{args.top_k}"
+    )
+
+    results = {}
+    with tempfile.NamedTemporaryFile("w", suffix=".json") as data_file:
+        json.dump(dataset, data_file)
+        data_file.flush()
+        for spec in args.backends:
+            if ":" not in spec:
+                spec = f"{spec}:{EMBEDDING_MODEL_NAME}"
+            results[spec] = run(spec, data_file.name, args.batch_size, args.top_k)
+
+    baseline = next(iter(results.values()))
+    for spec, report in results.items():
+        overlap = [
+            len(set(row) & set(base_row)) / len(row)
+            for row, base_row in zip(report["top_k"], baseline["top_k"])
+        ]
+        report["overlap"] = sum(overlap) / len(overlap) if overlap else 0.0
+        print(
+            f"{spec:<48} {report['chunks_per_s']:8.1f} chunks/s"
+            f"  {report['peak_rss_mb']:8.0f} MB  load {report['load_s']:5.1f} s"
+            f"  recall {report['recall']:.3f}  overlap {report['overlap']:.3f}"
+        )
+
+    if args.output:
+        for report in results.values():
+            del report["top_k"]
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,630 @@
+# bench_pipeline.py
+"""
+Benchmark the ingestion and query hot paths end to end, offline and reproducibly.
+
+A synthetic corpus is generated from a seed, with a configurable number of files, size
+and format mix. Queries are answered by a local stub of the Ollama HTTP API, so the real
+Ollama client is used but no model runs, and chunks are embedded by a small
+deterministic hashing embedding unless a real model is given. The phases measured are:
+
+- scan: listing the corpus (scan_files) and diffing it against an empty manifest,
+  which hashes every file (diff_indexed_files)
+- load: parsing every file (iter_load_files)
+- create_index: the first OllamaRAG.update_index(), building the index
+- update_index: re-indexing after files are modified, added and deleted, and a
+  no-change update
+- query: OllamaRAG.query() latency and OllamaRAG.stream_query() time to first token
+
+Peak RSS is the high-water mark of this process (and, separately, of the parsing worker
+processes) at the end of each phase. Write the results with --output and compare them
+with an earlier run, e.g. from another commit, with --compare.
+
+Example:
+    python benchmarks/bench_pipeline.py --files 2000 --mix txt=3 md=2 csv=1 xlsx=1 \\
+        --output after.json --compare before.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ollama_rag.configs import INSERT_BATCH_SIZE, NUM_WORKERS, REQUIRED_EXTS
+
+FORMATS = ("txt", "md", "html", "json", "csv", "xlsx", "docx")
+HASHING_MODEL = "hashing"  # --embedding-model value selecting the hashing embedding
+
+
+def make_vocabulary(rng, size=5000):
+    """Return pronounceable pseudo-words, used with Zipf-like frequencies."""
+    consonants, vowels = "bcdfghklmnprstvz", "aeiou"
+    words = set()
+    while len(words) < size:
+        words.add(
+            "".join(
+                rng.choice(consonants) + rng.choice(vowels)
+                for _ in range(rng.randint(1, 4))
+            )
+        )
+    return sorted(words)
+
+
+class TextGenerator:
+    """Seeded generator of sentences and paragraphs over a fixed vocabulary."""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.words = make_vocabulary(self.rng)
+        self.weights = [1 / (rank + 1) for rank in range(len(self.words))]
+
+    def sentence(self):
+        words = self.rng.choices(self.words, self.weights, k=self.rng.randint(8, 20))
+        return " ".join(words).capitalize() + "."
+
+    def paragraph(self):
+        return " ".join(self.sentence() for _ in range(self.rng.randint(3, 7)))
+
+    def paragraphs(self, num_bytes):
+        """Yield paragraphs until about num_bytes of text were produced."""
+        size = 0
+        while size < num_bytes:
+            paragraph = self.paragraph()
+            size += len(paragraph) + 2
+            yield paragraph
+
+
+def write_file(path, fmt, text, file_kb, rows):
+    """Write one synthetic file of the given format."""
+    if fmt in ("txt", "md", "html", "json"):
+        paragraphs = list(text.paragraphs(file_kb * 1024))
+        with open(path, "w", encoding="utf-8") as f:
+            if fmt == "txt":
+                f.write("\n\n".join(paragraphs))
+            elif fmt == "md":
+                for i, paragraph in enumerate(paragraphs):
+                    if i % 4 == 0:
+                        f.write(f"## {text.sentence()[:-1]}\n\n")
+                    f.write(paragraph + "\n\n")
+            elif fmt == "html":
+                body = "".join(f"<p>{paragraph}</p>\n" for paragraph in paragraphs)
+                f.write(
+                    f"<html><body>\n<h1>{text.sentence()}</h1>\n{body}</body></html>"
+                )
+            else:
+                json.dump(
+                    {
+                        "title": text.sentence(),
+                        "sections": [
+                            {"id": i, "text": paragraph}
+                            for i, paragraph in enumerate(paragraphs)
+                        ],
+                    },
+                    f,
+                    indent=1,
+                )
+        return
+
+    header = ["id", "name", "category", "amount", "notes"]
+    table = [
+        [
+            i,
+            text.rng.choice(text.words),
+            text.rng.choice(text.words[:20]),
+            round(text.rng.uniform(0, 1000), 2),
+            text.sentence(),
+        ]
+        for i in range(rows)
+    ]
+    if fmt == "csv":
+        import csv
+
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(table)
+    elif fmt == "xlsx":
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("Data")
+        sheet.append(header)
+        for row in table:
+            sheet.append(row)
+        workbook.save(path)
+    elif fmt == "docx":
+        import docx
+
+        document = docx.Document()
+        document.add_heading(text.sentence(), level=1)
+        for paragraph in text.paragraphs(file_kb * 1024):
+            document.add_paragraph(paragraph)
+        document.save(path)
+
+
+def available_formats(mix):
+    """Drop the formats whose writer library is not installed."""
+    writers = {"xlsx": "openpyxl", "docx": "docx"}
+    available = {}
+    for fmt, weight in mix.items():
+        module = writers.get(fmt)
+        if module is not None:
+            try:
+                __import__(module)
+            except ImportError:
+                print(f"Skipping .{fmt} files: {module} is not installed")
+                continue
+        available[fmt] = weight
+    return available
+
+
+def make_corpus(root, num_files, mix, file_kb, rows, num_dirs, seed):
+    """
+    Create num_files files in root, with formats drawn from the weighted mix.
+
+    Returns:
+    - Tuple[List[str], TextGenerator]: The file paths and the text generator, which
+      keeps producing sentences of the same vocabulary for queries and updates.
+    """
+    text = TextGenerator(seed)
+    formats = sorted(mix)
+    file_paths = []
+    for i in range(num_files):
+        fmt = text.rng.choices(formats, [mix[fmt] for fmt in formats])[0]
+        sub_dir = os.path.join(root, f"dir_{i % num_dirs:03d}")
+        os.makedirs(sub_dir, exist_ok=True)
+        path = os.path.join(sub_dir, f"file_{i:06d}.{fmt}")
+        write_file(path, fmt, text, file_kb, rows)
+        file_paths.append(path)
+    return file_paths, text
+
+
+def make_hashing_embedding(dim):
+    """
+    Return a deterministic embedding: words hashed into dim signed buckets, L2 normalized.
+
+    It needs no model download and gives the same vectors on every machine, while
+    chunks sharing words still end up close, so retrieval behaves sensibly.
+    """
+    from llama_index.core.embeddings import BaseEmbedding
+
+    def embed(text):
+        vector = [0.0] * dim
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = sum(value * value for value in vector) ** 0.5 or 1.0
+        return [value / norm for value in vector]
+
+    class HashingEmbedding(BaseEmbedding):
+        def _get_query_embedding(self, query):
+            return embed(query)
+
+        async def _aget_query_embedding(self, query):
+            return embed(query)
+
+        def _get_text_embedding(self, text):
+            return embed(text)
+
+    return HashingEmbedding(model_name=f"{HASHING_MODEL}-{dim}")
+
+
+def use_hashing_embedding(dim):
+    """Make OllamaRAG embed with the hashing embedding, behind the embedding cache."""
+    import ollama_rag.ollama_rag as engine_module
+    from ollama_rag.embedding_cache import CachedEmbedding, EmbeddingCache
+
+    def setup_embedding_model(cache_dir=None, **kwargs):
+        embed_model = make_hashing_embedding(dim)
+        if cache_dir:
+            embed_model = CachedEmbedding(
+                embed_model, EmbeddingCache(cache_dir, embed_model.model_name)
+            )
+        return embed_model
+
+    engine_module.setup_embedding_model = setup_embedding_model
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Answers /api/chat and /api/generate like Ollama, with canned tokens."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _chunk(self, body, content, done):
+        message = {"role": "assistant", "content": content}
+        chunk = {
+            "model": body.get("model", "stub"),
+            "created_at": "2024-01-01T00:00:00Z",
+            "done": done,
+        }
+        if self.path == "/api/chat":
+            chunk["message"] = message
+        else:
+            chunk["response"] = content
+        if done:
+            chunk["done_reason"] = "stop"
+        return chunk
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])) or b"{}")
+        if self.path not in ("/api/chat", "/api/generate"):
+            self.send_error(404)
+            return
+        tokens = [f"token{i} " for i in range(self.server.num_tokens)]
+        time.sleep(self.server.ttft_s)
+        if not body.get("stream", True):
+            time.sleep(self.server.token_s * len(tokens))
+            payload = json.dumps(self._chunk(body, "".join(tokens), True)).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunks = [self._chunk(body, token, False) for token in tokens]
+        chunks.append(self._chunk(body, "", True))
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(self.server.token_s)
+            line = json.dumps(chunk).encode() + b"\n"
+            self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start_stub_ollama(num_tokens, ttft_ms, token_ms):
+    """Serve the stub Ollama API on a free local port and return its base URL."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+    server.daemon_threads = True
+    server.num_tokens = num_tokens
+    server.ttft_s = ttft_ms / 1000
+    server.token_s = token_ms / 1000
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def peak_rss():
+    """Return the peak RSS in MB of this process and of its finished children."""
+    return {
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_child_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        / 1024,
+    }
+
+
+def percentile(values, fraction):
+    """Return the nearest-rank percentile of values, None if there are none."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+
+def latency_stats(values, prefix):
+    """Return p50/p95/p99 of a list of milliseconds, keyed with a prefix."""
+    stats = {}
+    for fraction in (0.5, 0.95, 0.99):
+        value = percentile(values, fraction)
+        stats[f"{prefix}_p{int(fraction * 100)}_ms"] = (
+            None if value is None else round(value, 2)
+        )
+    return stats
+
+
+def timed(func):
+    """Call func and return its result and the wall time in seconds."""
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def bench_scan(input_dirs):
+    from ollama_rag.document_tracker import diff_indexed_files, scan_files
+
+    files, scan_s = timed(lambda: scan_files(input_dirs, REQUIRED_EXTS, True))
+    changes, diff_s = timed(
+        lambda: diff_indexed_files(input_dirs, REQUIRED_EXTS, True, {})
+    )
+    return {
+        "files": len(files),
+        "scan_s": scan_s,
+        "diff_s": diff_s,
+        "scan_files_per_s": len(files) / scan_s,
+        "diff_files_per_s": len(changes["added"]) / diff_s,
+    }
+
+
+def bench_load(file_paths, num_workers):
+    from ollama_rag.data_loader import iter_load_files
+
+    num_bytes = sum(os.path.getsize(path) for path in file_paths)
+    num_docs, load_s = timed(
+        lambda: sum(1 for _ in iter_load_files(file_paths, num_workers=num_workers))
+    )
+    return {
+        "files": len(file_paths),
+        "documents": num_docs,
+        "load_s": load_s,
+        "files_per_s": len(file_paths) / load_s,
+        "mb_per_s": num_bytes / 1024**2 / load_s,
+    }
+
+
+def bench_create_index(engine):
+    _, index_s = timed(engine.update_index)
+    num_files = len(engine.manifest.load_files())
+    num_chunks = engine.index.vector_store.client.count()
+    return {
+        "files": num_files,
+        "chunks": num_chunks,
+        "index_s": index_s,
+        "files_per_s": num_files / index_s,
+        "chunks_per_s": num_chunks / index_s,
+    }
+
+
+def bench_update_index(engine, file_paths, text, fraction, rows, file_kb, rng):
+    """Modify, add and delete a fraction of the files, then update the index."""
+    num_changed = max(1, int(len(file_paths) * fraction))
+    changed = rng.sample(file_paths, min(len(file_paths), 3 * num_changed))
+    modified = changed[:num_changed]
+    deleted = changed[num_changed : 2 * num_changed]
+    for path in modified:
+        fmt = os.path.splitext(path)[1][1:]
+        if fmt in ("txt", "md"):
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n\n" + text.paragraph())
+        else:
+            write_file(path, fmt, text, file_kb, rows)
+    for path in deleted:
+        os.remove(path)
+    added = []
+    for i, path in enumerate(changed[2 * num_changed :]):
+        fmt = os.path.splitext(path)[1][1:]
+        new_path = os.path.join(os.path.dirname(path), f"added_{i:06d}.{fmt}")
+        write_file(new_path, fmt, text, file_kb, rows)
+        added.append(new_path)
+    deleted_paths = set(deleted)
+    file_paths[:] = [path for path in file_paths if path not in deleted_paths] + added
+
+    _, update_s = timed(engine.update_index)
+    _, noop_s = timed(engine.update_index)
+    num_changed_files = len(modified) + len(deleted) + len(added)
+    return {
+        "modified": len(modified),
+        "deleted": len(deleted),
+        "added": len(added),
+        "update_s": update_s,
+        "changed_files_per_s": num_changed_files / update_s,
+        "noop_update_s": noop_s,
+    }
+
+
+def bench_query(engine, queries):
+    latencies, ttfts, stream_latencies = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        engine.query(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    for query in queries:
+        stream = engine.stream_query(query)
+        for _ in stream:
+            pass
+        ttfts.append(stream.ttft_ms)
+        stream_latencies.append(stream.latency_ms)
+    return {
+        "queries": len(queries),
+        **latency_stats(latencies, "latency"),
+        **latency_stats(ttfts, "ttft"),
+        **latency_stats(stream_latencies, "stream_latency"),
+    }
+
+
+def git_commit():
+    """Return the commit of the checkout being benchmarked, None outside git."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print every numeric metric next to its value in an earlier results file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    for phase, metrics in results.items():
+        for name, value in metrics.items():
+            old = baseline.get("results", {}).get(phase, {}).get(name)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            change = f"{(value - old) / old * 100:+7.1f}%" if old else "    n/a"
+            print(f"{phase + '.' + name:<40} {old:12.3f} -> {value:12.3f}  {change}")
+
+
+def parse_mix(items):
+    """Parse "fmt=weight" items into {fmt: weight}."""
+    mix = {}
+    for item in items:
+        fmt, _, weight = item.partition("=")
+        fmt = fmt.lstrip(".").lower()
+        if fmt not in FORMATS:
+            raise argparse.ArgumentTypeError(f"Unknown format: {fmt}")
+        mix[fmt] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark ingestion and queries on a synthetic corpus."
+    )
+    parser.add_argument("--files", type=int, default=500, help="Number of files.")
+    parser.add_argument(
+        "--mix",
+        nargs="+",
+        default=["txt=3", "md=2", "html=1", "json=1", "csv=1", "xlsx=1"],
+        help=f"Formats and their weights, as fmt=weight; any of {', '.join(FORMATS)}.",
+    )
+    parser.add_argument(
+        "--file-kb", type=int, default=8, help="Size of each text file in KB."
+    )
+    parser.add_argument(
+        "--rows", type=int, default=200, help="Rows of each spreadsheet or CSV."
+    )
+    parser.add_argument("--dirs", type=int, default=20, help="Number of folders.")
+    parser.add_argument(
+        "--modify-fraction",
+        type=float,
+        default=0.05,
+        help="Share of the files modified, and of those deleted and added, before "
+        "update_index.",
+    )
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument(
+        "--embedding-model",
+        default=HASHING_MODEL,
+        help=f"'{HASHING_MODEL}' for the deterministic hashing embedding, or the name "
+        "of a model for the configured embedding backend.",
+    )
+    parser.add_argument(
+        "--embedding-dim", type=int, default=384, help="Size of hashing embeddings."
+    )
+    parser.add_argument("--llm-tokens", type=int, default=64)
+    parser.add_argument(
+        "--llm-ttft-ms",
+        type=float,
+        default=0.0,
+        help="Stub LLM delay before answering.",
+    )
+    parser.add_argument(
+        "--llm-token-ms", type=float, default=0.0, help="Stub LLM delay per token."
+    )
+    parser.add_argument("--num-workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--insert-batch-size", type=int, default=INSERT_BATCH_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--work-dir", help="Directory for the corpus and index, kept after the run."
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument(
+        "--compare", help="Earlier results file to compare the metrics with."
+    )
+    args = parser.parse_args()
+
+    mix = available_formats(parse_mix(args.mix))
+    if not mix:
+        parser.error("None of the formats in --mix can be generated.")
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="ollama_rag_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    corpus_dir = os.path.join(work_dir, "corpus")
+    server, base_url = start_stub_ollama(
+        args.llm_tokens, args.llm_ttft_ms, args.llm_token_ms
+    )
+    if args.embedding_model == HASHING_MODEL:
+        use_hashing_embedding(args.embedding_dim)
+
+    cwd = os.getcwd()
+    # The index, manifest and caches are created relative to the working directory
+    os.chdir(work_dir)
+    try:
+        (file_paths, text), generate_s = timed(
+            lambda: make_corpus(
+                corpus_dir,
+                args.files,
+                mix,
+                args.file_kb,
+                args.rows,
+                args.dirs,
+                args.seed,
+            )
+        )
+        corpus_mb = sum(os.path.getsize(path) for path in file_paths) / 1024**2
+        print(
+            f"Generated {len(file_paths)} files ({corpus_mb:.1f} MB) in "
+            f"{generate_s:.1f} s under {corpus_dir}"
+        )
+
+        from ollama_rag.ollama_rag import OllamaRAG
+
+        results = {"scan": bench_scan([corpus_dir])}
+        results["scan"].update(peak_rss())
+        results["load"] = bench_load(file_paths, args.num_workers)
+        results["load"].update(peak_rss())
+
+        engine = OllamaRAG(
+            input_dirs=[corpus_dir],
+            embedding_model_name=args.embedding_model,
+            ollama_base_url=base_url,
+            num_workers=args.num_workers,
+            insert_batch_size=args.insert_batch_size,
+            query_cache_size=0,
+        )
+        results["create_index"] = bench_create_index(engine)
+        results["create_index"].update(peak_rss())
+        results["update_index"] = bench_update_index(
+            engine,
+            file_paths,
+            text,
+            args.modify_fraction,
+            args.rows,
+            args.file_kb,
+            random.Random(args.seed + 1),
+        )
+        results["update_index"].update(peak_rss())
+        results["query"] = bench_query(
+            engine, [text.sentence() for _ in range(args.queries)]
+        )
+        results["query"].update(peak_rss())
+    finally:
+        os.chdir(cwd)
+        server.shutdown()
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    for phase, metrics in results.items():
+        print(f"\n{phase}")
+        for name, value in metrics.items():
+            if isinstance(value, float):
+                value = f"{value:.3f}"
+            print(f"  {name:<28} {value}")
+
+    if args.compare:
+        compare(results, args.compare)
+    if args.output:
+        report = {
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "args": vars(args),
+            "corpus": {"files": args.files, "mb": corpus_mb, "formats": mix},
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
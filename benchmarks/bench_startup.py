@@ -0,0 +1,114 @@
+# bench_startup.py
+"""
+Measure import time and cold start of ollama_rag in fresh interpreters.
+
+Each measurement runs in a new Python process so nothing is already imported. The
+script exits with status 1 if a measurement exceeds its budget.
+
+Example:
+    python benchmarks/bench_startup.py --import-budget 0.1 --cold-start-budget 5
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+
+HEAVY_MODULES = ["torch", "transformers", "sentence_transformers", "chromadb", "pandas"]
+
+IMPORT_PACKAGE = """
+import time
+start = time.perf_counter()
+import ollama_rag
+elapsed = time.perf_counter() - start
+"""
+
+IMPORT_ENGINE = """
+import time
+start = time.perf_counter()
+from ollama_rag import OllamaRAG
+elapsed = time.perf_counter() - start
+"""
+
+COLD_START = """
+import os, time
+os.chdir({work_dir!r})
+start = time.perf_counter()
+from ollama_rag import OllamaRAG
+engine = OllamaRAG(input_dirs=[])
+elapsed = time.perf_counter() - start
+"""
+
+REPORT = """
+import json, sys
+print(json.dumps({{
+    "elapsed": elapsed,
+    "heavy_modules": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def run(code):
+    """Run code in a fresh interpreter and return its JSON report."""
+    output = subprocess.run(
+        [sys.executable, "-c", code + REPORT.format(heavy=HEAVY_MODULES)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ollama_rag startup.")
+    parser.add_argument(
+        "--import-budget",
+        type=float,
+        default=0.1,
+        help="Seconds allowed for 'import ollama_rag'.",
+    )
+    parser.add_argument(
+        "--engine-import-budget",
+        type=float,
+        default=3.0,
+        help="Seconds allowed for 'from ollama_rag import OllamaRAG'.",
+    )
+    parser.add_argument(
+        "--cold-start-budget",
+        type=float,
+        default=5.0,
+        help="Seconds allowed to import and construct OllamaRAG.",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        measurements = [
+            ("import ollama_rag", run(IMPORT_PACKAGE), args.import_budget),
+            (
+                "from ollama_rag import OllamaRAG",
+                run(IMPORT_ENGINE),
+                args.engine_import_budget,
+            ),
+            (
+                "OllamaRAG() cold start",
+                run(COLD_START.format(work_dir=work_dir)),
+                args.cold_start_budget,
+            ),
+        ]
+
+    over_budget = False
+    for label, report, budget in measurements:
+        status = "ok" if report["elapsed"] <= budget else "OVER BUDGET"
+        over_budget = over_budget or report["elapsed"] > budget
+        heavy = ", ".join(report["heavy_modules"]) or "none"
+        print(
+            f"{label:<36} {report['elapsed']:7.3f} s  (budget {budget:.3f} s, {status})"
+            f"  heavy modules loaded: {heavy}"
+        )
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,12 @@
 # ollama_rag/__init__.py
 
-from .ollama_rag import OllamaRAG
-
 __all__ = ["OllamaRAG"]
+
+
+def __getattr__(name):
+    # Import OllamaRAG (and llama_index) only when it is first accessed
+    if name == "OllamaRAG":
+        from .ollama_rag import OllamaRAG
+
+        return OllamaRAG
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
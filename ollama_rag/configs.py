@@ -5,10 +5,32 @@ import os
 # Model configurations
 MODEL_NAME = "llama3.2"
 REQUEST_TIMEOUT = 120.0
+OLLAMA_BASE_URL = "http://localhost:11434"  # Address of the Ollama server
+QUERY_CONCURRENCY = 4  # Maximum number of async queries answered at the same time
 
 # Embedding model configurations
 EMBEDDING_MODEL_NAME = "BAAI/bge-large-en-v1.5"
 TRUST_REMOTE_CODE = True
+LAZY_MODELS = True  # Load the embedding model on first use instead of at startup
+EMBED_BATCH_SIZE = 32  # Number of chunks embedded per model forward pass
+EMBEDDING_BACKEND = "huggingface"  # "huggingface" (PyTorch) or "onnx" (ONNX Runtime)
+ONNX_MODEL_DIR = "onnx_models"  # Directory the ONNX exports of embedding models go to
+ONNX_QUANTIZE = True  # Use the int8 dynamically quantized ONNX model
+ONNX_NUM_THREADS = None  # ONNX Runtime threads per embedding call, None for all cores
+INSERT_BATCH_SIZE = 512  # Number of chunks embedded and written to ChromaDB at a time
+DEDUPLICATE = (
+    True  # Embed and store identical files and chunks once, listing each source
+)
+PROGRESS_LOG_INTERVAL = 30.0  # Seconds between progress log lines while indexing
+
+# Embedding cache configurations
+EMBEDDING_CACHE_DIR = (
+    "embedding_cache"  # Directory of the embedding cache, None to disable
+)
+EMBEDDING_CACHE_MAX_BYTES = 2 * 1024**3  # Maximum size of cached vectors per model
+EMBEDDING_CACHE_DTYPE = (
+    "float16"  # Precision of cached vectors ("float16" or "float32")
+)
 
 # Data loader configurations
 INPUT_DIRS = [  # List of directories where your documents are stored
@@ -35,22 +57,83 @@ REQUIRED_EXTS = [
     ".xlsx",
 ]  # File extensions to be considered for indexing
 RECURSIVE = True  # Whether to load files recursively from subdirectories
+TABLE_ROWS_PER_CHUNK = 50  # Rows of a spreadsheet or CSV per document, under the header
+TABLE_CHUNK_MAX_CHARS = 3000  # Start a new document once a row block reaches this size
+NUM_WORKERS = os.cpu_count() or 1  # Number of processes used to parse documents
+FILE_TIMEOUT = 300.0  # Seconds allowed to parse a single file before it is skipped
+# Legacy .ppt, .doc and .rtf files are converted with LibreOffice before parsing
+CONVERSION_CACHE_DIR = "conversion_cache"  # Converted copies, named by source content
+CONVERSION_BATCH_SIZE = 20  # Files converted per LibreOffice process
+CONVERSION_WORKERS = 2  # LibreOffice processes run at the same time
+CONVERSION_TIMEOUT = 120.0  # Seconds allowed per converted file
+SCAN_WORKERS = 4  # Number of input directories scanned concurrently for changes
+SCAN_PRUNE_UNCHANGED_DIRS = (
+    False  # Skip re-stat'ing files in folders whose mtime is unchanged
+)
 
 # Index persistence directory
 PERSIST_DIR = "storage"  # Directory to store the index files (e.g., 'storage/')
+PERSIST_DOCSTORE = (
+    False  # Also save the docstore and index store as JSON in PERSIST_DIR (legacy)
+)
+DOCSTORE_CHECKPOINT_INTERVAL = (
+    300.0  # Seconds between saves of the legacy docstore during a long indexing run
+)
 
 # ChromaDB configurations
 CHROMA_DB_DIR = "chroma_db"  # Directory to store ChromaDB data
 CHROMA_COLLECTION_NAME = "my_collection"  # Name of the ChromaDB collection
+# HNSW parameters, applied when a collection is created
+HNSW_M = 16  # Links per vector; more improves recall on large corpora but uses memory
+HNSW_CONSTRUCTION_EF = 100  # Candidates considered while inserting; more is slower
+HNSW_SEARCH_EF = 100  # Candidates considered while searching; more is slower
+SHARD_BY = None  # Split the index by "input_dir" or "file_type", None for no shards
+SHARD_SEARCH_WORKERS = 4  # Number of shards searched in parallel
 
 # Indexed files metadata path
-INDEXED_FILES_PATH = "indexed_files.json"  # Path to store indexed files metadata
+MANIFEST_PATH = "index_manifest.db"  # SQLite manifest of indexed files and their nodes
+INDEXED_FILES_PATH = "indexed_files.json"  # Legacy manifest, imported once if present
+
+# Retrieval configurations
+SIMILARITY_TOP_K = 2  # Number of chunks retrieved per query
+HYBRID_SEARCH = True  # Fuse vector search with BM25 keyword search
+KEYWORD_INDEX_PATH = "keyword_index.db"  # SQLite inverted index used by keyword search
+KEYWORD_TOP_K = 5  # Number of keyword search results fused with the vector results
+RRF_K = 60  # Reciprocal rank fusion constant; higher values flatten the rank weights
+RERANK = False  # Rerank retrieved chunks with a cross-encoder before synthesis
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"  # Small CPU cross-encoder
+RERANK_TOP_N = 3  # Number of reranked chunks passed to the LLM
+RERANK_BATCH_SIZE = 16  # Number of query/chunk pairs scored per forward pass
+RERANK_MAX_LENGTH = 512  # Maximum tokens of a query/chunk pair seen by the reranker
+RERANK_MIN_SCORE = None  # Drop reranked chunks scoring below this, None to keep top n
+RERANK_CACHE_SIZE = 4096  # Number of (query, chunk) scores cached in memory
+CONTEXT_TOKEN_BUDGET = (
+    None  # Max tokens of retrieved context per prompt (e.g. 1500), None for no limit
+)
+CONTEXT_TOKENIZER_MARGIN = (
+    0.85  # Share of the budget used when counting with tiktoken, not the LLM tokenizer
+)
+
+# Query result cache configurations
+QUERY_CACHE_SIZE = 0  # Maximum number of cached query results, 0 to disable the cache
+QUERY_CACHE_TTL = 3600.0  # Seconds a cached result stays valid, None for no expiry
+QUERY_CACHE_SIMILARITY = (
+    None  # Similarity (0-1) for reusing a similar query's result, None for exact only
+)
+
+# Server configurations
+SERVER_HOST = "127.0.0.1"  # Address the query server listens on
+SERVER_PORT = 8765  # Port the query server listens on
+SERVER_SOCKET = (
+    None  # Unix socket path to listen on instead of TCP, e.g. "/tmp/ollama_rag.sock"
+)
+REINDEX_INTERVAL = 300.0  # Seconds between background re-indexing runs, 0 to disable
+
+# Watch mode configurations
+WATCH_DEBOUNCE_MS = 1600  # Changes made within this window are grouped into one update
+WATCH_MAX_PENDING = 10000  # Changed paths queued before falling back to a full rescan
+WATCH_POLL_INTERVAL = 30.0  # Seconds between scans of directories on network mounts
+WATCH_FORCE_POLLING = None  # True to poll every directory, None to poll network mounts
 
 # Default query
 QUERY = "Your example questions?"
-
-# Create directories if they don't exist
-os.makedirs(PERSIST_DIR, exist_ok=True)  # Create storage directory if it doesn't exist
-os.makedirs(
-    CHROMA_DB_DIR, exist_ok=True
-)  # Create ChromaDB directory if it doesn't exist
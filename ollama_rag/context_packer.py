@@ -0,0 +1,140 @@
+# context_packer.py
+
+import hashlib
+
+from llama_index.core.schema import MetadataMode, NodeWithScore
+from llama_index.core.utils import get_tokenizer
+
+from ollama_rag.configs import CONTEXT_TOKEN_BUDGET, CONTEXT_TOKENIZER_MARGIN
+
+MIN_PACKED_TOKENS = 64  # Smallest truncated chunk worth adding to a full context
+
+
+def _text_key(text):
+    """Return a key identifying a chunk's text regardless of whitespace and case."""
+    return hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).digest()
+
+
+def _trim_overlap(node, kept_spans):
+    """
+    Cut the parts of a node's text that kept nodes of the same document already cover.
+
+    Returns the (start, end) character range of the document still to include, the
+    node's own range if its offsets are unknown, or None if it is fully covered.
+    """
+    start, end = node.start_char_idx, node.end_char_idx
+    if start is None or end is None or len(node.text) != end - start:
+        return start, end
+    for span_start, span_end in kept_spans:
+        if span_start <= start < span_end:
+            start = span_end
+        if span_start < end <= span_end:
+            end = span_start
+        if start >= end:
+            return None
+    return start, end
+
+
+def pack_context(
+    nodes,
+    token_budget=CONTEXT_TOKEN_BUDGET,
+    tokenizer=None,
+    margin=CONTEXT_TOKENIZER_MARGIN,
+):
+    """
+    Deduplicate retrieved nodes and fit them into a prompt token budget.
+
+    Nodes are taken in retrieval order. Chunks with the same text as an earlier one are
+    dropped. Where a chunk overlaps a kept chunk of the same document, the overlapping
+    text is cut. Chunks are added until ``token_budget`` is reached; the chunk that does
+    not fit is truncated if at least MIN_PACKED_TOKENS tokens are left.
+
+    Ollama does not expose its models' tokenizers, so unless ``tokenizer`` matches the
+    LLM, tokens are counted with the llama_index (tiktoken) tokenizer. That is only an
+    approximation of the LLM's count, which is often higher for Llama-family models, so
+    only ``margin`` of the budget is filled in that case.
+
+    Parameters:
+    - nodes (List[NodeWithScore]): Retrieved nodes, best first.
+    - token_budget (int, optional): Maximum number of context tokens, counted as the LLM
+      sees them (with metadata). None for no limit, in which case no tokens are counted.
+      Defaults to CONTEXT_TOKEN_BUDGET.
+    - tokenizer (Callable, optional): Function returning the LLM's tokens of a text.
+      Defaults to the llama_index tokenizer with the budget reduced by ``margin``.
+    - margin (float, optional): Share of the budget used with the default tokenizer.
+      Defaults to CONTEXT_TOKENIZER_MARGIN.
+
+    Returns:
+    - tuple: The packed nodes and a dict with the number of ``retrieved_chunks``,
+      ``packed_chunks``, ``retrieved_tokens``, ``packed_tokens`` and ``saved_tokens``.
+      The token counts are None when there is no budget.
+    """
+    if token_budget is not None and tokenizer is None:
+        tokenizer = get_tokenizer()
+        token_budget = int(token_budget * margin)
+
+    def count_tokens(node):
+        if token_budget is None:
+            return 0
+        return len(tokenizer(node.get_content(metadata_mode=MetadataMode.LLM)))
+
+    packed = []
+    seen_texts = set()
+    spans = {}  # ref_doc_id -> character ranges of kept nodes
+    retrieved_tokens = packed_tokens = 0
+    budget_full = False
+
+    for node_with_score in nodes:
+        node = node_with_score.node
+        num_tokens = count_tokens(node)
+        retrieved_tokens += num_tokens
+        if budget_full:
+            continue
+
+        key = _text_key(node.get_content())
+        if key in seen_texts:
+            continue
+        seen_texts.add(key)
+
+        doc_spans = spans.setdefault(node.ref_doc_id, [])
+        span = _trim_overlap(node, doc_spans)
+        if span is None:
+            continue
+        if span != (node.start_char_idx, node.end_char_idx):
+            offset = node.start_char_idx
+            node = node.model_copy()
+            node.text = node.text[span[0] - offset : span[1] - offset]
+            node.start_char_idx, node.end_char_idx = span
+            num_tokens = count_tokens(node)
+
+        if token_budget is not None and packed_tokens + num_tokens > token_budget:
+            budget_full = True
+            remaining = token_budget - packed_tokens
+            if remaining < MIN_PACKED_TOKENS:
+                continue
+            # Keep the share of the text that fits, cut at a word boundary
+            node = node.model_copy()
+            cut = len(node.text) * remaining // num_tokens
+            node.text = node.text[:cut].rsplit(" ", 1)[0]
+            while node.text and count_tokens(node) > remaining:
+                node.text = node.text[: len(node.text) * 9 // 10].rsplit(" ", 1)[0]
+            if not node.text:
+                continue
+            if node.end_char_idx is not None and node.start_char_idx is not None:
+                node.end_char_idx = node.start_char_idx + len(node.text)
+            num_tokens = count_tokens(node)
+
+        if span[0] is not None and span[1] is not None:
+            doc_spans.append((node.start_char_idx, node.end_char_idx))
+        packed.append(NodeWithScore(node=node, score=node_with_score.score))
+        packed_tokens += num_tokens
+
+    counted = token_budget is not None
+    stats = {
+        "retrieved_chunks": len(nodes),
+        "packed_chunks": len(packed),
+        "retrieved_tokens": retrieved_tokens if counted else None,
+        "packed_tokens": packed_tokens if counted else None,
+        "saved_tokens": retrieved_tokens - packed_tokens if counted else None,
+    }
+    return packed, stats
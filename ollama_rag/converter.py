@@ -0,0 +1,261 @@
+# converter.py
+
+import os
+import queue
+import shutil
+import hashlib
+import logging
+import pathlib
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from ollama_rag.configs import (
+    CONVERSION_CACHE_DIR,
+    CONVERSION_BATCH_SIZE,
+    CONVERSION_WORKERS,
+    CONVERSION_TIMEOUT,
+)
+
+# Legacy formats converted with LibreOffice, and the format they are converted to
+LEGACY_FORMATS = {".ppt": "pptx", ".doc": "docx", ".rtf": "docx"}
+FAILED_SUFFIX = ".failed"  # Marks a file LibreOffice could not convert
+
+logger = logging.getLogger(__name__)
+
+
+def find_soffice():
+    """Return the path of the LibreOffice executable, or None if it is not installed."""
+    return shutil.which("soffice") or shutil.which("libreoffice")
+
+
+def is_legacy_format(file_path):
+    """Return whether a file is in a format converted with LibreOffice."""
+    return os.path.splitext(str(file_path))[1].lower() in LEGACY_FORMATS
+
+
+def file_digest(file_path):
+    """Return the SHA-256 digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cached_path(file_path, cache_dir=CONVERSION_CACHE_DIR, digest=None):
+    """
+    Return where the converted copy of a file is cached.
+
+    Parameters:
+    - file_path (str): Path of the legacy file.
+    - cache_dir (str, optional): Directory of the conversion cache.
+    - digest (str, optional): Digest of the file, computed if not given.
+
+    Returns:
+    - str: Path of the converted file, named after the content of the source file.
+    """
+    target = LEGACY_FORMATS[os.path.splitext(str(file_path))[1].lower()]
+    if digest is None:
+        digest = file_digest(file_path)
+    return os.path.join(cache_dir, digest[:2], f"{digest}.{target}")
+
+
+def _make_batches(jobs, batch_size):
+    """
+    Group conversion jobs by target format into batches of at most batch_size files.
+
+    LibreOffice names its outputs after the source file, so two files with the same
+    name (or stem, for formats converted to the same target) go to different batches.
+    """
+    batches = []
+    for job in jobs:
+        file_path, _, target = job
+        stem = os.path.splitext(os.path.basename(file_path))[0]
+        for batch in batches:
+            if (
+                batch["target"] == target
+                and len(batch["jobs"]) < batch_size
+                and stem not in batch["stems"]
+            ):
+                break
+        else:
+            batch = {"target": target, "jobs": [], "stems": set()}
+            batches.append(batch)
+        batch["jobs"].append(job)
+        batch["stems"].add(stem)
+    return batches
+
+
+def _mark_failed(destination):
+    """Remember that a file could not be converted, until its content changes."""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    with open(destination + FAILED_SUFFIX, "w"):
+        pass
+
+
+def _run_soffice(soffice, profile_dir, file_paths, target, output_dir, timeout):
+    """Convert files with one LibreOffice process using its own user profile."""
+    subprocess.run(
+        [
+            soffice,
+            # A private profile per worker lets several instances run side by side
+            f"-env:UserInstallation={pathlib.Path(profile_dir).resolve().as_uri()}",
+            "--headless",
+            "--norestore",
+            "--convert-to",
+            target,
+            "--outdir",
+            output_dir,
+            *file_paths,
+        ],
+        check=True,
+        timeout=timeout,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+
+
+def _convert_batch(soffice, batch, cache_dir, profile_dir, timeout):
+    """
+    Convert a batch of files and move the outputs into the cache.
+
+    If LibreOffice fails or times out on the batch, its files are converted one at a
+    time, so only the file that causes the failure is lost.
+
+    Returns:
+    - Dict[str, str]: Converted path of each file that was converted.
+    """
+    jobs, target = batch["jobs"], batch["target"]
+    converted = {}
+    with tempfile.TemporaryDirectory(dir=cache_dir, prefix=".convert-") as output_dir:
+        try:
+            _run_soffice(
+                soffice,
+                profile_dir,
+                [file_path for file_path, _, _ in jobs],
+                target,
+                output_dir,
+                timeout * len(jobs),
+            )
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            if len(jobs) == 1:
+                logger.error(f"LibreOffice failed to convert {jobs[0][0]}: {e}")
+                _mark_failed(jobs[0][1])
+                return converted
+            logger.warning(
+                f"LibreOffice failed on a batch of {len(jobs)} files, "
+                "converting them one at a time"
+            )
+            for job in jobs:
+                single = {"target": target, "jobs": [job], "stems": set()}
+                converted.update(
+                    _convert_batch(soffice, single, cache_dir, profile_dir, timeout)
+                )
+            return converted
+
+        for file_path, destination, _ in jobs:
+            stem = os.path.splitext(os.path.basename(file_path))[0]
+            output_path = os.path.join(output_dir, f"{stem}.{target}")
+            if not os.path.exists(output_path):
+                logger.error(f"LibreOffice did not convert {file_path}")
+                _mark_failed(destination)
+                continue
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            os.replace(output_path, destination)
+            converted[file_path] = destination
+    return converted
+
+
+def convert_files(
+    file_paths: List[str],
+    cache_dir: str = CONVERSION_CACHE_DIR,
+    batch_size: int = CONVERSION_BATCH_SIZE,
+    max_workers: int = CONVERSION_WORKERS,
+    timeout: float = CONVERSION_TIMEOUT,
+) -> Dict[str, str]:
+    """
+    Convert legacy .ppt, .doc and .rtf files to .pptx/.docx, reusing cached conversions.
+
+    Converted files are stored in ``cache_dir`` under the digest of the source content, so
+    source folders are never written to, unchanged files are not converted again when
+    they are re-indexed, and renamed or copied files share one conversion. Files that are
+    not cached are converted in batches of ``batch_size`` per LibreOffice process, with at
+    most ``max_workers`` processes running at the same time.
+
+    Files LibreOffice fails on are not retried until their content changes.
+
+    Parameters:
+    - file_paths (List[str]): Paths of the files to convert; other formats are ignored.
+    - cache_dir (str, optional): Directory of the conversion cache.
+    - batch_size (int, optional): Files converted per LibreOffice process.
+    - max_workers (int, optional): LibreOffice processes run at the same time.
+    - timeout (float, optional): Seconds allowed per file of a batch.
+
+    Returns:
+    - Dict[str, str]: Converted path of each file, without the files that failed.
+    """
+    cache_dir = os.path.abspath(cache_dir)
+    converted = {}
+    pending = {}  # destination -> job, so identical files are converted once
+    for file_path in file_paths:
+        if not is_legacy_format(file_path):
+            continue
+        try:
+            destination = cached_path(file_path, cache_dir)
+        except OSError as e:
+            logger.error(f"Cannot read {file_path}: {e}")
+            continue
+        if os.path.exists(destination):
+            converted[file_path] = destination
+        elif os.path.exists(destination + FAILED_SUFFIX):
+            logger.debug(f"Skipping {file_path}, which failed to convert before")
+        elif destination in pending:
+            pending[destination][1].append(file_path)
+        else:
+            target = LEGACY_FORMATS[os.path.splitext(file_path)[1].lower()]
+            pending[destination] = ((file_path, destination, target), [])
+    if not pending:
+        return converted
+
+    soffice = find_soffice()
+    if soffice is None:
+        logger.error("LibreOffice is not installed or not found in PATH.")
+        return converted
+
+    os.makedirs(cache_dir, exist_ok=True)
+    batches = _make_batches([job for job, _ in pending.values()], batch_size)
+    max_workers = max(1, min(max_workers, len(batches)))
+    logger.info(
+        f"Converting {len(pending)} files with LibreOffice in {len(batches)} batches..."
+    )
+
+    # Each worker keeps its LibreOffice profile across batches and runs
+    profiles = queue.Queue()
+    for slot in range(max_workers):
+        profiles.put(os.path.join(cache_dir, ".profiles", str(slot)))
+
+    def convert(batch):
+        profile_dir = profiles.get()
+        try:
+            return _convert_batch(soffice, batch, cache_dir, profile_dir, timeout)
+        finally:
+            profiles.put(profile_dir)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for result in executor.map(convert, batches):
+            converted.update(result)
+
+    for (file_path, destination, _), duplicates in pending.values():
+        if file_path in converted:
+            for duplicate in duplicates:
+                converted[duplicate] = destination
+    return converted
+
+
+def convert_file(
+    file_path: str, cache_dir: str = CONVERSION_CACHE_DIR
+) -> Optional[str]:
+    """Return the converted copy of a legacy file, converting it if it is not cached."""
+    return convert_files([file_path], cache_dir=cache_dir).get(file_path)
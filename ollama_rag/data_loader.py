@@ -2,61 +2,181 @@
 
 from llama_index.core import SimpleDirectoryReader
 import os
-from typing import List
+import csv
+import io
+import datetime
+from typing import Iterable, Iterator, List
 import logging
 from llama_index.core import Document
-import subprocess
-import shutil
+import time
+import signal
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from llama_index.core.readers.base import BaseReader
-from llama_index.readers.file.slides.base import PptxReader
-from llama_index.readers.file.tabular.base import (
-    CSVReader,
+from ollama_rag.converter import convert_file, convert_files, is_legacy_format
+from ollama_rag.configs import (
+    REQUIRED_EXTS,
+    NUM_WORKERS,
+    FILE_TIMEOUT,
+    TABLE_ROWS_PER_CHUNK,
+    TABLE_CHUNK_MAX_CHARS,
 )
-from ollama_rag.configs import REQUIRED_EXTS
-import logging
-import pandas as pd
 
 # Configure logging for this module
 logger = logging.getLogger(__name__)
 
 
-# Custom PPT Reader to handle PPT files by converting them to PPTX
-class PPTReader(BaseReader):
+# Custom reader for .ppt, .doc and .rtf files, read from their PPTX/DOCX conversion
+class LegacyFormatReader(BaseReader):
     def load_data(self, file: str, extra_info=None):
-        # Check if 'libreoffice' is available
-        if not shutil.which("libreoffice"):
-            logging.error("'libreoffice' is not installed or not found in PATH.")
-            return []
+        """
+        Read a legacy Office file through its cached LibreOffice conversion.
 
+        Parameters:
+        - file (str): Path to the .ppt, .doc or .rtf file.
+        - extra_info (dict, optional): Additional metadata.
+
+        Returns:
+        - List[Document]: Documents of the converted file, with the metadata of the
+          original one.
+        """
         try:
-            output_dir = os.path.dirname(file)
-            subprocess.run(
-                [
-                    "libreoffice",
-                    "--headless",
-                    "--convert-to",
-                    "pptx",
-                    "--outdir",
-                    output_dir,
-                    file,
-                ],
-                check=True,
-            )
-            converted_file_path = os.path.splitext(file)[0] + ".pptx"
-            if os.path.exists(converted_file_path):
-                logging.info(f"Converted {file} to {converted_file_path}")
-                # Now use the built-in PptxReader
-                pptx_reader = PptxReader()
-                return pptx_reader.load_data(converted_file_path, extra_info=extra_info)
-            else:
+            # Usually already converted in a batch by iter_load_files
+            converted_file_path = convert_file(str(file))
+            if converted_file_path is None:
                 logging.error(f"Conversion failed for {file}")
                 return []
+            if converted_file_path.endswith(".pptx"):
+                from llama_index.readers.file.slides.base import PptxReader
+
+                reader = PptxReader()
+            else:
+                from llama_index.readers.file.docs.base import DocxReader
+
+                reader = DocxReader()
+            metadata = {"file_name": os.path.basename(file)}
+            metadata.update(extra_info or {})
+            return reader.load_data(converted_file_path, extra_info=metadata)
         except Exception as e:
-            logging.error(f"Error converting {file} to PPTX: {e}")
+            logging.error(f"Error reading {file}: {e}")
             return []
 
 
+# Former name of LegacyFormatReader, from when it only read .ppt files
+PPTReader = LegacyFormatReader
+
+
+def _format_cell(value) -> str:
+    """Format a spreadsheet cell as text."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def iter_row_blocks(
+    rows: Iterable,
+    rows_per_chunk: int = TABLE_ROWS_PER_CHUNK,
+    max_chars: int = TABLE_CHUNK_MAX_CHARS,
+) -> Iterator[tuple]:
+    """
+    Group the rows of a table into CSV text blocks, each starting with the header row.
+
+    The first non-empty row is taken as the header. Blocks end after ``rows_per_chunk``
+    rows or once they reach ``max_chars`` characters, so rows are never split between
+    chunks. Empty rows are skipped.
+
+    Parameters:
+    - rows (Iterable): Rows of cell values, read lazily.
+    - rows_per_chunk (int, optional): Maximum number of rows per block.
+    - max_chars (int, optional): Size at which a block is closed.
+
+    Yields:
+    - tuple: (first_row, last_row, text), with rows numbered from 1 after the header.
+    """
+    header = None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    block_start = row_number = 0
+    for row in rows:
+        cells = [_format_cell(value) for value in row]
+        if not any(cells):
+            continue
+        if header is None:
+            writer.writerow(cells)
+            header = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            continue
+        row_number += 1
+        if not block_start:
+            block_start = row_number
+        writer.writerow(cells)
+        if row_number - block_start + 1 >= rows_per_chunk or buffer.tell() >= max_chars:
+            yield block_start, row_number, header + buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            block_start = 0
+    if block_start:
+        yield block_start, row_number, header + buffer.getvalue()
+    elif header is not None and not row_number:
+        # A table with only a header row
+        yield 0, 0, header
+
+
+def _table_documents(file, blocks, extra_info, sheet_name=None) -> Iterator[Document]:
+    """Turn the row blocks of a table into documents recording their row span."""
+    for row_start, row_end, text in blocks:
+        metadata = {
+            "file_name": os.path.basename(file),
+            "file_path": os.path.abspath(file),
+        }
+        if sheet_name is not None:
+            metadata["sheet_name"] = sheet_name
+        metadata.update(row_start=row_start, row_end=row_end)
+        metadata.update(extra_info or {})
+        yield Document(text=text, metadata=metadata)
+
+
 class CustomExcelReader(BaseReader):
+    """
+    Read Excel files sheet by sheet in blocks of rows.
+
+    .xlsx files are streamed with openpyxl in read-only mode, so a large sheet is never
+    held in memory as a whole. Each document holds up to TABLE_ROWS_PER_CHUNK rows under
+    the sheet's header row, with the sheet name and row span in its metadata.
+    """
+
+    def lazy_load_data(self, file: str, extra_info=None) -> Iterator[Document]:
+        if str(file).lower().endswith(".xls"):
+            # openpyxl cannot read the legacy format; pandas loads one sheet at a time
+            import pandas as pd
+
+            excel_file = pd.ExcelFile(file)
+            for sheet_name in excel_file.sheet_names:
+                df = pd.read_excel(excel_file, sheet_name=sheet_name, header=None)
+                rows = df.itertuples(index=False, name=None)
+                yield from _table_documents(
+                    file, iter_row_blocks(rows), extra_info, sheet_name
+                )
+            return
+
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                rows = sheet.iter_rows(values_only=True)
+                yield from _table_documents(
+                    file, iter_row_blocks(rows), extra_info, sheet.title
+                )
+        finally:
+            workbook.close()
+
     def load_data(self, file: str, extra_info=None) -> List[Document]:
         """
         Read an Excel file and return documents, including sheet_name in metadata.
@@ -66,45 +186,66 @@ class CustomExcelReader(BaseReader):
         - extra_info (dict, optional): Additional metadata.
 
         Returns:
-        - List[Document]: Documents created from the Excel file.
+        - List[Document]: One document per block of rows of each sheet.
         """
-        if extra_info is None:
-            extra_info = {}
-
         try:
-            # Read the Excel file
-            excel_file = pd.ExcelFile(file)
-            documents = []
+            return list(self.lazy_load_data(file, extra_info=extra_info))
+        except Exception as e:
+            logger.error(f"Error reading Excel file {file}: {e}")
+            return []
 
-            for sheet_name in excel_file.sheet_names:
-                # Read each sheet into a DataFrame
-                df = pd.read_excel(excel_file, sheet_name=sheet_name)
 
-                # Convert DataFrame to CSV format (or any preferred text format)
-                text = df.to_csv(index=False)
+class CustomCSVReader(BaseReader):
+    """Read CSV files in blocks of rows, like CustomExcelReader reads sheets."""
 
-                # Create metadata including sheet_name
-                metadata = {
-                    "file_name": os.path.basename(file),
-                    "file_path": os.path.abspath(file),
-                    "sheet_name": sheet_name,
-                }
-                # Merge with extra_info if provided
-                metadata.update(extra_info)
+    def lazy_load_data(self, file: str, extra_info=None) -> Iterator[Document]:
+        with open(file, newline="", encoding="utf-8", errors="replace") as f:
+            yield from _table_documents(
+                file, iter_row_blocks(csv.reader(f)), extra_info
+            )
 
-                # Create Document with text and metadata
-                doc = Document(text=text, metadata=metadata)
-                documents.append(doc)
+    def load_data(self, file: str, extra_info=None) -> List[Document]:
+        """
+        Read a CSV file and return one document per block of rows.
 
-            return documents
+        Parameters:
+        - file (str): Path to the CSV file.
+        - extra_info (dict, optional): Additional metadata.
 
+        Returns:
+        - List[Document]: Documents created from the CSV file.
+        """
+        try:
+            return list(self.lazy_load_data(file, extra_info=extra_info))
         except Exception as e:
-            logger.error(f"Error reading Excel file {file}: {e}")
+            logger.error(f"Error reading CSV file {file}: {e}")
             return []
 
 
+# Name the CSV reader was imported under before CustomCSVReader replaced it
+CSVReader = CustomCSVReader
+
+
+def get_file_extractor():
+    """Return the mapping of file extensions to custom readers."""
+    # Define custom file extractors for unsupported or special file types
+    return {
+        ".ppt": LegacyFormatReader(),  # Custom reader for .ppt files
+        ".doc": LegacyFormatReader(),  # Custom reader for .doc files
+        ".rtf": LegacyFormatReader(),  # Custom reader for .rtf files
+        ".xls": CustomExcelReader(),  # Custom reader for .xls files
+        ".xlsx": CustomExcelReader(),  # Custom reader for .xlsx files
+        ".csv": CustomCSVReader(),  # Custom reader for .csv files
+        # Add other custom readers here if needed
+    }
+
+
 def load_data(
-    input_dirs: List[str], required_exts: List[str] = None, recursive: bool = True
+    input_dirs: List[str],
+    required_exts: List[str] = None,
+    recursive: bool = True,
+    num_workers: int = NUM_WORKERS,
+    timeout: float = FILE_TIMEOUT,
 ) -> List[Document]:
     """
     Load data from the specified list of input directories with detailed metadata using SimpleDirectoryReader.
@@ -113,6 +254,8 @@ def load_data(
     - input_dirs (List[str]): A list of directory paths to load files from.
     - required_exts (List[str], optional): A list of file extensions to include. Defaults to common extensions.
     - recursive (bool, optional): Whether to include files from subdirectories. Defaults to True.
+    - num_workers (int, optional): Number of parsing processes. Defaults to NUM_WORKERS.
+    - timeout (float, optional): Seconds allowed to parse a single file. Defaults to FILE_TIMEOUT.
 
     Returns:
     - List[Document]: A list of Document objects containing text and metadata.
@@ -121,15 +264,6 @@ def load_data(
         # Default to common file extensions
         required_exts = REQUIRED_EXTS
 
-    # Define custom file extractors for unsupported or special file types
-    file_extractor = {
-        ".ppt": PPTReader(),  # Custom reader for .ppt files
-        ".xls": CustomExcelReader(),  # Built-in reader for .xls files
-        ".xlsx": CustomExcelReader(),  # Built-in reader for .xlsx files
-        ".csv": CSVReader(),  # Built-in reader for .csv files
-        # Add other custom readers here if needed
-    }
-
     all_documents = []
 
     for input_dir in input_dirs:
@@ -146,11 +280,13 @@ def load_data(
             reader = SimpleDirectoryReader(
                 input_dir=input_dir,
                 recursive=recursive,
-                file_extractor=file_extractor,
                 required_exts=required_exts,
             )
+            file_paths = [str(file_path) for file_path in reader.input_files]
 
-            documents = reader.load_data()
+            documents = list(
+                iter_load_files(file_paths, num_workers=num_workers, timeout=timeout)
+            )
             if not documents:
                 logger.warning(f"No documents found in '{input_dir}'. Skipping...")
                 continue
@@ -164,6 +300,182 @@ def load_data(
     return all_documents
 
 
+def _load_file(file_path: str) -> List[Document]:
+    """Parse a single file with the custom readers; runs inside the worker processes."""
+    reader = SimpleDirectoryReader(
+        input_files=[file_path],
+        file_extractor=get_file_extractor(),
+        filename_as_id=True,
+    )
+    return reader.load_data()
+
+
+def _report_pid(worker_pids):
+    """Pool initializer sending the worker's process id back to the parent."""
+    worker_pids.put(os.getpid())
+
+
+def _start_pool(num_workers):
+    """Start a process pool whose workers report their process ids to a queue."""
+    worker_pids = multiprocessing.SimpleQueue()
+    executor = ProcessPoolExecutor(
+        max_workers=num_workers, initializer=_report_pid, initargs=(worker_pids,)
+    )
+    return executor, worker_pids
+
+
+def _stop_pool(executor, worker_pids, kill=True):
+    """
+    Shut down a process pool, killing workers that may be stuck on a file.
+
+    Without ``kill``, waits for the workers to exit instead, for pools with no running
+    tasks.
+    """
+    if not kill:
+        executor.shutdown(wait=True)
+        return
+    executor.shutdown(wait=False, cancel_futures=True)
+    # ProcessPoolExecutor cannot cancel running tasks, so terminate its processes.
+    # Workers report their id before taking a task, so every busy worker is known.
+    while not worker_pids.empty():
+        pid = worker_pids.get()
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass  # The worker has already exited
+
+
+def _parse_in_pool(file_paths, num_workers, timeout):
+    """
+    Parse files in a process pool, yielding documents as each file finishes.
+
+    Returns the files that were in flight when a worker crashed, since the pool cannot
+    tell which one caused it.
+    """
+    pending = list(reversed(file_paths))
+    in_flight = {}
+    crashed = []
+    executor, worker_pids = _start_pool(num_workers)
+
+    try:
+        while pending or in_flight:
+            # Keep one file per worker so submission time approximates start time
+            while pending and len(in_flight) < num_workers:
+                file_path = pending.pop()
+                future = executor.submit(_load_file, file_path)
+                in_flight[future] = (file_path, time.monotonic() + timeout)
+
+            next_deadline = min(deadline for _, deadline in in_flight.values())
+            done, _ = wait(
+                in_flight,
+                timeout=max(0.0, next_deadline - time.monotonic()),
+                return_when=FIRST_COMPLETED,
+            )
+
+            broken = False
+            for future in done:
+                file_path, _ = in_flight.pop(future)
+                try:
+                    yield from future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    crashed.append(file_path)
+                except Exception as e:
+                    logger.error(f"Failed to load '{file_path}': {e}")
+
+            timed_out = False
+            now = time.monotonic()
+            for future, (file_path, deadline) in list(in_flight.items()):
+                if not future.done() and deadline <= now:
+                    logger.error(f"Timed out after {timeout}s parsing '{file_path}'")
+                    del in_flight[future]
+                    timed_out = True
+
+            if broken or timed_out:
+                # Every file still running in a broken pool is a crash suspect
+                remaining = [file_path for file_path, _ in in_flight.values()]
+                if broken:
+                    crashed.extend(remaining)
+                else:
+                    pending.extend(remaining)
+                in_flight.clear()
+                _stop_pool(executor, worker_pids)
+                executor, worker_pids = _start_pool(num_workers)
+    finally:
+        _stop_pool(executor, worker_pids, kill=bool(in_flight))
+
+    return crashed
+
+
+def iter_load_files(
+    file_paths: List[str],
+    num_workers: int = NUM_WORKERS,
+    timeout: float = FILE_TIMEOUT,
+) -> Iterator[Document]:
+    """
+    Parse files in a pool of worker processes and yield documents as each file finishes.
+
+    At most ``num_workers`` files are in flight, so memory stays bounded by the pool size.
+    A file that takes longer than ``timeout`` seconds is abandoned and its worker killed.
+    If a worker crashes, the files that were in flight are re-parsed one at a time in a
+    fresh process, so only the file that actually crashes is skipped. Legacy .ppt, .doc
+    and .rtf files are first converted together, in batches, by convert_files.
+
+    Parameters:
+    - file_paths (List[str]): Paths of the files to parse.
+    - num_workers (int, optional): Number of parsing processes. With 1 or fewer, files are
+      parsed in the calling process without timeouts. Defaults to NUM_WORKERS.
+    - timeout (float, optional): Seconds allowed to parse a single file. Defaults to FILE_TIMEOUT.
+
+    Yields:
+    - Document: Documents with stable path-derived ids, in completion order.
+    """
+    file_paths = [path for path in file_paths if os.path.isfile(path)]
+    legacy_files = [path for path in file_paths if is_legacy_format(path)]
+    if legacy_files:
+        convert_files(legacy_files)
+
+    if num_workers is None or num_workers <= 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            try:
+                yield from _load_file(file_path)
+            except Exception as e:
+                logger.error(f"Failed to load '{file_path}': {e}")
+        return
+
+    suspects = yield from _parse_in_pool(file_paths, num_workers, timeout)
+    for file_path in suspects:
+        if (yield from _parse_in_pool([file_path], 1, timeout)):
+            logger.error(f"Worker crashed while parsing '{file_path}'. Skipping...")
+
+
+def load_files(
+    file_paths: List[str],
+    num_workers: int = NUM_WORKERS,
+    timeout: float = FILE_TIMEOUT,
+) -> List[Document]:
+    """
+    Load only the given files, giving every document a stable id derived from its path.
+
+    Document ids are ``<file_path>`` or ``<file_path>_part_<n>`` (for readers that split
+    a file into several documents), so re-loading a file yields the same ids and the
+    index can replace its previous version instead of adding duplicates.
+
+    Parameters:
+    - file_paths (List[str]): Paths of the files to load.
+    - num_workers (int, optional): Number of parsing processes. Defaults to NUM_WORKERS.
+    - timeout (float, optional): Seconds allowed to parse a single file. Defaults to FILE_TIMEOUT.
+
+    Returns:
+    - List[Document]: A list of Document objects containing text and metadata.
+    """
+    documents = list(
+        iter_load_files(file_paths, num_workers=num_workers, timeout=timeout)
+    )
+    logger.info(f"Loaded {len(documents)} documents from {len(file_paths)} files")
+    return documents
+
+
 def get_all_files(input_dirs, required_exts, recursive):
     """Get all files from the list of input directories."""
     all_files = []
@@ -2,42 +2,360 @@
 
 import os
 import json
+import hashlib
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+HASH_CHUNK_SIZE = 1024 * 1024  # Read files in 1 MiB chunks when hashing
+LEGACY_SIZE = -1  # Size recorded for entries imported from indexed_files.json
+# Legacy entries stored a float mtime, which is only precise to a few hundred ns
+LEGACY_MTIME_TOLERANCE_NS = 1000
+
+
+def _manifest_entry(entry):
+    """Return an indexed files entry in the manifest format, converting legacy ones."""
+    if isinstance(entry, dict) and "mtime_ns" in entry:
+        return entry
+    if not isinstance(entry, dict):
+        entry = {"mtime": entry, "hash": None}
+    return {
+        "size": LEGACY_SIZE,
+        "mtime_ns": int(entry["mtime"] * 1e9),
+        "hash": entry.get("hash"),
+    }
 
 
 def load_indexed_files(indexed_files_path):
-    """Load indexed files metadata from disk."""
-    if os.path.exists(indexed_files_path):
-        with open(indexed_files_path, "r") as f:
-            return json.load(f)
-    else:
+    """
+    Load legacy indexed files metadata from an indexed_files.json file.
+
+    Entries are returned in the manifest format. Older files stored only a modification
+    time, so their size is unknown (LEGACY_SIZE) and their hash is None. The first diff
+    treats a legacy entry whose mtime still matches the file as unchanged, and records
+    the file's size and hash without re-indexing it.
+    """
+    if not os.path.exists(indexed_files_path):
         return {}
+    with open(indexed_files_path, "r") as f:
+        indexed_files = json.load(f)
+    return {
+        file_path: _manifest_entry(entry) for file_path, entry in indexed_files.items()
+    }
 
 
 def save_indexed_files(indexed_files, indexed_files_path):
-    """Save indexed files metadata to disk."""
+    """Save indexed files metadata to disk. Deprecated: use IndexManifest instead."""
+    warnings.warn(
+        "save_indexed_files is deprecated; the index is tracked by IndexManifest",
+        DeprecationWarning,
+        stacklevel=2,
+    )
     with open(indexed_files_path, "w") as f:
         json.dump(indexed_files, f)
 
 
+def update_indexed_files(indexed_files, files):
+    """
+    Update indexed files metadata with new modification times. Deprecated: use
+    IndexManifest.upsert_files instead.
+    """
+    warnings.warn(
+        "update_indexed_files is deprecated; use IndexManifest.upsert_files",
+        DeprecationWarning,
+        stacklevel=2,
+    )
+    for file_path in files:
+        indexed_files[file_path] = os.path.getmtime(file_path)
+
+
+def compute_file_hash(file_path):
+    """Compute the SHA-256 hash of a file's content."""
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _normalize_exts(required_exts):
+    """Return the set of lower-case extensions, each starting with a dot."""
+    return {
+        ext.lower() if ext.startswith(".") else "." + ext.lower()
+        for ext in required_exts
+    }
+
+
+def _scan_tree(input_dir, exts, recursive, snapshot, new_snapshot, prune):
+    """Scan one input directory with os.scandir, returning {file_path: (size, mtime_ns)}."""
+    files = {}
+    stack = [input_dir]
+    while stack:
+        dir_path = stack.pop()
+        try:
+            dir_mtime_ns = os.stat(dir_path).st_mtime_ns
+        except OSError:
+            continue
+
+        cached = snapshot.get(dir_path)
+        if prune and cached is not None and cached["mtime_ns"] == dir_mtime_ns:
+            # No entries were added, removed or renamed here; reuse the last listing
+            new_snapshot[dir_path] = cached
+            dir_files, subdirs = cached["files"], cached["dirs"]
+        else:
+            dir_files, subdirs = {}, []
+            try:
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir():
+                                # Like os.walk, do not descend into symlinked directories
+                                if not entry.is_symlink():
+                                    subdirs.append(entry.name)
+                            elif os.path.splitext(entry.name)[1].lower() in exts:
+                                stat = entry.stat()
+                                dir_files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+                        except OSError:
+                            # The entry disappeared between listing and stat
+                            continue
+            except OSError:
+                continue
+            new_snapshot[dir_path] = {
+                "mtime_ns": dir_mtime_ns,
+                "files": dir_files,
+                "dirs": subdirs,
+            }
+
+        for name, stat in dir_files.items():
+            files[os.path.join(dir_path, name)] = tuple(stat)
+        if recursive:
+            stack.extend(os.path.join(dir_path, name) for name in subdirs)
+    return files
+
+
+def scan_files(
+    input_dirs,
+    required_exts,
+    recursive,
+    snapshot=None,
+    prune_unchanged_dirs=False,
+    num_workers=1,
+):
+    """
+    Return a mapping of every matching file path to its (size, mtime_ns).
+
+    Directories are listed with os.scandir, so file type checks come from the directory
+    entries and each file is stat'ed once.
+
+    Parameters:
+    - input_dirs (List[str]): Directories to scan.
+    - required_exts (List[str]): File extensions to include.
+    - recursive (bool): Whether to include files from subdirectories.
+    - snapshot (dict, optional): Directory listings from the previous scan. It is
+      replaced in place with the listings of this scan.
+    - prune_unchanged_dirs (bool, optional): Reuse the snapshot listing of directories
+      whose mtime has not changed instead of listing and stat'ing their files again.
+      Editors that save through a rename update the directory mtime, but in-place writes
+      do not, so such edits are missed until the directory changes. Defaults to False.
+    - num_workers (int, optional): Number of input directories scanned concurrently.
+      Defaults to 1.
+
+    Returns:
+    - dict: File paths mapped to (size, mtime_ns) tuples.
+    """
+    exts = _normalize_exts(required_exts)
+    old_snapshot = snapshot if snapshot is not None else {}
+    new_snapshot = {}
+
+    def scan(input_dir):
+        return _scan_tree(
+            input_dir,
+            exts,
+            recursive,
+            old_snapshot,
+            new_snapshot,
+            prune_unchanged_dirs,
+        )
+
+    files = {}
+    if num_workers > 1 and len(input_dirs) > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            for dir_files in executor.map(scan, input_dirs):
+                files.update(dir_files)
+    else:
+        for input_dir in input_dirs:
+            files.update(scan(input_dir))
+
+    if snapshot is not None:
+        snapshot.clear()
+        snapshot.update(new_snapshot)
+    return files
+
+
+def _in_input_dirs(path, input_dirs, recursive):
+    """Whether a path is one of the input directories or may hold their files."""
+    for input_dir in input_dirs:
+        input_dir = input_dir.rstrip(os.sep)
+        if path.rstrip(os.sep) == input_dir:
+            return True
+        if path.startswith(input_dir + os.sep):
+            return recursive or os.path.dirname(path) == input_dir
+    return False
+
+
+def scan_paths(paths, input_dirs, required_exts, recursive):
+    """
+    Return a mapping of the matching files at or under the given paths to their
+    (size, mtime_ns), like scan_files but only for the paths that changed.
+
+    Paths may be files or directories, and are expected in the form they are found in
+    when scanning input_dirs. Paths outside the input directories are ignored.
+    """
+    exts = _normalize_exts(required_exts)
+    files = {}
+    for path in paths:
+        if not _in_input_dirs(path, input_dirs, recursive):
+            continue
+        if os.path.isdir(path):
+            files.update(_scan_tree(path, exts, recursive, {}, {}, False))
+        elif os.path.splitext(path)[1].lower() in exts:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files[path] = (stat.st_size, stat.st_mtime_ns)
+    return {
+        path: stat
+        for path, stat in files.items()
+        if _in_input_dirs(path, input_dirs, recursive)
+    }
+
+
+def _is_changed(entry, stat):
+    """Whether a file's (size, mtime_ns) differs from its manifest entry."""
+    return entry["size"] != stat[0] or entry["mtime_ns"] != stat[1]
+
+
+def _is_legacy_unchanged(entry, stat):
+    """Whether an entry imported from indexed_files.json still matches the file."""
+    return (
+        entry["size"] == LEGACY_SIZE
+        and abs(entry["mtime_ns"] - stat[1]) <= LEGACY_MTIME_TOLERANCE_NS
+    )
+
+
 def get_new_or_updated_files(input_dirs, required_exts, recursive, indexed_files):
-    """Get a list of new or updated files to index from multiple directories."""
+    """
+    Get a list of new or updated files to index from multiple directories.
+
+    ``indexed_files`` holds manifest entries as returned by IndexManifest.load_files, or
+    modification times as in the legacy indexed_files.json.
+    """
     new_or_updated_files = []
-    for input_dir in input_dirs:
-        for root, dirs, files in os.walk(input_dir):
-            for file in files:
-                if any(file.lower().endswith(ext) for ext in required_exts):
-                    file_path = os.path.join(root, file)
-                    mtime = os.path.getmtime(file_path)
-                    stored_mtime = indexed_files.get(file_path)
-                    if stored_mtime is None or mtime > stored_mtime:
-                        new_or_updated_files.append(file_path)
-            if not recursive:
-                break
+    for file_path, stat in scan_files(input_dirs, required_exts, recursive).items():
+        entry = indexed_files.get(file_path)
+        if entry is not None:
+            entry = _manifest_entry(entry)
+        if entry is None or (
+            _is_changed(entry, stat) and not _is_legacy_unchanged(entry, stat)
+        ):
+            new_or_updated_files.append(file_path)
     return new_or_updated_files
 
 
-def update_indexed_files(indexed_files, files):
-    """Update indexed files metadata with new modification times."""
-    for file_path in files:
-        mtime = os.path.getmtime(file_path)
-        indexed_files[file_path] = mtime
+def diff_indexed_files(
+    input_dirs,
+    required_exts,
+    recursive,
+    indexed_files,
+    snapshot=None,
+    prune_unchanged_dirs=False,
+    num_workers=1,
+    paths=None,
+):
+    """
+    Compare the files on disk against the indexed files metadata.
+
+    Files whose size or modification time changed are hashed; if the content is unchanged
+    they are reported as ``touched`` rather than ``modified``. So are files imported
+    from a legacy indexed_files.json whose mtime has not changed since they were
+    indexed, which only recorded an mtime. A new file whose content
+    hash matches a file that disappeared is reported as a rename instead of an add and a
+    delete.
+
+    Parameters:
+    - input_dirs (List[str]): Directories to scan.
+    - required_exts (List[str]): File extensions to include.
+    - recursive (bool): Whether to include files from subdirectories.
+    - indexed_files (dict): Manifest entries keyed by path, as returned by
+      IndexManifest.load_files.
+    - snapshot, prune_unchanged_dirs, num_workers: Passed on to scan_files.
+    - paths (List[str], optional): Only compare these files and directories, e.g. the
+      paths reported by a file watcher, instead of scanning every input directory.
+      indexed_files should then only hold the entries at or under them.
+
+    Returns:
+    - dict: Lists of ``added``, ``modified``, ``touched`` and ``deleted`` paths, a list of
+      ``renamed`` (old_path, new_path) pairs, the content ``hashes`` computed while
+      diffing and the scanned ``stats`` as (size, mtime_ns), both keyed by path.
+    """
+    if paths is None:
+        current_files = scan_files(
+            input_dirs,
+            required_exts,
+            recursive,
+            snapshot=snapshot,
+            prune_unchanged_dirs=prune_unchanged_dirs,
+            num_workers=num_workers,
+        )
+    else:
+        current_files = scan_paths(paths, input_dirs, required_exts, recursive)
+    new_files, modified, touched = [], [], []
+    hashes = {}
+
+    for file_path, stat in current_files.items():
+        entry = indexed_files.get(file_path)
+        if entry is None:
+            new_files.append(file_path)
+        elif _is_changed(entry, stat):
+            try:
+                hashes[file_path] = compute_file_hash(file_path)
+            except OSError:
+                continue
+            if (
+                entry["hash"] is not None and entry["hash"] == hashes[file_path]
+            ) or _is_legacy_unchanged(entry, stat):
+                touched.append(file_path)
+            else:
+                modified.append(file_path)
+
+    deleted = {path for path in indexed_files if path not in current_files}
+
+    # Detect renames by matching the content of new files against deleted ones
+    deleted_by_hash = {}
+    for file_path in deleted:
+        file_hash = indexed_files[file_path]["hash"]
+        if file_hash is not None:
+            deleted_by_hash.setdefault(file_hash, file_path)
+
+    added, renamed = [], []
+    for file_path in new_files:
+        try:
+            hashes[file_path] = compute_file_hash(file_path)
+        except OSError:
+            continue
+        old_path = deleted_by_hash.pop(hashes[file_path], None)
+        if old_path is not None:
+            deleted.discard(old_path)
+            renamed.append((old_path, file_path))
+        else:
+            added.append(file_path)
+
+    return {
+        "added": added,
+        "modified": modified,
+        "touched": touched,
+        "deleted": sorted(deleted),
+        "renamed": renamed,
+        "hashes": hashes,
+        "stats": current_files,
+    }
@@ -0,0 +1,285 @@
+# embedding_cache.py
+
+import os
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from ollama_rag.configs import EMBEDDING_CACHE_MAX_BYTES, EMBEDDING_CACHE_DTYPE
+
+GROW_ROWS = 4096  # Rows added to the vectors file each time it needs to grow
+EVICT_FRACTION = 0.1  # Fraction of the cache freed when it is full
+SQLITE_MAX_PARAMS = 500  # Keys per SELECT ... IN (...) lookup
+
+logger = logging.getLogger(__name__)
+
+
+def text_key(text: str) -> bytes:
+    """Return the cache key of a chunk of text."""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Persistent on-disk cache of embeddings for one embedding model.
+
+    Vectors are stored as fixed-size rows of a memory-mapped array file, and a SQLite
+    table maps each text hash to its row and last access time. When the vectors file
+    reaches ``max_bytes`` the least recently used rows are evicted and reused, so the
+    cache never grows beyond its size budget.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        model_name: str,
+        max_bytes: int = EMBEDDING_CACHE_MAX_BYTES,
+        dtype: str = EMBEDDING_CACHE_DTYPE,
+    ):
+        model_key = hashlib.sha1(model_name.encode("utf-8")).hexdigest()[:16]
+        self.model_dir = os.path.join(cache_dir, model_key)
+        os.makedirs(self.model_dir, exist_ok=True)
+
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype)
+        self._vectors_path = os.path.join(self.model_dir, "vectors.bin")
+        self._vectors = None
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(
+            os.path.join(self.model_dir, "index.sqlite"), check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key BLOB PRIMARY KEY,
+                row INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS free_rows (row INTEGER PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+            """)
+        self._conn.commit()
+
+        meta = dict(self._conn.execute("SELECT name, value FROM meta").fetchall())
+        if meta.get("dtype", self.dtype.name) != self.dtype.name:
+            # The cache was written with another precision; start over
+            logger.warning(f"Embedding cache dtype changed, clearing {self.model_dir}")
+            self.clear()
+            meta = {}
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+        self.num_rows = int(meta.get("num_rows", 0))
+
+    @property
+    def capacity(self) -> int:
+        """Maximum number of embeddings the cache holds."""
+        return max(1, self.max_bytes // (self.dim * self.dtype.itemsize))
+
+    def _open_vectors(self, min_rows: int):
+        """Memory-map the vectors file, growing it to hold at least min_rows rows."""
+        if self._vectors is not None and self._vectors.shape[0] >= min_rows:
+            return self._vectors
+        file_rows = 0
+        if os.path.exists(self._vectors_path):
+            file_rows = os.path.getsize(self._vectors_path) // (
+                self.dim * self.dtype.itemsize
+            )
+        rows = max(file_rows, min_rows)
+        if rows > file_rows:
+            rows = min(max(rows, file_rows + GROW_ROWS), self.capacity)
+        mode = "r+" if os.path.exists(self._vectors_path) else "w+"
+        self._vectors = np.memmap(
+            self._vectors_path, dtype=self.dtype, mode=mode, shape=(rows, self.dim)
+        )
+        return self._vectors
+
+    def _lookup_rows(self, keys: List[bytes]) -> Dict[bytes, int]:
+        """Return the vector rows of the given keys that are in the cache."""
+        rows = {}
+        for start in range(0, len(keys), SQLITE_MAX_PARAMS):
+            chunk = keys[start : start + SQLITE_MAX_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            rows.update(
+                self._conn.execute(
+                    f"SELECT key, row FROM entries WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+            )
+        return rows
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        """Return the cached embeddings for the given keys, skipping misses."""
+        if self.dim is None or not keys:
+            return {}
+        with self._lock:
+            rows = self._lookup_rows(list(set(keys)))
+            if not rows:
+                return {}
+
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE entries SET last_used = ? WHERE key = ?",
+                [(now, key) for key in rows],
+            )
+            self._conn.commit()
+
+            vectors = self._open_vectors(self.num_rows)
+            return {
+                key: vectors[row].astype(np.float32).tolist()
+                for key, row in rows.items()
+            }
+
+    def put_many(self, keys: List[bytes], embeddings: List[List[float]]):
+        """Store embeddings for the given keys, evicting old entries if the cache is full."""
+        if not keys:
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = len(embeddings[0])
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                    [
+                        ("dim", str(self.dim)),
+                        ("dtype", self.dtype.name),
+                        ("model_name", self.model_name),
+                    ],
+                )
+
+            new_items = dict(zip(keys, embeddings))
+            for key in self._lookup_rows(list(new_items)):
+                del new_items[key]
+            # A batch larger than the whole cache only keeps what fits
+            new_items = dict(list(new_items.items())[: self.capacity])
+            if not new_items:
+                self._conn.commit()
+                return
+
+            rows = self._allocate_rows(len(new_items))
+            vectors = self._open_vectors(self.num_rows)
+            for row, embedding in zip(rows, new_items.values()):
+                vectors[row] = np.asarray(embedding, dtype=self.dtype)
+            vectors.flush()
+
+            now = time.time()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, row, last_used) VALUES (?, ?, ?)",
+                [(key, row, now) for key, row in zip(new_items, rows)],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES ('num_rows', ?)",
+                (str(self.num_rows),),
+            )
+            self._conn.commit()
+
+    def _allocate_rows(self, count: int) -> List[int]:
+        """Return count free rows, taking unused rows first and evicting if needed."""
+        rows = [
+            row
+            for (row,) in self._conn.execute(
+                "SELECT row FROM free_rows LIMIT ?", (count,)
+            ).fetchall()
+        ]
+        self._conn.executemany(
+            "DELETE FROM free_rows WHERE row = ?", [(row,) for row in rows]
+        )
+
+        while len(rows) < count and self.num_rows < self.capacity:
+            rows.append(self.num_rows)
+            self.num_rows += 1
+
+        if len(rows) < count:
+            # Evict the least recently used entries and reuse their rows
+            num_evict = max(count - len(rows), int(self.capacity * EVICT_FRACTION))
+            evicted = self._conn.execute(
+                "SELECT key, row FROM entries ORDER BY last_used LIMIT ?",
+                (num_evict,),
+            ).fetchall()
+            self._conn.executemany(
+                "DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted]
+            )
+            evicted_rows = [row for _, row in evicted]
+            needed = count - len(rows)
+            rows.extend(evicted_rows[:needed])
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO free_rows (row) VALUES (?)",
+                [(row,) for row in evicted_rows[needed:]],
+            )
+            logger.info(f"Evicted {len(evicted)} embeddings from the cache")
+
+        return rows
+
+    def clear(self):
+        """Remove every cached embedding."""
+        self._vectors = None
+        if os.path.exists(self._vectors_path):
+            os.remove(self._vectors_path)
+        self._conn.executescript(
+            "DELETE FROM entries; DELETE FROM free_rows; DELETE FROM meta;"
+        )
+        self._conn.commit()
+        self.dim = None
+        self.num_rows = 0
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embedding model wrapper that serves unchanged chunk texts from an EmbeddingCache."""
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, cache: EmbeddingCache, **kwargs):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        return self._embed_model
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed_model.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self._embed_model.aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_key(text) for text in texts]
+        cached = self._cache.get_many(keys)
+
+        # Embed each missing text once, even if it repeats within the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        if missing:
+            new_embeddings = self._embed_model._get_text_embeddings(
+                list(missing.values())
+            )
+            self._cache.put_many(list(missing), new_embeddings)
+            cached.update(zip(missing, new_embeddings))
+
+        return [cached[key] for key in keys]
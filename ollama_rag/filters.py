@@ -0,0 +1,109 @@
+# filters.py
+
+import os
+from datetime import date, datetime
+
+from llama_index.core.vector_stores import (
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+)
+
+FILTER_KEYS = ("path_prefix", "extensions", "modified_after", "sheet_name")
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
+
+
+def _to_timestamp_ns(value):
+    """Convert a datetime, date, ISO 8601 string or epoch seconds to nanoseconds."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if isinstance(value, datetime):
+        value = value.timestamp()
+    return int(value * 1_000_000_000)
+
+
+def _path_variants(path):
+    """Return the ways a path may have been recorded: as given, absolute and relative."""
+    variants = {path, os.path.abspath(path)}
+    try:
+        variants.add(os.path.relpath(path))
+    except ValueError:
+        # A path on another drive has no relative form
+        pass
+    return sorted(variants)
+
+
+def build_metadata_filters(filters, manifest):
+    """
+    Turn query filters into metadata filters that the vector store applies in its search.
+
+    Path, extension and modification time filters are resolved against the manifest into
+    the list of matching files, which becomes a ``file_path`` IN filter. Sheet names are
+    matched on the ``sheet_name`` metadata of Excel chunks.
+
+    Parameters:
+    - filters (dict): Any of ``path_prefix`` (folder or file, or a list of them),
+      ``extensions`` (e.g. ".pdf" or [".xlsx", ".csv"]), ``modified_after`` (datetime,
+      date, ISO 8601 string or epoch seconds) and ``sheet_name`` (name or list of names).
+    - manifest (IndexManifest): The manifest of indexed files.
+
+    Returns:
+    - tuple: The MetadataFilters, or None if no filter is given, and the list of matching
+      file paths, or None if no file filter is given.
+    """
+    if not filters:
+        return None, None
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(
+            f"Unknown filters: {', '.join(sorted(unknown))}. "
+            f"Supported filters are: {', '.join(FILTER_KEYS)}."
+        )
+
+    metadata_filters = []
+    file_paths = None
+    path_prefixes = [
+        variant
+        for prefix in _as_list(filters.get("path_prefix"))
+        for variant in _path_variants(prefix)
+    ]
+    extensions = [
+        "." + ext.lower().lstrip(".") for ext in _as_list(filters.get("extensions"))
+    ]
+    modified_after = filters.get("modified_after")
+    if path_prefixes or extensions or modified_after is not None:
+        file_paths = manifest.find_files(
+            path_prefixes=path_prefixes,
+            extensions=extensions,
+            modified_after_ns=(
+                None if modified_after is None else _to_timestamp_ns(modified_after)
+            ),
+        )
+        # Chunks of deduplicated files are attributed to one of their copies
+        file_paths = manifest.with_copies(file_paths)
+        metadata_filters.append(
+            MetadataFilter(
+                key="file_path", value=file_paths, operator=FilterOperator.IN
+            )
+        )
+
+    sheet_names = [str(name) for name in _as_list(filters.get("sheet_name"))]
+    if sheet_names:
+        metadata_filters.append(
+            MetadataFilter(
+                key="sheet_name", value=sheet_names, operator=FilterOperator.IN
+            )
+        )
+
+    if not metadata_filters:
+        return None, None
+    return MetadataFilters(filters=metadata_filters), file_paths
@@ -1,31 +1,206 @@
 # indexer.py
 
-from llama_index.core import VectorStoreIndex, StorageContext, load_index_from_storage
+from llama_index.core import (
+    VectorStoreIndex,
+    StorageContext,
+    Settings,
+    load_index_from_storage,
+)
+from llama_index.core.ingestion import run_transformations
 import os
-import chromadb
-from llama_index.vector_stores.chroma import ChromaVectorStore
+import json
+import time
+import hashlib
+import itertools
+from ollama_rag.configs import (
+    INSERT_BATCH_SIZE,
+    PERSIST_DOCSTORE,
+    DOCSTORE_CHECKPOINT_INTERVAL,
+    DEDUPLICATE,
+    HNSW_M,
+    HNSW_CONSTRUCTION_EF,
+    HNSW_SEARCH_EF,
+)
+from ollama_rag.shards import ShardedCollection, warn_on_hnsw_mismatch
 import logging
 
 INDEX_SAVE_PATH = "index.json"  # Path to save the index
+SOURCE_PATHS_KEY = "source_paths"  # JSON list of the files a chunk was found in
+CONTENT_HASH_KEY = "content_hash"  # Hash of a chunk's content, used for deduplication
+# Metadata describing the file a chunk was read from rather than the chunk itself
+FILE_METADATA_KEYS = {
+    "file_path",
+    "file_name",
+    "file_type",
+    "file_size",
+    "creation_date",
+    "last_modified_date",
+    "last_accessed_date",
+    SOURCE_PATHS_KEY,
+    CONTENT_HASH_KEY,
+}
 
 
-def load_index(persist_dir, chroma_db_dir, chroma_collection_name):
-    """Load the index from disk if it exists and is complete."""
+def hnsw_metadata(
+    m=HNSW_M, construction_ef=HNSW_CONSTRUCTION_EF, search_ef=HNSW_SEARCH_EF
+):
+    """Return the Chroma collection metadata setting the HNSW index parameters."""
+    return {
+        "hnsw:M": m,
+        "hnsw:construction_ef": construction_ef,
+        "hnsw:search_ef": search_ef,
+    }
+
+
+def chunk_content_hash(node):
+    """Return the hash of a chunk's text and position metadata, whatever file it is in."""
+    metadata = {
+        key: value
+        for key, value in node.metadata.items()
+        if key not in FILE_METADATA_KEYS
+    }
+    payload = json.dumps([node.get_content(), metadata], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_source_paths(metadata):
+    """Return the paths of the files a stored chunk was found in."""
+    source_paths = (metadata or {}).get(SOURCE_PATHS_KEY)
+    if source_paths:
+        return json.loads(source_paths)
+    file_path = (metadata or {}).get("file_path")
+    return [file_path] if file_path else []
+
+
+def _updated_metadata(metadata, fields):
+    """Return a copy of stored chunk metadata with fields set, in the serialized node too."""
+    metadata = dict(metadata)
+    metadata.update(fields)
+    # The serialized node carries its own copy of the metadata
+    node_content = metadata.get("_node_content")
+    if node_content:
+        node_dict = json.loads(node_content)
+        node_dict.setdefault("metadata", {}).update(fields)
+        if SOURCE_PATHS_KEY in fields:
+            # Keep the source list out of the embedded and prompted text
+            for excluded_key in (
+                "excluded_embed_metadata_keys",
+                "excluded_llm_metadata_keys",
+            ):
+                excluded = node_dict.setdefault(excluded_key, [])
+                if SOURCE_PATHS_KEY not in excluded:
+                    excluded.append(SOURCE_PATHS_KEY)
+        metadata["_node_content"] = json.dumps(node_dict)
+    return metadata
+
+
+def _with_source_paths(metadata, source_paths):
+    """
+    Return stored chunk metadata listing the given source files.
+
+    If the file the chunk is attributed to is no longer a source, the chunk is attributed
+    to the first remaining one.
+    """
+    fields = {SOURCE_PATHS_KEY: json.dumps(source_paths)}
+    if metadata.get("file_path") not in source_paths:
+        fields["file_path"] = source_paths[0]
+        if "file_name" in metadata:
+            fields["file_name"] = os.path.basename(source_paths[0])
+    return _updated_metadata(metadata, fields)
+
+
+def get_vector_store(
+    chroma_db_dir,
+    chroma_collection_name,
+    hnsw_params=None,
+    shard_by=None,
+    input_dirs=None,
+):
+    """
+    Open the Chroma collection as a vector store.
+
+    Parameters:
+    - chroma_db_dir (str): Directory of the ChromaDB data.
+    - chroma_collection_name (str): Name of the collection.
+    - hnsw_params (dict, optional): HNSW metadata of new collections. Defaults to
+      hnsw_metadata().
+    - shard_by (str, optional): "input_dir" or "file_type" to split the index into one
+      collection per input directory or file extension, searched in parallel.
+    - input_dirs (List[str], optional): Input directories, used to shard by input_dir.
+
+    Returns:
+    - ChromaVectorStore: The vector store.
+    """
+    # chromadb is slow to import, so only load it once an index is opened
+    import chromadb
+    from llama_index.vector_stores.chroma import ChromaVectorStore
+
+    if hnsw_params is None:
+        hnsw_params = hnsw_metadata()
+
+    # Initialize Chroma client and collection
+    chroma_client = chromadb.PersistentClient(path=chroma_db_dir)
+    if shard_by:
+        chroma_collection = ShardedCollection(
+            chroma_client,
+            chroma_collection_name,
+            shard_by,
+            input_dirs=input_dirs,
+            metadata=hnsw_params,
+        )
+    else:
+        chroma_collection = chroma_client.get_or_create_collection(
+            chroma_collection_name, metadata=hnsw_params
+        )
+        warn_on_hnsw_mismatch(chroma_collection, hnsw_params)
+    return ChromaVectorStore(chroma_collection=chroma_collection)
+
+
+def load_index(
+    persist_dir,
+    chroma_db_dir,
+    chroma_collection_name,
+    embed_model=None,
+    persist_docstore=PERSIST_DOCSTORE,
+    hnsw_params=None,
+    shard_by=None,
+    input_dirs=None,
+):
+    """
+    Load the index from disk if it exists and is complete.
+
+    The index embeds queries with ``embed_model``, or with ``Settings.embed_model`` if it
+    is not given. Without ``persist_docstore``, the index is opened straight from the
+    Chroma collection, which holds the text and metadata of every node; nothing is read
+    from persist_dir, so loading takes the same time whatever the size of the corpus.
+    ``hnsw_params``, ``shard_by`` and ``input_dirs`` are passed on to get_vector_store.
+    """
+    if not persist_docstore:
+        try:
+            vector_store = get_vector_store(
+                chroma_db_dir, chroma_collection_name, hnsw_params, shard_by, input_dirs
+            )
+            if vector_store.client.count() == 0:
+                logging.info("The collection is empty. A new index will be created.")
+                return None
+            return VectorStoreIndex.from_vector_store(
+                vector_store, embed_model=embed_model
+            )
+        except Exception as e:
+            logging.error(f"Failed to load index due to an unexpected error: {e}")
+            return None
     if os.path.exists(persist_dir):
         try:
-            # Initialize Chroma client and collection
-            chroma_client = chromadb.PersistentClient(path=chroma_db_dir)
-            chroma_collection = chroma_client.get_or_create_collection(
-                chroma_collection_name
+            vector_store = get_vector_store(
+                chroma_db_dir, chroma_collection_name, hnsw_params, shard_by, input_dirs
             )
-            vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
             # Specify persist_dir when loading existing index
             storage_context = StorageContext.from_defaults(
                 persist_dir=persist_dir, vector_store=vector_store
             )
 
             # Attempt to load the index from storage
-            index = load_index_from_storage(storage_context)
+            index = load_index_from_storage(storage_context, embed_model=embed_model)
             return index
         except FileNotFoundError as e:
             # Log an error and indicate that the index cannot be loaded due to missing files
@@ -46,29 +221,614 @@ def load_index(persist_dir, chroma_db_dir, chroma_collection_name):
         return None
 
 
-def create_index(docs, persist_dir, chroma_db_dir, chroma_collection_name):
-    """Create an index from the documents."""
-    if not docs:
+def create_index(
+    docs,
+    persist_dir,
+    chroma_db_dir,
+    chroma_collection_name,
+    batch_size=INSERT_BATCH_SIZE,
+    node_ids=None,
+    embed_model=None,
+    keyword_index=None,
+    hnsw_params=None,
+    shard_by=None,
+    input_dirs=None,
+    deduplicate=DEDUPLICATE,
+    on_commit=None,
+):
+    """
+    Create an index from the documents, which may be any iterable such as a generator.
+
+    If ``node_ids`` is a dict, it is filled with the ids of the nodes created for each file.
+    Nodes are embedded with ``embed_model``, or with ``Settings.embed_model`` if it is not
+    given, and also added to ``keyword_index`` if one is given. The docstore and index
+    store are only saved to ``persist_dir`` if it is not None. ``hnsw_params``,
+    ``shard_by`` and ``input_dirs`` are passed on to get_vector_store, and
+    ``deduplicate`` and ``on_commit`` to index_documents.
+    """
+    docs = iter(docs)
+    first_doc = next(docs, None)
+    if first_doc is None:
         raise ValueError("No documents provided for indexing.")
     try:
-        # Initialize Chroma client and collection
-        chroma_client = chromadb.PersistentClient(path=chroma_db_dir)
-        chroma_collection = chroma_client.get_or_create_collection(
-            chroma_collection_name
+        vector_store = get_vector_store(
+            chroma_db_dir, chroma_collection_name, hnsw_params, shard_by, input_dirs
         )
-        vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
         storage_context = StorageContext.from_defaults(vector_store=vector_store)
 
-        # Create the index with the storage context
-        index = VectorStoreIndex.from_documents(
-            docs,
-            storage_context=storage_context,
-            show_progress=True,
+        # Create an empty index with the storage context and fill it batch by batch
+        index = VectorStoreIndex(
+            nodes=[], storage_context=storage_context, embed_model=embed_model
+        )
+        index_documents(
+            index,
+            itertools.chain([first_doc], docs),
+            batch_size=batch_size,
+            node_ids=node_ids,
+            keyword_index=keyword_index,
+            store_doc_hashes=persist_dir is not None,
+            deduplicate=deduplicate,
+            on_commit=on_commit,
+            persist_dir=persist_dir,
         )
 
         # Persist the index
-        index.storage_context.persist(persist_dir=persist_dir)
+        if persist_dir is not None:
+            index.storage_context.persist(persist_dir=persist_dir)
         return index
     except Exception as e:
         logging.error(f"Failed to create index: {e}")
         raise
+
+
+def _tag_nodes(nodes):
+    """Record the content hash and source file of new nodes, hidden from the models."""
+    for node in nodes:
+        node.metadata[CONTENT_HASH_KEY] = chunk_content_hash(node)
+        node.metadata[SOURCE_PATHS_KEY] = json.dumps(
+            [node.metadata.get("file_path", node.ref_doc_id)]
+        )
+        for excluded_key in (
+            "excluded_embed_metadata_keys",
+            "excluded_llm_metadata_keys",
+        ):
+            excluded = getattr(node, excluded_key)
+            setattr(
+                node,
+                excluded_key,
+                excluded
+                + [
+                    key
+                    for key in (SOURCE_PATHS_KEY, CONTENT_HASH_KEY)
+                    if key not in excluded
+                ],
+            )
+
+
+def _link_duplicate_chunks(index, nodes, node_ids=None):
+    """
+    Drop the nodes whose content is already indexed or repeated earlier in the batch.
+
+    The file of each dropped node is added to the source paths of the chunk that is kept,
+    and the kept chunk's id is recorded in ``node_ids`` for that file.
+
+    Returns:
+    - List[BaseNode]: The nodes that still have to be embedded and inserted.
+    """
+    groups = {}
+    for node in nodes:
+        groups.setdefault(node.metadata[CONTENT_HASH_KEY], []).append(node)
+
+    chroma_collection = index.vector_store.client
+    result = chroma_collection.get(
+        where={CONTENT_HASH_KEY: {"$in": list(groups)}}, include=["metadatas"]
+    )
+    stored = {}
+    for node_id, metadata in zip(result["ids"], result["metadatas"]):
+        stored.setdefault(metadata[CONTENT_HASH_KEY], (node_id, metadata))
+
+    new_nodes, update_ids, update_metadatas = [], [], []
+    for content_hash, group in groups.items():
+        paths = list(
+            dict.fromkeys(
+                node.metadata.get("file_path", node.ref_doc_id) for node in group
+            )
+        )
+        if content_hash in stored:
+            node_id, metadata = stored[content_hash]
+            source_paths = get_source_paths(metadata)
+            added = [path for path in paths if path not in source_paths]
+            if added:
+                update_ids.append(node_id)
+                update_metadatas.append(
+                    _with_source_paths(metadata, source_paths + added)
+                )
+        else:
+            node = group[0]
+            node_id = node.node_id
+            node.metadata[SOURCE_PATHS_KEY] = json.dumps(paths)
+            new_nodes.append(node)
+        if node_ids is not None:
+            for path in paths:
+                file_node_ids = node_ids.setdefault(path, [])
+                if node_id not in file_node_ids:
+                    file_node_ids.append(node_id)
+
+    if update_ids:
+        chroma_collection.update(ids=update_ids, metadatas=update_metadatas)
+    num_linked = len(nodes) - len(new_nodes)
+    if num_linked:
+        logging.info(f"Linked {num_linked} duplicate chunks to indexed ones")
+    return new_nodes
+
+
+def _insert_batch(
+    index,
+    docs,
+    nodes,
+    node_ids,
+    keyword_index=None,
+    store_doc_hashes=True,
+    deduplicate=False,
+):
+    """Embed a batch of nodes and write them to the vector store in one bulk add."""
+    if deduplicate:
+        nodes = _link_duplicate_chunks(index, nodes, node_ids)
+    if nodes:
+        index.insert_nodes(nodes)
+        if keyword_index is not None:
+            keyword_index.add_nodes(nodes)
+    if store_doc_hashes:
+        for doc in docs:
+            index.docstore.set_document_hash(doc.get_doc_id(), doc.hash)
+    if node_ids is not None and not deduplicate:
+        for node in nodes:
+            file_path = node.metadata.get("file_path", node.ref_doc_id)
+            node_ids.setdefault(file_path, []).append(node.node_id)
+
+
+def index_documents(
+    index,
+    docs,
+    batch_size=INSERT_BATCH_SIZE,
+    node_ids=None,
+    keyword_index=None,
+    store_doc_hashes=True,
+    deduplicate=False,
+    on_commit=None,
+    persist_dir=None,
+    checkpoint_interval=DOCSTORE_CHECKPOINT_INTERVAL,
+):
+    """
+    Chunk, embed and insert documents into the index in batches.
+
+    Documents are consumed lazily and chunked one at a time. Once ``batch_size`` nodes
+    have accumulated they are embedded (in ``embed_batch_size`` groups by the embedding
+    model) and added to Chroma together, so peak memory is bounded by the batch size
+    rather than the number of documents.
+
+    With ``deduplicate``, chunks whose text and position metadata (page, sheet, rows)
+    are already indexed, from any file, are not embedded or stored again. The stored
+    chunk lists every file it was found in, as a JSON list in its ``source_paths``
+    metadata, and its id is recorded in ``node_ids`` for each of them.
+
+    Each batch is committed to Chroma as it is inserted, so the work done survives a
+    crash. After each batch, ``on_commit`` is called with the files whose documents have
+    all been inserted, letting the caller record them (e.g. in the manifest) and resume
+    from the next file after an interruption. The documents of a file must be
+    consecutive, as iter_load_files yields them.
+
+    Parameters:
+    - index (VectorStoreIndex): The index to insert into.
+    - docs (Iterable[Document]): Documents to index, e.g. from iter_load_files.
+    - batch_size (int, optional): Number of nodes per embedding and insert batch.
+      Defaults to INSERT_BATCH_SIZE.
+    - node_ids (dict, optional): Filled with the ids of the nodes created for each file,
+      keyed by the documents' ``file_path`` metadata.
+    - keyword_index (KeywordIndex, optional): Keyword index the nodes are also added to.
+    - store_doc_hashes (bool, optional): Record the document hashes in the docstore.
+      Only needed if the docstore is persisted. Defaults to True.
+    - deduplicate (bool, optional): Store identical chunks once. Defaults to False.
+    - on_commit (callable, optional): Called with the list of file paths committed by
+      each batch.
+    - persist_dir (str, optional): Directory the legacy docstore is saved to during the
+      run, at most every ``checkpoint_interval`` seconds, so it can be loaded again
+      after a crash.
+    - checkpoint_interval (float, optional): Seconds between docstore saves.
+
+    Returns:
+    - int: The number of documents indexed.
+    """
+    transformations = Settings.transformations
+    num_docs = num_nodes = 0
+    batch_docs, batch_nodes = [], []
+    # Files with documents in the batches since the last commit; the last one may
+    # still have documents to come
+    open_files = {}
+    last_persist = None
+
+    def commit(final):
+        nonlocal last_persist
+        # The caller saves the docstore once the run is over
+        if (
+            persist_dir is not None
+            and not final
+            and (
+                last_persist is None
+                or time.monotonic() - last_persist >= checkpoint_interval
+            )
+        ):
+            index.storage_context.persist(persist_dir=persist_dir)
+            last_persist = time.monotonic()
+        files = list(open_files)
+        if not final:
+            files = files[:-1]
+        for file_path in files:
+            del open_files[file_path]
+        if on_commit is not None and files:
+            on_commit(files)
+
+    for doc in docs:
+        open_files[doc.metadata.get("file_path", doc.doc_id)] = None
+        batch_docs.append(doc)
+        nodes = run_transformations([doc], transformations)
+        if deduplicate:
+            _tag_nodes(nodes)
+        batch_nodes.extend(nodes)
+        if len(batch_nodes) >= batch_size:
+            _insert_batch(
+                index,
+                batch_docs,
+                batch_nodes,
+                node_ids,
+                keyword_index,
+                store_doc_hashes,
+                deduplicate,
+            )
+            num_docs += len(batch_docs)
+            num_nodes += len(batch_nodes)
+            logging.info(f"Indexed {num_docs} documents ({num_nodes} nodes)")
+            batch_docs, batch_nodes = [], []
+            commit(final=False)
+
+    if batch_docs:
+        _insert_batch(
+            index,
+            batch_docs,
+            batch_nodes,
+            node_ids,
+            keyword_index,
+            store_doc_hashes,
+            deduplicate,
+        )
+        num_docs += len(batch_docs)
+        num_nodes += len(batch_nodes)
+        logging.info(f"Indexed {num_docs} documents ({num_nodes} nodes)")
+    if open_files:
+        commit(final=True)
+
+    return num_docs
+
+
+def _find_source_nodes(chroma_collection, file_paths, batch_size=INSERT_BATCH_SIZE):
+    """
+    Scan the collection for deduplicated chunks listing any of the files as a source.
+
+    ``source_paths`` is stored as a JSON string, which Chroma cannot filter on, so every
+    chunk's metadata is read. Only used to recover from an interrupted run.
+    """
+    file_paths = set(file_paths)
+    ids, metadatas = [], []
+    offset = 0
+    while True:
+        result = chroma_collection.get(
+            include=["metadatas"], limit=batch_size, offset=offset
+        )
+        if not result["ids"]:
+            break
+        for node_id, metadata in zip(result["ids"], result["metadatas"]):
+            if (metadata or {}).get(SOURCE_PATHS_KEY) and file_paths.intersection(
+                get_source_paths(metadata)
+            ):
+                ids.append(node_id)
+                metadatas.append(metadata)
+        offset += len(result["ids"])
+    return ids, metadatas
+
+
+def _get_file_nodes(chroma_collection, file_paths, node_ids=None, match_paths=False):
+    """
+    Look up the ids and metadata of the nodes indexed from the given files.
+
+    Files with recorded node ids are fetched by id; the others are matched on their
+    ``file_path`` metadata. With ``match_paths``, every file is also matched on its
+    ``file_path`` and ``source_paths`` metadata, which finds the nodes an interrupted
+    run stored for a file before recording them.
+    """
+    if node_ids is None:
+        node_ids = {}
+    # Deduplicated chunks can be recorded for several of the files
+    known_ids = list(
+        dict.fromkeys(
+            node_id
+            for file_path in file_paths
+            for node_id in node_ids.get(file_path, [])
+        )
+    )
+    unknown_paths = [path for path in file_paths if match_paths or path not in node_ids]
+
+    ids, metadatas = [], []
+    if known_ids:
+        result = chroma_collection.get(ids=known_ids, include=["metadatas"])
+        ids.extend(result["ids"])
+        metadatas.extend(result["metadatas"])
+    if unknown_paths:
+        result = chroma_collection.get(
+            where={"file_path": {"$in": unknown_paths}}, include=["metadatas"]
+        )
+        ids.extend(result["ids"])
+        metadatas.extend(result["metadatas"])
+    if match_paths and file_paths:
+        found = _find_source_nodes(chroma_collection, file_paths)
+        ids.extend(found[0])
+        metadatas.extend(found[1])
+    if match_paths:
+        # The same node can be found by id, by file_path and by source_paths
+        unique = dict(zip(ids, metadatas))
+        ids, metadatas = list(unique), list(unique.values())
+    return ids, metadatas
+
+
+def get_file_node_ids(index, file_paths):
+    """
+    Look up the ids of the nodes stored in Chroma for files without recorded node ids.
+
+    Returns:
+    - dict: File paths mapped to the ids of the nodes whose ``file_path`` is that file.
+    """
+    ids, metadatas = _get_file_nodes(index.vector_store.client, list(file_paths))
+    node_ids = {}
+    for node_id, metadata in zip(ids, metadatas):
+        node_ids.setdefault(metadata.get("file_path"), []).append(node_id)
+    return node_ids
+
+
+def delete_file_nodes(
+    index, file_paths, node_ids=None, keyword_index=None, match_paths=False
+):
+    """
+    Remove every node previously indexed from the given files.
+
+    Nodes are deleted from the Chroma collection in a single bulk call, so the cost
+    scales with the number of files rather than the size of the index. Deduplicated
+    chunks that were also found in other files are kept, and only lose the given files
+    from their ``source_paths``.
+
+    Parameters:
+    - index (VectorStoreIndex): The index to delete from.
+    - file_paths (List[str]): Paths of the files whose nodes should be removed.
+    - node_ids (dict, optional): Node ids recorded for each file in the manifest. Files
+      without recorded ids are looked up by their ``file_path`` metadata.
+    - keyword_index (KeywordIndex, optional): Keyword index the nodes are also removed
+      from.
+    - match_paths (bool, optional): Also find the nodes of files with recorded ids by
+      their ``file_path`` and ``source_paths`` metadata, for files an interrupted run
+      had started to index. Defaults to False.
+
+    Returns:
+    - int: The number of nodes deleted.
+    """
+    if not file_paths:
+        return 0
+
+    chroma_collection = index.vector_store.client
+    found_ids, found_metadatas = _get_file_nodes(
+        chroma_collection, file_paths, node_ids, match_paths
+    )
+    removed_paths = set(file_paths)
+    ids, metadatas, kept_ids, kept_metadatas = [], [], [], []
+    for node_id, metadata in zip(found_ids, found_metadatas):
+        source_paths = get_source_paths(metadata)
+        remaining = [path for path in source_paths if path not in removed_paths]
+        if not remaining:
+            ids.append(node_id)
+            metadatas.append(metadata)
+        elif remaining != source_paths:
+            kept_ids.append(node_id)
+            kept_metadatas.append(_with_source_paths(metadata, remaining))
+
+    if kept_ids:
+        chroma_collection.update(ids=kept_ids, metadatas=kept_metadatas)
+        if keyword_index is not None:
+            moved = {}
+            for node_id, metadata in zip(kept_ids, kept_metadatas):
+                moved.setdefault(metadata["file_path"], []).append(node_id)
+            for file_path, moved_ids in moved.items():
+                keyword_index.set_file_path(moved_ids, file_path)
+    if not ids:
+        return 0
+
+    chroma_collection.delete(ids=ids)
+    if keyword_index is not None:
+        keyword_index.remove_nodes(ids)
+
+    # Drop the document hashes kept in the docstore for the removed documents
+    ref_doc_ids = {
+        metadata.get("ref_doc_id")
+        for metadata in metadatas
+        if metadata and metadata.get("ref_doc_id")
+    }
+    for ref_doc_id in ref_doc_ids:
+        index.docstore.delete_document(ref_doc_id, raise_error=False)
+
+    logging.info(f"Deleted {len(ids)} nodes from {len(file_paths)} files")
+    return len(ids)
+
+
+def rename_file_nodes(index, old_path, new_path, node_ids=None, keyword_index=None):
+    """
+    Point the nodes indexed from old_path at new_path without re-embedding them.
+
+    Parameters:
+    - index (VectorStoreIndex): The index to update.
+    - old_path (str): Previous path of the file.
+    - new_path (str): New path of the file, whose content is unchanged.
+    - node_ids (dict, optional): Node ids recorded for each file in the manifest.
+    - keyword_index (KeywordIndex, optional): Keyword index whose chunks are also
+      pointed at new_path.
+
+    Returns:
+    - int: The number of nodes updated.
+    """
+    chroma_collection = index.vector_store.client
+    ids, old_metadatas = _get_file_nodes(chroma_collection, [old_path], node_ids)
+    if not ids:
+        return 0
+
+    metadatas = []
+    for metadata in old_metadatas:
+        fields = {}
+        if metadata.get("file_path") == old_path:
+            fields["file_path"] = new_path
+            if "file_name" in metadata:
+                fields["file_name"] = os.path.basename(new_path)
+        if SOURCE_PATHS_KEY in metadata:
+            # Deduplicated chunks may belong to other files as well
+            fields[SOURCE_PATHS_KEY] = json.dumps(
+                [
+                    new_path if path == old_path else path
+                    for path in get_source_paths(metadata)
+                ]
+            )
+        metadatas.append(_updated_metadata(metadata, fields))
+
+    chroma_collection.update(ids=ids, metadatas=metadatas)
+    if keyword_index is not None:
+        keyword_index.rename_file(old_path, new_path)
+    logging.info(f"Renamed {len(ids)} nodes from {old_path} to {new_path}")
+    return len(ids)
+
+
+def upsert_documents(
+    index,
+    docs,
+    file_paths,
+    persist_dir,
+    batch_size=INSERT_BATCH_SIZE,
+    old_node_ids=None,
+    node_ids=None,
+    keyword_index=None,
+    deduplicate=DEDUPLICATE,
+    on_commit=None,
+    resumed=False,
+):
+    """
+    Replace the nodes previously indexed from file_paths with the given documents.
+
+    Parameters:
+    - old_node_ids (dict, optional): Node ids recorded for the files, passed on to
+      delete_file_nodes.
+    - resumed (bool, optional): Whether an interrupted run is resumed. Its files may
+      already have nodes in the index that were not recorded, so they are also looked
+      up by path. Defaults to False.
+    - node_ids (dict, optional): Filled with the ids of the new nodes for each file.
+    - keyword_index (KeywordIndex, optional): Keyword index kept in sync with the
+      vector store.
+    - deduplicate (bool, optional): Passed on to index_documents.
+    - on_commit (callable, optional): Passed on to index_documents.
+
+    The docstore and index store are only saved to ``persist_dir`` if it is not None.
+
+    Returns:
+    - int: The number of documents indexed.
+    """
+    try:
+        delete_file_nodes(
+            index,
+            file_paths,
+            node_ids=old_node_ids,
+            keyword_index=keyword_index,
+            match_paths=resumed,
+        )
+        num_docs = index_documents(
+            index,
+            docs,
+            batch_size=batch_size,
+            node_ids=node_ids,
+            keyword_index=keyword_index,
+            store_doc_hashes=persist_dir is not None,
+            deduplicate=deduplicate,
+            on_commit=on_commit,
+            persist_dir=persist_dir,
+        )
+        if persist_dir is not None:
+            index.storage_context.persist(persist_dir=persist_dir)
+        return num_docs
+    except Exception as e:
+        logging.error(f"Failed to update index: {e}")
+        raise
+
+
+def link_duplicate_files(index, duplicates, node_ids):
+    """
+    Index files as copies of files with the same content, without parsing them.
+
+    The chunks of each original file get the copy added to their ``source_paths``, and
+    the copy is recorded with the same node ids.
+
+    Parameters:
+    - index (VectorStoreIndex): The index to update.
+    - duplicates (dict): Paths of the copies mapped to the path of their original.
+    - node_ids (dict): Node ids of the original files; filled with those of the copies.
+
+    Returns:
+    - int: The number of chunks updated.
+    """
+    chroma_collection = index.vector_store.client
+    copies = {}
+    for file_path, original in duplicates.items():
+        for node_id in node_ids.get(original, []):
+            copies.setdefault(node_id, []).append(file_path)
+        node_ids[file_path] = list(node_ids.get(original, []))
+    if not copies:
+        return 0
+
+    result = chroma_collection.get(ids=list(copies), include=["metadatas"])
+    ids, metadatas = [], []
+    for node_id, metadata in zip(result["ids"], result["metadatas"]):
+        source_paths = get_source_paths(metadata)
+        added = [path for path in copies[node_id] if path not in source_paths]
+        if added:
+            ids.append(node_id)
+            metadatas.append(_with_source_paths(metadata, source_paths + added))
+    if ids:
+        chroma_collection.update(ids=ids, metadatas=metadatas)
+    logging.info(f"Linked {len(duplicates)} duplicate files to indexed copies")
+    return len(ids)
+
+
+def rebuild_keyword_index(index, keyword_index, batch_size=INSERT_BATCH_SIZE):
+    """
+    Rebuild the keyword index from the chunks stored in the Chroma collection.
+
+    Returns:
+    - int: The number of chunks indexed.
+    """
+    chroma_collection = index.vector_store.client
+    keyword_index.clear()
+    num_chunks = 0
+    while True:
+        result = chroma_collection.get(
+            include=["documents", "metadatas"], limit=batch_size, offset=num_chunks
+        )
+        if not result["ids"]:
+            break
+        keyword_index.add_chunks(
+            (node_id, (metadata or {}).get("file_path"), text or "")
+            for node_id, text, metadata in zip(
+                result["ids"], result["documents"], result["metadatas"]
+            )
+        )
+        num_chunks += len(result["ids"])
+    logging.info(f"Rebuilt the keyword index from {num_chunks} chunks")
+    return num_chunks
@@ -0,0 +1,591 @@
+# keyword_index.py
+
+import os
+import re
+import math
+import logging
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+BM25_K1 = 1.2  # Term frequency saturation
+BM25_B = 0.75  # Document length normalization
+MAX_SEGMENTS = 16  # Posting segments per term before they are merged into one
+COMPACT_FRACTION = 0.25  # Drop deleted chunks from all postings once this share is dead
+COMPACT_BATCH_TERMS = 1000  # Terms compacted per transaction
+SQLITE_MAX_PARAMS = 500  # Values per SELECT ... IN (...) lookup
+SQLITE_CACHE_KB = 64 * 1024  # SQLite page cache size
+POSTINGS_CACHE_SIZE = 256  # Decoded posting lists of frequent terms kept in memory
+POSTINGS_CACHE_MIN_LENGTH = 4096  # Shorter posting lists are cheap to decode again
+
+# Words, plus identifiers joined by - . / : such as ERR-404, v1.2.3 or os.path.join
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./:]\w+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have if in into is it its of on or "
+    "so such that the their then there these they this to was were will with".split()
+)
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text):
+    """
+    Split text into lower-case keyword tokens.
+
+    Compound identifiers are kept whole and also split into their parts, so "ERR-404"
+    matches queries for "err-404", "err" and "404".
+    """
+    matches = [
+        token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) <= 64
+    ]
+    tokens = [token for token in matches if token not in STOPWORDS]
+    for token in matches:
+        if not token.isalnum():
+            tokens.extend(
+                part
+                for part in re.split(r"[-./:_]+", token)
+                if part and part != token and part not in STOPWORDS
+            )
+    return tokens
+
+
+def _encode_batch(postings):
+    """
+    Delta-encode the postings of an insert batch, one segment per term.
+
+    Parameters:
+    - postings (List[tuple]): (term, chunk_num, freq) for every term of every chunk, in
+      increasing chunk number order.
+
+    Returns:
+    - List[tuple]: (term, base, last, deltas, freqs) rows for the postings table.
+    """
+    term_ids = {}
+    term_idx = np.fromiter(
+        (term_ids.setdefault(term, len(term_ids)) for term, _, _ in postings),
+        dtype=np.int64,
+        count=len(postings),
+    )
+    nums = np.fromiter(
+        (num for _, num, _ in postings), dtype=np.int64, count=len(postings)
+    )
+    freqs = np.fromiter(
+        (freq for _, _, freq in postings), dtype=np.int64, count=len(postings)
+    )
+
+    # Group by term; a stable sort keeps each term's chunk numbers increasing
+    order = np.argsort(term_idx, kind="stable")
+    term_idx, nums, freqs = term_idx[order], nums[order], freqs[order]
+    starts = np.flatnonzero(np.r_[True, term_idx[1:] != term_idx[:-1]])
+    ends = np.r_[starts[1:], len(nums)]
+    deltas = np.diff(nums, prepend=nums[0])
+    deltas[starts] = 0
+    deltas = deltas.astype(np.uint32)
+    freqs = np.minimum(freqs, np.iinfo(np.uint16).max).astype(np.uint16)
+
+    terms = list(term_ids)
+    return [
+        (
+            terms[term_idx[start]],
+            int(nums[start]),
+            int(nums[end - 1]),
+            deltas[start:end].tobytes(),
+            freqs[start:end].tobytes(),
+        )
+        for start, end in zip(starts.tolist(), ends.tolist())
+    ]
+
+
+def _encode_postings(nums, freqs):
+    """Delta-encode sorted chunk numbers and their term frequencies as arrays."""
+    nums = np.asarray(nums, dtype=np.int64)
+    deltas = np.diff(nums, prepend=nums[0]).astype(np.uint32)
+    freqs = np.minimum(np.asarray(freqs), np.iinfo(np.uint16).max).astype(np.uint16)
+    return int(nums[0]), int(nums[-1]), deltas.tobytes(), freqs.tobytes()
+
+
+def _decode_postings(base, deltas, freqs):
+    """Return the chunk numbers and term frequencies of an encoded posting segment."""
+    nums = base + np.cumsum(np.frombuffer(deltas, dtype=np.uint32), dtype=np.int64)
+    return nums, np.frombuffer(freqs, dtype=np.uint16)
+
+
+class KeywordIndex:
+    """
+    Persistent BM25 inverted index over the indexed chunks, stored in SQLite.
+
+    Every chunk gets an increasing number. A term's postings are stored as segments of
+    delta-encoded uint32 chunk numbers with uint16 term frequencies. Each insert batch
+    appends one segment per term, and a term's segments are merged once there are more
+    than MAX_SEGMENTS. Deleting a chunk only removes its row from ``chunks``. Searches
+    skip deleted chunks, and their postings are dropped once they make up
+    COMPACT_FRACTION of all chunks. Chunk lengths are kept in memory as an array, so
+    scoring a term is a few vectorized array operations over its postings.
+    """
+
+    def __init__(self, index_path):
+        index_dir = os.path.dirname(index_path)
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+
+        self.index_path = index_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            index_path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                num INTEGER PRIMARY KEY,
+                node_id TEXT NOT NULL UNIQUE,
+                file_path TEXT,
+                length INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_file_path ON chunks (file_path);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                base INTEGER NOT NULL,
+                last INTEGER NOT NULL,
+                deltas BLOB NOT NULL,
+                freqs BLOB NOT NULL,
+                PRIMARY KEY (term, base)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS terms (
+                term TEXT PRIMARY KEY,
+                segments INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER);
+            """)
+        # Indexes written before the live chunk count was kept in meta
+        self._conn.execute(
+            "INSERT OR IGNORE INTO meta (name, value) "
+            "SELECT 'num_chunks', COUNT(*) FROM chunks"
+        )
+        # Chunk lengths by number, 0 for deleted chunks; loaded on first search
+        self._lengths = None
+        # term -> decoded (nums, freqs) of long posting lists, dropped on every write
+        self._postings_cache = OrderedDict()
+        self._compacting = False
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._postings_cache.clear()
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                self._lengths = None
+                raise
+            self._conn.execute("COMMIT")
+
+    def _get_meta(self, name):
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _set_meta(self, name, value):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value)
+        )
+
+    def __len__(self):
+        with self._lock:
+            return self._get_meta("num_chunks")
+
+    def _load_lengths(self):
+        """Load the chunk lengths into memory."""
+        if self._lengths is None:
+            lengths = np.zeros(self._get_meta("next_num") + 1, dtype=np.float32)
+            rows = np.array(
+                self._conn.execute("SELECT num, length FROM chunks").fetchall(),
+                dtype=np.int64,
+            ).reshape(-1, 2)
+            lengths[rows[:, 0]] = rows[:, 1]
+            self._lengths = lengths
+        return self._lengths
+
+    def add_nodes(self, nodes):
+        """Index the text of the given nodes."""
+        self.add_chunks(
+            (node.node_id, node.metadata.get("file_path"), node.get_content())
+            for node in nodes
+        )
+
+    def add_chunks(self, chunks):
+        """
+        Index chunks given as (node_id, file_path, text) tuples.
+
+        Chunks that are already indexed are indexed again under a new number.
+        """
+        chunks = list(chunks)
+        if not chunks:
+            return
+        with self._transaction():
+            self._remove([node_id for node_id, _, _ in chunks])
+            num = self._get_meta("next_num")
+            total_length = self._get_meta("total_length")
+            postings = []
+            rows = []
+            for node_id, file_path, text in chunks:
+                num += 1
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                rows.append((num, node_id, file_path, length))
+                total_length += length
+                postings.extend((term, num, freq) for term, freq in counts.items())
+
+            self._conn.executemany(
+                "INSERT INTO chunks (num, node_id, file_path, length) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            if postings:
+                segments = _encode_batch(postings)
+                self._conn.executemany(
+                    "INSERT INTO postings (term, base, last, deltas, freqs) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    segments,
+                )
+                self._conn.executemany(
+                    "INSERT INTO terms (term, segments) VALUES (?, 1) "
+                    "ON CONFLICT(term) DO UPDATE SET segments = segments + 1",
+                    [(segment[0],) for segment in segments],
+                )
+                self._merge_segments([segment[0] for segment in segments])
+            self._set_meta("next_num", num)
+            self._set_meta("total_length", total_length)
+            self._set_meta("num_chunks", self._get_meta("num_chunks") + len(rows))
+
+            if self._lengths is not None:
+                lengths = np.zeros(num + 1, dtype=np.float32)
+                lengths[: len(self._lengths)] = self._lengths
+                for chunk_num, _, _, length in rows:
+                    lengths[chunk_num] = length
+                self._lengths = lengths
+
+    def _read_postings(self, term):
+        """Return the chunk numbers and frequencies of a term, including deleted chunks."""
+        segments = self._conn.execute(
+            "SELECT base, deltas, freqs FROM postings WHERE term = ? ORDER BY base",
+            (term,),
+        ).fetchall()
+        if not segments:
+            return None, None
+        if len(segments) == 1:
+            return _decode_postings(*segments[0])
+        decoded = [_decode_postings(*segment) for segment in segments]
+        return (
+            np.concatenate([nums for nums, _ in decoded]),
+            np.concatenate([freqs for _, freqs in decoded]),
+        )
+
+    def _cached_postings(self, term):
+        """Return the decoded postings of a term, caching long posting lists."""
+        if term in self._postings_cache:
+            self._postings_cache.move_to_end(term)
+            return self._postings_cache[term]
+        nums, freqs = self._read_postings(term)
+        if nums is not None and len(nums) >= POSTINGS_CACHE_MIN_LENGTH:
+            self._postings_cache[term] = (nums, freqs)
+            if len(self._postings_cache) > POSTINGS_CACHE_SIZE:
+                self._postings_cache.popitem(last=False)
+        return nums, freqs
+
+    def _rewrite_postings(self, term, nums, freqs):
+        """Replace all segments of a term with one segment of the given postings."""
+        self._conn.execute("DELETE FROM postings WHERE term = ?", (term,))
+        if len(nums):
+            self._conn.execute(
+                "INSERT INTO postings (term, base, last, deltas, freqs) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (term,) + _encode_postings(nums, freqs),
+            )
+            self._conn.execute("UPDATE terms SET segments = 1 WHERE term = ?", (term,))
+        else:
+            self._conn.execute("DELETE FROM terms WHERE term = ?", (term,))
+
+    def _merge_segments(self, terms):
+        """
+        Merge the segments of the given terms that have too many of them.
+
+        Segments are joined without decoding them: only the first delta of each segment
+        changes, from 0 to the gap after the previous segment's last chunk number.
+        """
+        merged = []
+        for start in range(0, len(terms), SQLITE_MAX_PARAMS):
+            chunk = terms[start : start + SQLITE_MAX_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            full_terms = self._conn.execute(
+                f"SELECT term FROM terms WHERE term IN ({placeholders}) "
+                "AND segments > ?",
+                chunk + [MAX_SEGMENTS],
+            ).fetchall()
+            for (term,) in full_terms:
+                segments = self._conn.execute(
+                    "SELECT base, last, deltas, freqs FROM postings "
+                    "WHERE term = ? ORDER BY base",
+                    (term,),
+                ).fetchall()
+                deltas = [segments[0][2]]
+                for (_, previous_last, _, _), (base, _, segment_deltas, _) in zip(
+                    segments, segments[1:]
+                ):
+                    gap = np.array([base - previous_last], dtype=np.uint32)
+                    deltas.append(gap.tobytes() + segment_deltas[gap.itemsize :])
+                merged.append(
+                    (
+                        term,
+                        segments[0][0],
+                        segments[-1][1],
+                        b"".join(deltas),
+                        b"".join(segment[3] for segment in segments),
+                    )
+                )
+        if not merged:
+            return
+        self._conn.executemany(
+            "DELETE FROM postings WHERE term = ?", [(row[0],) for row in merged]
+        )
+        self._conn.executemany(
+            "INSERT INTO postings (term, base, last, deltas, freqs) "
+            "VALUES (?, ?, ?, ?, ?)",
+            merged,
+        )
+        self._conn.executemany(
+            "UPDATE terms SET segments = 1 WHERE term = ?",
+            [(row[0],) for row in merged],
+        )
+
+    def _remove(self, node_ids):
+        """Delete chunks by node id inside a transaction, returning how many existed."""
+        removed = []
+        for start in range(0, len(node_ids), SQLITE_MAX_PARAMS):
+            chunk = node_ids[start : start + SQLITE_MAX_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            removed.extend(
+                self._conn.execute(
+                    f"SELECT num, length FROM chunks WHERE node_id IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+            )
+        if not removed:
+            return 0
+
+        self._conn.executemany(
+            "DELETE FROM chunks WHERE num = ?", [(num,) for num, _ in removed]
+        )
+        self._set_meta(
+            "total_length",
+            self._get_meta("total_length") - sum(length for _, length in removed),
+        )
+        self._set_meta("num_deleted", self._get_meta("num_deleted") + len(removed))
+        self._set_meta("num_chunks", self._get_meta("num_chunks") - len(removed))
+        if self._lengths is not None:
+            for num, _ in removed:
+                self._lengths[num] = 0
+        return len(removed)
+
+    def remove_nodes(self, node_ids):
+        """Remove chunks by node id, compacting the postings if many chunks are dead."""
+        node_ids = list(node_ids)
+        if not node_ids:
+            return 0
+        with self._transaction():
+            num_removed = self._remove(node_ids)
+            num_deleted = self._get_meta("num_deleted")
+            compact = num_deleted and num_deleted >= COMPACT_FRACTION * self._get_meta(
+                "next_num"
+            )
+        if compact:
+            self._compact()
+        return num_removed
+
+    def remove_files(self, file_paths):
+        """Remove every chunk of the given files."""
+        node_ids = []
+        with self._lock:
+            for file_path in file_paths:
+                node_ids.extend(
+                    node_id
+                    for (node_id,) in self._conn.execute(
+                        "SELECT node_id FROM chunks WHERE file_path = ?", (file_path,)
+                    )
+                )
+        return self.remove_nodes(node_ids)
+
+    def rename_file(self, old_path, new_path):
+        """Point the chunks of old_path at new_path."""
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE chunks SET file_path = ? WHERE file_path = ?",
+                (new_path, old_path),
+            )
+
+    def set_file_path(self, node_ids, file_path):
+        """Point the given chunks at file_path."""
+        with self._transaction():
+            self._conn.executemany(
+                "UPDATE chunks SET file_path = ? WHERE node_id = ?",
+                [(file_path, node_id) for node_id in node_ids],
+            )
+
+    def _compact(self, batch_terms=COMPACT_BATCH_TERMS):
+        """
+        Drop deleted chunks from every term's postings.
+
+        Terms are rewritten in batches of ``batch_terms``, each in its own transaction,
+        so searches and updates can run in between and no transaction grows with the
+        size of the vocabulary. Chunks deleted while compacting stay counted in
+        ``num_deleted``, since terms done before their deletion still list them.
+        """
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+            num_deleted = self._get_meta("num_deleted")
+        try:
+            last_term = ""
+            num_terms = 0
+            while True:
+                with self._transaction():
+                    terms = [
+                        term
+                        for (term,) in self._conn.execute(
+                            "SELECT term FROM terms WHERE term > ? ORDER BY term LIMIT ?",
+                            (last_term, batch_terms),
+                        )
+                    ]
+                    if not terms:
+                        self._set_meta(
+                            "num_deleted",
+                            max(0, self._get_meta("num_deleted") - num_deleted),
+                        )
+                        break
+                    lengths = self._load_lengths()
+                    for term in terms:
+                        nums, freqs = self._read_postings(term)
+                        alive = lengths[nums] > 0
+                        self._rewrite_postings(term, nums[alive], freqs[alive])
+                last_term = terms[-1]
+                num_terms += len(terms)
+        finally:
+            self._compacting = False
+        logger.info(f"Compacted keyword postings of {num_terms} terms")
+
+    def _filter_files(self, nums, file_paths):
+        """Return a boolean array marking which of the chunk numbers belong to the files."""
+        file_paths = set(file_paths)
+        matching = set()
+        for start in range(0, len(nums), SQLITE_MAX_PARAMS):
+            chunk = [int(num) for num in nums[start : start + SQLITE_MAX_PARAMS]]
+            placeholders = ",".join("?" * len(chunk))
+            matching.update(
+                num
+                for num, file_path in self._conn.execute(
+                    f"SELECT num, file_path FROM chunks WHERE num IN ({placeholders})",
+                    chunk,
+                )
+                if file_path in file_paths
+            )
+        return np.fromiter(
+            (int(num) in matching for num in nums), dtype=bool, count=len(nums)
+        )
+
+    def search(self, query_text, top_k, file_paths=None):
+        """
+        Return the top_k chunks for a query by BM25 score.
+
+        Parameters:
+        - query_text (str): The query.
+        - top_k (int): Maximum number of chunks to return.
+        - file_paths (Iterable[str], optional): Only return chunks of these files. Terms
+          are still weighted by their frequency in the whole index.
+
+        Returns:
+        - List[tuple]: (node_id, score) pairs, best first.
+        """
+        terms = set(tokenize(query_text))
+        if not terms or top_k <= 0:
+            return []
+        with self._lock:
+            num_chunks = self._get_meta("num_chunks")
+            if not num_chunks:
+                return []
+            lengths = self._load_lengths()
+            avg_length = max(self._get_meta("total_length") / num_chunks, 1.0)
+
+            all_nums, all_scores = [], []
+            for term in terms:
+                nums, freqs = self._cached_postings(term)
+                if nums is None:
+                    continue
+                doc_lengths = lengths[nums]
+                alive = doc_lengths > 0
+                nums, freqs, doc_lengths = nums[alive], freqs[alive], doc_lengths[alive]
+                if not len(nums):
+                    continue
+                idf = math.log(1 + (num_chunks - len(nums) + 0.5) / (len(nums) + 0.5))
+                freqs = freqs.astype(np.float32)
+                all_nums.append(nums)
+                all_scores.append(
+                    idf
+                    * freqs
+                    * (BM25_K1 + 1)
+                    / (
+                        freqs
+                        + BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths / avg_length)
+                    )
+                )
+            if not all_nums:
+                return []
+
+            nums = np.concatenate(all_nums)
+            scores = np.concatenate(all_scores)
+            if len(all_nums) > 1:
+                # Sum the scores of chunks matching several terms
+                nums, inverse = np.unique(nums, return_inverse=True)
+                scores = np.bincount(inverse, weights=scores)
+            if file_paths is not None:
+                in_files = self._filter_files(nums, file_paths)
+                nums, scores = nums[in_files], scores[in_files]
+                if not len(nums):
+                    return []
+            if len(nums) > top_k:
+                best = np.argpartition(-scores, top_k - 1)[:top_k]
+                nums, scores = nums[best], scores[best]
+            order = np.argsort(-scores)
+            nums, scores = nums[order], scores[order]
+
+            placeholders = ",".join("?" * len(nums))
+            node_ids = dict(
+                self._conn.execute(
+                    f"SELECT num, node_id FROM chunks WHERE num IN ({placeholders})",
+                    [int(num) for num in nums],
+                ).fetchall()
+            )
+        return [
+            (node_ids[int(num)], float(score))
+            for num, score in zip(nums, scores)
+            if int(num) in node_ids
+        ]
+
+    def clear(self):
+        """Remove every chunk."""
+        with self._transaction():
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM terms")
+            self._conn.execute("DELETE FROM meta")
+            self._lengths = None
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,351 @@
+# manifest.py
+
+import os
+import json
+import logging
+import sqlite3
+import time
+import threading
+from contextlib import contextmanager
+
+from ollama_rag.document_tracker import load_indexed_files
+
+logger = logging.getLogger(__name__)
+
+SQLITE_MAX_PARAMS = 500  # Values per SELECT ... IN (...) lookup
+
+
+def _prefix_condition(path_prefixes):
+    """Return the SQL condition and parameters matching paths at or under the prefixes."""
+    # Range scans on the primary key: the path itself, or anything below it
+    ranges, params = [], []
+    for prefix in path_prefixes:
+        folder = prefix.rstrip(os.sep) + os.sep
+        ranges.append("path = ? OR (path >= ? AND path < ?)")
+        params.extend([prefix, folder, folder[:-1] + chr(ord(os.sep) + 1)])
+    return "(" + " OR ".join(ranges) + ")", params
+
+
+class IndexManifest:
+    """
+    Crash-safe record of the indexed files, stored in SQLite in WAL mode.
+
+    Each row holds a file's path, size, mtime_ns, content hash and the ids of the nodes
+    indexed from it. Writes touch only the changed rows and run in transactions, so an
+    interrupted update never leaves a half-written manifest behind. The manifest is the
+    source of truth for incremental updates and deletions.
+
+    Files are recorded in batches as they are indexed, and the ``runs`` table remembers
+    an indexing run until it finishes, so an interrupted run resumes with the files it
+    had not committed yet.
+    """
+
+    def __init__(self, manifest_path, legacy_indexed_files_path=None):
+        manifest_dir = os.path.dirname(manifest_path)
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+
+        self.manifest_path = manifest_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            manifest_path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                hash TEXT,
+                node_ids TEXT
+            );
+            CREATE INDEX IF NOT EXISTS files_hash ON files (hash);
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                listing TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                started_at REAL NOT NULL,
+                files_done INTEGER NOT NULL
+            );
+            """)
+
+        if legacy_indexed_files_path and self.is_empty():
+            self._import_legacy(legacy_indexed_files_path)
+
+    def _import_legacy(self, indexed_files_path):
+        """Import entries from a legacy indexed_files.json manifest."""
+        entries = load_indexed_files(indexed_files_path)
+        if not entries:
+            return
+        with self.transaction():
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, hash) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (path, entry["size"], entry["mtime_ns"], entry["hash"])
+                    for path, entry in entries.items()
+                ],
+            )
+        logger.info(f"Imported {len(entries)} entries from {indexed_files_path}")
+
+    @contextmanager
+    def transaction(self):
+        """Group several writes into a single atomic transaction."""
+        with self._lock:
+            if self._conn.in_transaction:
+                # Nested call: the outer transaction commits
+                yield
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def is_empty(self):
+        """Whether the manifest has no files."""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM files LIMIT 1").fetchone() is None
+
+    def load_files(self, path_prefixes=None):
+        """
+        Return the file entries as {path: {"size", "mtime_ns", "hash"}}.
+
+        With ``path_prefixes``, only the entries of those files, or of files in those
+        folders, are returned.
+        """
+        query, params = "SELECT path, size, mtime_ns, hash FROM files", []
+        if path_prefixes is not None:
+            if not path_prefixes:
+                return {}
+            condition, params = _prefix_condition(path_prefixes)
+            query += " WHERE " + condition
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return {
+            path: {"size": size, "mtime_ns": mtime_ns, "hash": file_hash}
+            for path, size, mtime_ns, file_hash in rows
+        }
+
+    def find_files(self, path_prefixes=None, extensions=None, modified_after_ns=None):
+        """
+        Return the paths of the indexed files matching every given condition.
+
+        Parameters:
+        - path_prefixes (List[str], optional): Folders (or files) the file must be in.
+        - extensions (List[str], optional): Lower case extensions such as ".pdf".
+        - modified_after_ns (int, optional): Minimum modification time in nanoseconds.
+
+        Returns:
+        - List[str]: The matching paths.
+        """
+        conditions, params = [], []
+        if path_prefixes:
+            condition, params = _prefix_condition(path_prefixes)
+            conditions.append(condition)
+        if extensions:
+            conditions.append(
+                "(" + " OR ".join("lower(path) LIKE ?" for _ in extensions) + ")"
+            )
+            params.extend(f"%{ext}" for ext in extensions)
+        if modified_after_ns is not None:
+            conditions.append("mtime_ns > ?")
+            params.append(modified_after_ns)
+        query = "SELECT path FROM files"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._lock:
+            return [path for (path,) in self._conn.execute(query, params)]
+
+    def find_indexed_copies(self, hashes):
+        """
+        Return {hash: [paths]} of the indexed files with each of the given content hashes.
+
+        Only files with recorded node ids are returned, so their chunks can be shared.
+        """
+        hashes = list(set(hashes))
+        copies = {}
+        with self._lock:
+            for start in range(0, len(hashes), SQLITE_MAX_PARAMS):
+                chunk = hashes[start : start + SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(chunk))
+                for file_hash, path in self._conn.execute(
+                    f"SELECT hash, path FROM files WHERE hash IN ({placeholders}) "
+                    "AND node_ids IS NOT NULL ORDER BY path",
+                    chunk,
+                ):
+                    copies.setdefault(file_hash, []).append(path)
+        return copies
+
+    def with_copies(self, file_paths):
+        """Return the given paths and every indexed file with the same content."""
+        file_paths = list(file_paths)
+        paths = set(file_paths)
+        with self._lock:
+            for start in range(0, len(file_paths), SQLITE_MAX_PARAMS):
+                chunk = file_paths[start : start + SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(chunk))
+                paths.update(
+                    path
+                    for (path,) in self._conn.execute(
+                        "SELECT path FROM files WHERE hash IN (SELECT hash FROM files "
+                        f"WHERE path IN ({placeholders}) AND hash IS NOT NULL)",
+                        chunk,
+                    )
+                )
+        return sorted(paths)
+
+    def get_node_ids(self, file_paths):
+        """Return {path: node_ids} for the given files that have recorded node ids."""
+        node_ids = {}
+        with self._lock:
+            for file_path in file_paths:
+                row = self._conn.execute(
+                    "SELECT node_ids FROM files WHERE path = ?", (file_path,)
+                ).fetchone()
+                if row is not None and row[0] is not None:
+                    node_ids[file_path] = json.loads(row[0])
+        return node_ids
+
+    def upsert_files(self, stats, hashes, node_ids=None):
+        """
+        Record files as indexed.
+
+        Parameters:
+        - stats (dict): File paths mapped to (size, mtime_ns).
+        - hashes (dict): File paths mapped to content hashes.
+        - node_ids (dict, optional): File paths mapped to the ids of their nodes. Files
+          missing from it keep the node ids already recorded.
+        """
+        if node_ids is None:
+            node_ids = {}
+        with self.transaction():
+            for file_path, (size, mtime_ns) in stats.items():
+                file_hash = hashes.get(file_path)
+                if file_path in node_ids:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO files (path, size, mtime_ns, hash, node_ids) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (
+                            file_path,
+                            size,
+                            mtime_ns,
+                            file_hash,
+                            json.dumps(node_ids[file_path]),
+                        ),
+                    )
+                else:
+                    self._conn.execute(
+                        "INSERT INTO files (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(path) DO UPDATE SET size = excluded.size, "
+                        "mtime_ns = excluded.mtime_ns, hash = excluded.hash",
+                        (file_path, size, mtime_ns, file_hash),
+                    )
+
+    def start_run(self):
+        """
+        Record that an indexing run started, unless an interrupted run is resumed.
+
+        Returns:
+        - dict: ``started_at`` (epoch seconds) and ``files_done`` of the interrupted run,
+          or None if the last run finished.
+        """
+        with self.transaction():
+            row = self._conn.execute(
+                "SELECT started_at, files_done FROM runs WHERE id = 0"
+            ).fetchone()
+            if row is not None:
+                return {"started_at": row[0], "files_done": row[1]}
+            self._conn.execute(
+                "INSERT INTO runs (id, started_at, files_done) VALUES (0, ?, 0)",
+                (time.time(),),
+            )
+        return None
+
+    def checkpoint(self, stats, hashes, node_ids):
+        """Record files indexed by the current run, in one transaction."""
+        with self.transaction():
+            self.upsert_files(stats, hashes, node_ids)
+            self._conn.execute(
+                "UPDATE runs SET files_done = files_done + ? WHERE id = 0",
+                (len(stats),),
+            )
+
+    def end_run(self):
+        """Record that the current indexing run finished."""
+        with self.transaction():
+            self._conn.execute("DELETE FROM runs")
+
+    def remove_files(self, file_paths):
+        """Forget deleted files."""
+        with self.transaction():
+            self._conn.executemany(
+                "DELETE FROM files WHERE path = ?", [(path,) for path in file_paths]
+            )
+
+    def rename_files(self, renamed, stats):
+        """Move entries from old paths to new paths, keeping their hash and node ids."""
+        with self.transaction():
+            for old_path, new_path in renamed:
+                size, mtime_ns = stats[new_path]
+                self._conn.execute("DELETE FROM files WHERE path = ?", (new_path,))
+                self._conn.execute(
+                    "UPDATE files SET path = ?, size = ?, mtime_ns = ? WHERE path = ?",
+                    (new_path, size, mtime_ns, old_path),
+                )
+
+    def load_snapshot(self):
+        """Return the directory listings saved by the last scan."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, mtime_ns, listing FROM dirs"
+            ).fetchall()
+        snapshot = {}
+        for path, mtime_ns, listing in rows:
+            listing = json.loads(listing)
+            snapshot[path] = {
+                "mtime_ns": mtime_ns,
+                "files": listing["files"],
+                "dirs": listing["dirs"],
+            }
+        return snapshot
+
+    def save_snapshot(self, snapshot, previous):
+        """Write the directory listings that changed since the previous snapshot."""
+        with self.transaction():
+            self._conn.executemany(
+                "DELETE FROM dirs WHERE path = ?",
+                [(path,) for path in previous if path not in snapshot],
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO dirs (path, mtime_ns, listing) VALUES (?, ?, ?)",
+                [
+                    (
+                        path,
+                        listing["mtime_ns"],
+                        json.dumps(
+                            {"files": listing["files"], "dirs": listing["dirs"]}
+                        ),
+                    )
+                    for path, listing in snapshot.items()
+                    if previous.get(path) is not listing
+                ],
+            )
+
+    def clear(self):
+        """Forget every file, directory listing and interrupted run."""
+        with self.transaction():
+            self._conn.execute("DELETE FROM files")
+            self._conn.execute("DELETE FROM dirs")
+            self._conn.execute("DELETE FROM runs")
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
@@ -1,33 +1,158 @@
 # models.py
 
-from llama_index.llms.ollama import Ollama
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+import threading
+from typing import Any, Callable, List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
 from ollama_rag.configs import (
     MODEL_NAME,
     REQUEST_TIMEOUT,
+    OLLAMA_BASE_URL,
     EMBEDDING_MODEL_NAME,
     TRUST_REMOTE_CODE,
+    EMBED_BATCH_SIZE,
+    EMBEDDING_CACHE_DIR,
+    LAZY_MODELS,
+    EMBEDDING_BACKEND,
+    ONNX_QUANTIZE,
 )
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+from ollama_rag.embedding_cache import CachedEmbedding, EmbeddingCache
+
+
+class LazyEmbedding(BaseEmbedding):
+    """Embedding model proxy that builds the real model the first time it embeds text."""
+
+    _factory: Callable[[], BaseEmbedding] = PrivateAttr()
+    _embed_model: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr()
+
+    def __init__(self, factory: Callable[[], BaseEmbedding], **kwargs):
+        super().__init__(**kwargs)
+        self._factory = factory
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LazyEmbedding"
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        if self._embed_model is None:
+            with self._lock:
+                if self._embed_model is None:
+                    self._embed_model = self._factory()
+        return self._embed_model
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._embed_model is not None
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self.embed_model._get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self.embed_model._aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self.embed_model._get_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_model._get_text_embeddings(texts)
 
 
-def setup_llm(model_name=MODEL_NAME, request_timeout=REQUEST_TIMEOUT):
-    """Set up the LLM model."""
+def setup_llm(
+    model_name=MODEL_NAME,
+    request_timeout=REQUEST_TIMEOUT,
+    base_url=OLLAMA_BASE_URL,
+    max_connections=None,
+):
+    """
+    Set up the LLM model.
+
+    The sync and async Ollama clients each keep a pool of HTTP connections, so concurrent
+    queries reuse connections instead of opening one per request. ``max_connections``
+    caps the size of each pool.
+    """
     try:
-        llm = Ollama(model=model_name, request_timeout=request_timeout)
+        import httpx
+        from ollama import AsyncClient, Client
+        from llama_index.llms.ollama import Ollama
+
+        client_kwargs = {"host": base_url, "timeout": request_timeout}
+        if max_connections:
+            client_kwargs["limits"] = httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            )
+        llm = Ollama(
+            model=model_name,
+            base_url=base_url,
+            request_timeout=request_timeout,
+            client=Client(**client_kwargs),
+            async_client=AsyncClient(**client_kwargs),
+        )
         return llm
     except Exception as e:
         raise Exception(f"Failed to set up LLM: {e}")
 
 
 def setup_embedding_model(
-    model_name=EMBEDDING_MODEL_NAME, trust_remote_code=TRUST_REMOTE_CODE
+    model_name=EMBEDDING_MODEL_NAME,
+    trust_remote_code=TRUST_REMOTE_CODE,
+    embed_batch_size=EMBED_BATCH_SIZE,
+    cache_dir=EMBEDDING_CACHE_DIR,
+    lazy=LAZY_MODELS,
+    backend=EMBEDDING_BACKEND,
+    onnx_quantize=ONNX_QUANTIZE,
 ):
-    """Set up the embedding model."""
-    try:
-        embed_model = HuggingFaceEmbedding(
-            model_name=model_name, trust_remote_code=trust_remote_code
+    """
+    Set up the embedding model, backed by a persistent embedding cache if cache_dir is set.
+
+    ``backend`` is "huggingface" for the PyTorch model, or "onnx" for an ONNX Runtime
+    export of it, int8 quantized with ``onnx_quantize``. With ``lazy``, the model is
+    only loaded the first time text has to be embedded, so chunks served from the cache
+    never load it.
+    """
+    if backend not in ("huggingface", "onnx"):
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    def build_embedding_model():
+        # Importing the HuggingFace integration pulls in torch and transformers
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+        return HuggingFaceEmbedding(
+            model_name=model_name,
+            trust_remote_code=trust_remote_code,
+            embed_batch_size=embed_batch_size,
         )
+
+    try:
+        if backend == "onnx":
+            from ollama_rag.onnx_embedding import OnnxEmbedding
+
+            # The ONNX session is created on first use, so it is always lazy
+            embed_model = OnnxEmbedding(
+                model_name=model_name,
+                quantize=onnx_quantize,
+                embed_batch_size=embed_batch_size,
+            )
+        elif lazy:
+            embed_model = LazyEmbedding(
+                build_embedding_model,
+                model_name=model_name,
+                embed_batch_size=embed_batch_size,
+            )
+        else:
+            embed_model = build_embedding_model()
+        if cache_dir:
+            # Backends produce slightly different vectors, so each has its own cache
+            cache_name = model_name
+            if backend == "onnx":
+                cache_name += "@onnx-int8" if onnx_quantize else "@onnx"
+            embed_model = CachedEmbedding(
+                embed_model, EmbeddingCache(cache_dir, cache_name)
+            )
         return embed_model
     except Exception as e:
         raise Exception(f"Failed to set up embedding model: {e}")
@@ -1,30 +1,85 @@
 # ollama_rag.py
 
+import time
 import logging
-from llama_index.core import Settings
+import asyncio
+import threading
+from llama_index.core import QueryBundle, Settings
+from llama_index.core.schema import MetadataMode
 from ollama_rag.models import setup_llm, setup_embedding_model
-from ollama_rag.data_loader import load_data
-from ollama_rag.indexer import create_index, load_index
-from ollama_rag.query_engine import create_query_engine
-from ollama_rag.prompts import qa_prompt_template
-from ollama_rag.document_tracker import (
-    load_indexed_files,
-    save_indexed_files,
-    get_new_or_updated_files,
-    update_indexed_files,
+from ollama_rag.data_loader import iter_load_files
+from ollama_rag.indexer import (
+    create_index,
+    load_index,
+    upsert_documents,
+    delete_file_nodes,
+    rename_file_nodes,
+    link_duplicate_files,
+    get_file_node_ids,
+    rebuild_keyword_index,
+    hnsw_metadata,
+    get_source_paths,
+)
+from ollama_rag.query_engine import (
+    AsyncSlotTokens,
+    QueryStream,
+    SlotTokens,
+    create_query_engine,
+    create_retriever,
 )
+from ollama_rag.prompts import qa_prompt_template
+from ollama_rag.document_tracker import diff_indexed_files
+from ollama_rag.manifest import IndexManifest
+from ollama_rag.keyword_index import KeywordIndex
+from ollama_rag.reranker import CrossEncoderReranker
+from ollama_rag.filters import build_metadata_filters
+from ollama_rag.query_cache import QueryCache
+from ollama_rag.context_packer import pack_context
+from ollama_rag.progress import IndexingProgress
 import os
 import argparse
 from ollama_rag.configs import (
     MODEL_NAME,
     EMBEDDING_MODEL_NAME,
     PERSIST_DIR,
+    PERSIST_DOCSTORE,
+    HNSW_M,
+    HNSW_CONSTRUCTION_EF,
+    HNSW_SEARCH_EF,
+    SHARD_BY,
     CHROMA_DB_DIR,
     CHROMA_COLLECTION_NAME,
+    MANIFEST_PATH,
     INDEXED_FILES_PATH,
     REQUIRED_EXTS,
+    NUM_WORKERS,
+    FILE_TIMEOUT,
+    EMBED_BATCH_SIZE,
+    INSERT_BATCH_SIZE,
+    DEDUPLICATE,
+    EMBEDDING_CACHE_DIR,
+    SCAN_WORKERS,
+    SCAN_PRUNE_UNCHANGED_DIRS,
+    LAZY_MODELS,
+    OLLAMA_BASE_URL,
+    QUERY_CONCURRENCY,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_TTL,
+    QUERY_CACHE_SIMILARITY,
+    SIMILARITY_TOP_K,
+    CONTEXT_TOKEN_BUDGET,
+    HYBRID_SEARCH,
+    KEYWORD_INDEX_PATH,
+    RERANK,
+    RERANK_MODEL_NAME,
+    RERANK_TOP_N,
+    EMBEDDING_BACKEND,
+    ONNX_QUANTIZE,
 )
 
+NO_MATCHING_FILES = "No indexed documents match the filters."
+QUERY_ERROR = "An error occurred while processing your query."
+
 
 class OllamaRAG:
     def __init__(
@@ -40,8 +95,39 @@ class OllamaRAG:
         chroma_db_dir=CHROMA_DB_DIR,
         chroma_collection_name=CHROMA_COLLECTION_NAME,
         indexed_files_path=INDEXED_FILES_PATH,
+        manifest_path=MANIFEST_PATH,
         query=None,
         qa_prompt_template=qa_prompt_template,
+        num_workers=NUM_WORKERS,
+        file_timeout=FILE_TIMEOUT,
+        embed_batch_size=EMBED_BATCH_SIZE,
+        insert_batch_size=INSERT_BATCH_SIZE,
+        embedding_cache_dir=EMBEDDING_CACHE_DIR,
+        scan_workers=SCAN_WORKERS,
+        prune_unchanged_dirs=SCAN_PRUNE_UNCHANGED_DIRS,
+        lazy_models=LAZY_MODELS,
+        ollama_base_url=OLLAMA_BASE_URL,
+        query_concurrency=QUERY_CONCURRENCY,
+        query_cache_size=QUERY_CACHE_SIZE,
+        query_cache_ttl=QUERY_CACHE_TTL,
+        query_cache_similarity=QUERY_CACHE_SIMILARITY,
+        similarity_top_k=SIMILARITY_TOP_K,
+        context_token_budget=CONTEXT_TOKEN_BUDGET,
+        context_tokenizer=None,
+        hybrid_search=HYBRID_SEARCH,
+        keyword_top_k=None,
+        keyword_index_path=KEYWORD_INDEX_PATH,
+        rerank=RERANK,
+        rerank_model_name=RERANK_MODEL_NAME,
+        rerank_top_n=RERANK_TOP_N,
+        embedding_backend=EMBEDDING_BACKEND,
+        onnx_quantize=ONNX_QUANTIZE,
+        persist_docstore=PERSIST_DOCSTORE,
+        hnsw_m=HNSW_M,
+        hnsw_construction_ef=HNSW_CONSTRUCTION_EF,
+        hnsw_search_ef=HNSW_SEARCH_EF,
+        shard_by=SHARD_BY,
+        deduplicate=DEDUPLICATE,
     ):
         if input_dirs is None:
             input_dirs = []
@@ -60,11 +146,61 @@ class OllamaRAG:
         self.chroma_db_dir = chroma_db_dir
         self.chroma_collection_name = chroma_collection_name
         self.indexed_files_path = indexed_files_path
+        self.manifest_path = manifest_path
         self.query_text = query
         self.qa_prompt_template = qa_prompt_template
+        self.num_workers = num_workers
+        self.file_timeout = file_timeout
+        self.embed_batch_size = embed_batch_size
+        self.insert_batch_size = insert_batch_size
+        self.embedding_cache_dir = embedding_cache_dir
+        self.scan_workers = scan_workers
+        self.prune_unchanged_dirs = prune_unchanged_dirs
+        self.lazy_models = lazy_models
+        self.ollama_base_url = ollama_base_url
+        self.query_concurrency = query_concurrency
+        self.query_cache_size = query_cache_size
+        self.query_cache_ttl = query_cache_ttl
+        self.query_cache_similarity = query_cache_similarity
+        self.similarity_top_k = similarity_top_k
+        self.context_token_budget = context_token_budget
+        self.context_tokenizer = context_tokenizer
+        self.hybrid_search = hybrid_search
+        self.keyword_top_k = keyword_top_k
+        self.keyword_index_path = keyword_index_path
+        self.embedding_backend = embedding_backend
+        self.onnx_quantize = onnx_quantize
+        self.persist_docstore = persist_docstore
+        self.hnsw_params = hnsw_metadata(hnsw_m, hnsw_construction_ef, hnsw_search_ef)
+        self.shard_by = shard_by
+        self.deduplicate = deduplicate
+        self.reranker = (
+            CrossEncoderReranker(model_name=rerank_model_name, top_n=rerank_top_n)
+            if rerank
+            else None
+        )
+
+        # Results of earlier queries, dropped when their source files change
+        self.query_cache = (
+            QueryCache(
+                max_entries=self.query_cache_size,
+                ttl=self.query_cache_ttl,
+                similarity_threshold=self.query_cache_similarity,
+            )
+            if self.query_cache_size
+            else None
+        )
+
+        # Event loop thread running async queries, started by the first one
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._query_semaphore = None
+        # Slots of the synchronous query() and stream_query(), held until answered
+        self._sync_query_semaphore = threading.BoundedSemaphore(query_concurrency)
 
         # Create directories if they don't exist
-        os.makedirs(self.persist_dir, exist_ok=True)
+        if self.persist_docstore:
+            os.makedirs(self.persist_dir, exist_ok=True)
         os.makedirs(self.chroma_db_dir, exist_ok=True)
 
         # Setup logging
@@ -74,14 +210,23 @@ class OllamaRAG:
             # Setup LLM and embedding model
             logging.info("Setting up LLM and embedding model...")
             self.llm = setup_llm(
-                model_name=self.model_name, request_timeout=self.request_timeout
+                model_name=self.model_name,
+                request_timeout=self.request_timeout,
+                base_url=self.ollama_base_url,
+                max_connections=self.query_concurrency,
             )
             self.embed_model = setup_embedding_model(
                 model_name=self.embedding_model_name,
                 trust_remote_code=self.trust_remote_code,
+                embed_batch_size=self.embed_batch_size,
+                cache_dir=self.embedding_cache_dir,
+                lazy=self.lazy_models,
+                backend=self.embedding_backend,
+                onnx_quantize=self.onnx_quantize,
             )
 
-            # Configure global Settings
+            # Configure global Settings. The index and query engine are given the models
+            # explicitly, so several engines can live in one process.
             Settings.llm = self.llm
             Settings.embed_model = self.embed_model
 
@@ -91,25 +236,159 @@ class OllamaRAG:
                 persist_dir=self.persist_dir,
                 chroma_db_dir=self.chroma_db_dir,
                 chroma_collection_name=self.chroma_collection_name,
+                embed_model=self.embed_model,
+                persist_docstore=self.persist_docstore,
+                hnsw_params=self.hnsw_params,
+                shard_by=self.shard_by,
+                input_dirs=self.input_dirs,
             )
 
-            # Load indexed files metadata
-            self.indexed_files = load_indexed_files(
-                indexed_files_path=self.indexed_files_path
+            # Open the indexed files manifest, importing a legacy JSON manifest once
+            self.manifest = IndexManifest(
+                self.manifest_path,
+                legacy_indexed_files_path=self.indexed_files_path,
+            )
+
+            # Open the keyword index, rebuilding it if it is out of sync with Chroma
+            self.keyword_index = None
+            if self.hybrid_search:
+                self.keyword_index = KeywordIndex(self.keyword_index_path)
+                if self.index is not None and len(self.keyword_index) != (
+                    self.index.vector_store.client.count()
+                ):
+                    logging.info("Keyword index out of sync, rebuilding it...")
+                    rebuild_keyword_index(self.index, self.keyword_index)
+
+            # Progress of the current or last indexing run, None before the first one
+            self.indexing_progress = None
+
+            # Directory listings from the last scan, reused by later update_index calls
+            self.scan_snapshot = (
+                self.manifest.load_snapshot() if self.prune_unchanged_dirs else {}
             )
 
         except Exception as e:
             logging.error(f"An error occurred during initialization: {e}")
             raise
 
-    def update_index(self):
-        """Update the index with new or updated files."""
-        new_or_updated_files = get_new_or_updated_files(
+    def _docstore_dir(self):
+        """Return the directory the docstore is saved to, None if it is not saved."""
+        return self.persist_dir if self.persist_docstore else None
+
+    def _find_duplicate_files(self, file_paths, hashes):
+        """
+        Map the files whose content is already indexed, or repeated among file_paths,
+        to the file indexed with that content.
+        """
+        changed = set(file_paths)
+        indexed = self.manifest.find_indexed_copies(
+            hashes[file_path] for file_path in file_paths if file_path in hashes
+        )
+        duplicates, first_by_hash = {}, {}
+        for file_path in file_paths:
+            file_hash = hashes.get(file_path)
+            if file_hash is None:
+                continue
+            # Files being re-indexed lose their old chunks, so they cannot be shared
+            original = next(
+                (path for path in indexed.get(file_hash, []) if path not in changed),
+                None,
+            )
+            if original is None:
+                original = first_by_hash.setdefault(file_hash, file_path)
+            if original != file_path:
+                duplicates[file_path] = original
+        return duplicates
+
+    def update_index(self, file_paths=None):
+        """
+        Update the index with new, updated, deleted or renamed files.
+
+        New and updated files are recorded in the manifest batch by batch as their chunks
+        are committed to Chroma. If the run is interrupted (a crash, an out-of-memory
+        error, Ollama going away), the next call resumes with the files that were not
+        committed yet instead of starting over. The progress and ETA of the run are
+        logged and kept in ``indexing_progress``.
+
+        Parameters:
+        - file_paths (List[str], optional): Only look at these files and folders, e.g.
+          the paths reported by IndexWatcher, instead of scanning every input directory.
+          Ignored while there is no index yet.
+        """
+        if self.index is None:
+            file_paths = None
+            # Without an index every file has to be indexed again
+            self.manifest.clear()
+            if self.query_cache is not None:
+                self.query_cache.clear()
+            if self.keyword_index is not None:
+                self.keyword_index.clear()
+
+        previous_snapshot = dict(self.scan_snapshot)
+        changes = diff_indexed_files(
             self.input_dirs,
             self.required_exts,
             self.recursive,
-            self.indexed_files,
+            self.manifest.load_files(path_prefixes=file_paths),
+            snapshot=self.scan_snapshot,
+            prune_unchanged_dirs=self.prune_unchanged_dirs,
+            num_workers=self.scan_workers,
+            paths=file_paths,
         )
+        if self.prune_unchanged_dirs and file_paths is None:
+            self.manifest.save_snapshot(self.scan_snapshot, previous_snapshot)
+
+        stats = changes["stats"]
+        new_or_updated_files = changes["added"] + changes["modified"]
+
+        if changes["deleted"] or changes["renamed"]:
+            # Propagate deletions and renames to the existing index
+            logging.info("Deleted or renamed files detected:")
+            for file in changes["deleted"]:
+                logging.info(f"- deleted: {file}")
+            for old_path, new_path in changes["renamed"]:
+                logging.info(f"- renamed: {old_path} -> {new_path}")
+            node_ids = self.manifest.get_node_ids(
+                changes["deleted"] + [old_path for old_path, _ in changes["renamed"]]
+            )
+            delete_file_nodes(
+                self.index,
+                changes["deleted"],
+                node_ids=node_ids,
+                keyword_index=self.keyword_index,
+            )
+            for old_path, new_path in changes["renamed"]:
+                rename_file_nodes(
+                    self.index,
+                    old_path,
+                    new_path,
+                    node_ids=node_ids,
+                    keyword_index=self.keyword_index,
+                )
+            if self.persist_docstore:
+                self.index.storage_context.persist(persist_dir=self.persist_dir)
+            self._invalidate_query_cache(
+                changes["deleted"] + [old_path for old_path, _ in changes["renamed"]]
+            )
+
+        # Unchanged files imported from indexed_files.json keep the nodes already in
+        # Chroma; record their ids so deduplication and deletion can find them
+        touched_node_ids = {}
+        if changes["touched"] and self.index is not None:
+            recorded = self.manifest.get_node_ids(changes["touched"])
+            unrecorded = [file for file in changes["touched"] if file not in recorded]
+            if unrecorded:
+                touched_node_ids = get_file_node_ids(self.index, unrecorded)
+
+        # Record removals, renames and files whose content is unchanged in one transaction
+        with self.manifest.transaction():
+            self.manifest.remove_files(changes["deleted"])
+            self.manifest.rename_files(changes["renamed"], stats)
+            self.manifest.upsert_files(
+                {file: stats[file] for file in changes["touched"]},
+                changes["hashes"],
+                touched_node_ids,
+            )
 
         if new_or_updated_files:
             # Log new or updated files
@@ -117,38 +396,124 @@ class OllamaRAG:
             for file in new_or_updated_files:
                 logging.info(f"- {file}")
 
-            # Load data from new or updated files
-            docs = load_data(
-                input_dirs=self.input_dirs,
-                required_exts=self.required_exts,
-                recursive=self.recursive,
+            # Copies of files with the same content are linked to them, not parsed
+            duplicates = (
+                self._find_duplicate_files(new_or_updated_files, changes["hashes"])
+                if self.deduplicate
+                else {}
             )
-            if not docs:
-                logging.error("No new documents to index.")
-                return
+
+            resumed = self.manifest.start_run()
+            if resumed is not None:
+                started = time.strftime(
+                    "%Y-%m-%d %H:%M:%S", time.localtime(resumed["started_at"])
+                )
+                logging.info(
+                    f"Resuming the indexing run started at {started}, "
+                    f"{resumed['files_done']} files were already indexed"
+                )
+            progress = IndexingProgress(
+                len(new_or_updated_files),
+                sum(stats[file][0] for file in new_or_updated_files),
+                resumed_files=resumed["files_done"] if resumed is not None else 0,
+            )
+            self.indexing_progress = progress
+
+            # Stream documents from new or updated files only
+            docs = iter_load_files(
+                [file for file in new_or_updated_files if file not in duplicates],
+                num_workers=self.num_workers,
+                timeout=self.file_timeout,
+            )
+            node_ids = {}
+            pending = set(new_or_updated_files)
+
+            def on_commit(files):
+                # Record the files whose chunks are all in Chroma, so they are not
+                # indexed again if the run is interrupted
+                files = [file for file in files if file in pending]
+                file_node_ids = {file: node_ids.pop(file, []) for file in files}
+                self.manifest.checkpoint(
+                    {file: stats[file] for file in files},
+                    changes["hashes"],
+                    file_node_ids,
+                )
+                pending.difference_update(files)
+                progress.commit(
+                    len(files),
+                    sum(stats[file][0] for file in files),
+                    sum(len(ids) for ids in file_node_ids.values()),
+                )
 
             if self.index is None:
                 # Create index with new documents
                 logging.info("Creating a new index with new documents...")
-                self.index = create_index(
+                try:
+                    self.index = create_index(
+                        docs,
+                        persist_dir=self._docstore_dir(),
+                        chroma_db_dir=self.chroma_db_dir,
+                        chroma_collection_name=self.chroma_collection_name,
+                        batch_size=self.insert_batch_size,
+                        node_ids=node_ids,
+                        embed_model=self.embed_model,
+                        keyword_index=self.keyword_index,
+                        hnsw_params=self.hnsw_params,
+                        shard_by=self.shard_by,
+                        input_dirs=self.input_dirs,
+                        deduplicate=self.deduplicate,
+                        on_commit=on_commit,
+                    )
+                except ValueError:
+                    logging.error("No new documents to index.")
+                    self.manifest.end_run()
+                    return
+            else:
+                # Replace previous versions of the changed files in the existing index
+                logging.info("Upserting new documents into the existing index...")
+                num_docs = upsert_documents(
+                    self.index,
                     docs,
-                    persist_dir=self.persist_dir,
-                    chroma_db_dir=self.chroma_db_dir,
-                    chroma_collection_name=self.chroma_collection_name,
+                    new_or_updated_files,
+                    persist_dir=self._docstore_dir(),
+                    batch_size=self.insert_batch_size,
+                    old_node_ids=self.manifest.get_node_ids(new_or_updated_files),
+                    node_ids=node_ids,
+                    keyword_index=self.keyword_index,
+                    deduplicate=self.deduplicate,
+                    on_commit=on_commit,
+                    resumed=resumed is not None,
                 )
-            else:
-                # Insert new documents into the existing index
-                logging.info("Inserting new documents into the existing index...")
-                for doc in docs:
-                    self.index.insert(doc)
-                # Persist the updated index
-                self.index.storage_context.persist(persist_dir=self.persist_dir)
+                self._invalidate_query_cache(changes["modified"])
+                if not num_docs and not duplicates:
+                    logging.error("No new documents to index.")
+                    self.manifest.end_run()
+                    return
 
-            # Update indexed files metadata
-            update_indexed_files(self.indexed_files, new_or_updated_files)
-            save_indexed_files(
-                self.indexed_files, indexed_files_path=self.indexed_files_path
-            )
+            if duplicates:
+                node_ids.update(
+                    self.manifest.get_node_ids(
+                        {
+                            original
+                            for original in duplicates.values()
+                            if original not in node_ids
+                        }
+                    )
+                )
+                link_duplicate_files(self.index, duplicates, node_ids)
+
+            # Record the copies and the files that produced no nodes, with an empty
+            # list so they are not retried until they change
+            remaining = [file for file in new_or_updated_files if file in pending]
+            with self.manifest.transaction():
+                self.manifest.checkpoint(
+                    {file: stats[file] for file in remaining},
+                    changes["hashes"],
+                    {file: node_ids.get(file, []) for file in remaining},
+                )
+                self.manifest.end_run()
+            progress.commit(len(remaining), sum(stats[file][0] for file in remaining))
+            progress.finish()
         else:
             if self.index is None:
                 logging.error("No existing index and no new documents to index.")
@@ -156,16 +521,152 @@ class OllamaRAG:
             else:
                 logging.info("No new or updated documents found.")
 
-        # Create query engine
+        self.setup_query_engine()
+
+    def _invalidate_query_cache(self, file_paths):
+        """Drop cached query results whose sources include any of the given files."""
+        if self.query_cache is None or not file_paths:
+            return
+        num_dropped = self.query_cache.invalidate_files(file_paths)
+        if num_dropped:
+            logging.info(f"Dropped {num_dropped} cached query results")
+
+    def _query_bundle(self, query_text):
+        """Build the query bundle, embedding the query up front for the semantic cache."""
+        embedding = None
+        if self.query_cache is not None and self.query_cache.semantic:
+            # The retriever reuses this embedding on a cache miss
+            embedding = self.embed_model.get_query_embedding(query_text)
+        return QueryBundle(query_text, embedding=embedding)
+
+    def _cache_settings(self):
+        """Return the settings a cached answer depends on besides the query."""
+        prompt = self.qa_prompt_template
+        if hasattr(prompt, "get_template"):
+            prompt = prompt.get_template()
+        reranker = self.reranker
+        return (
+            type(self.llm).__name__,
+            getattr(self.llm, "model", None),
+            prompt,
+            self.similarity_top_k,
+            self.keyword_top_k if self.keyword_index is not None else None,
+            (reranker.model_name, reranker.top_n) if reranker is not None else None,
+            self.context_token_budget,
+            self.context_tokenizer,
+        )
+
+    def _get_cached_result(self, query_bundle, filters=None):
+        """Return the cached result of a query, or None. Filtered queries are not cached."""
+        if self.query_cache is None or filters:
+            return None
+        result = self.query_cache.get(
+            query_bundle.query_str, query_bundle.embedding, self._cache_settings()
+        )
+        if result is not None:
+            logging.info(f"Answered query from the cache: {query_bundle.query_str}")
+        return result
+
+    def _cache_result(self, query_bundle, result, filters=None):
+        """Cache the result of a query, with its context packing stats."""
+        if self.query_cache is not None and not filters:
+            self.query_cache.put(
+                query_bundle.query_str,
+                {
+                    "response": result["response"],
+                    "sources": result["sources"],
+                    "context": result.get("context"),
+                },
+                query_bundle.embedding,
+                self._cache_settings(),
+            )
+
+    def _pack_context(self, nodes):
+        """Pack retrieved nodes into the context token budget with the LLM tokenizer."""
+        return pack_context(
+            nodes,
+            token_budget=self.context_token_budget,
+            tokenizer=self.context_tokenizer,
+        )
+
+    def _retrieve_context(self, query_engine, query_bundle):
+        """Retrieve the nodes for a query and pack them into the context token budget."""
+        nodes = query_engine.retrieve(query_bundle)
+        nodes, context = self._pack_context(nodes)
+        if context["packed_tokens"] is None:
+            logging.info(
+                f"Packed {context['packed_chunks']} of "
+                f"{context['retrieved_chunks']} chunks"
+            )
+        else:
+            logging.info(
+                f"Packed {context['packed_chunks']} of {context['retrieved_chunks']} "
+                f"chunks into {context['packed_tokens']} tokens "
+                f"({context['saved_tokens']} tokens saved)"
+            )
+        return nodes, context
+
+    def setup_query_engine(self):
+        """Create the query engine for the current index."""
+        if self.index is None:
+            logging.error("No index available to query.")
+            return
         logging.info("Setting up query engine...")
-        self.query_engine = create_query_engine(self.index, self.qa_prompt_template)
+        self.query_engine = create_query_engine(
+            self.index,
+            self.qa_prompt_template,
+            llm=self.llm,
+            similarity_top_k=self.similarity_top_k,
+            keyword_index=self.keyword_index,
+            keyword_top_k=self.keyword_top_k,
+            reranker=self.reranker,
+        )
+        self.streaming_query_engine = create_query_engine(
+            self.index,
+            self.qa_prompt_template,
+            llm=self.llm,
+            streaming=True,
+            similarity_top_k=self.similarity_top_k,
+            keyword_index=self.keyword_index,
+            keyword_top_k=self.keyword_top_k,
+            reranker=self.reranker,
+        )
 
-    def query(self, query_text=None):
+    def _filtered_query_engine(self, filters, streaming=False):
+        """
+        Return the query engine searching only the chunks that match the filters.
+
+        Returns the shared query engine if there are no filters, and None if no indexed
+        file matches them.
+        """
+        if not filters:
+            return self.streaming_query_engine if streaming else self.query_engine
+        metadata_filters, file_paths = build_metadata_filters(filters, self.manifest)
+        if file_paths is not None and not file_paths:
+            logging.info(f"No indexed files match the filters {filters}")
+            return None
+        return create_query_engine(
+            self.index,
+            self.qa_prompt_template,
+            llm=self.llm,
+            streaming=streaming,
+            similarity_top_k=self.similarity_top_k,
+            keyword_index=self.keyword_index,
+            keyword_top_k=self.keyword_top_k,
+            reranker=self.reranker,
+            filters=metadata_filters,
+            file_paths=file_paths,
+        )
+
+    def query(self, query_text=None, filters=None):
         """
         Run a query against the index and return the response along with meta information.
 
         Parameters:
         - query_text (str): The query to run.
+        - filters (dict, optional): Only search chunks matching these filters; any of
+          ``path_prefix``, ``extensions``, ``modified_after`` and ``sheet_name`` (see
+          build_metadata_filters).
 
         Returns:
         - dict: A dictionary containing the response and source metadata.
@@ -179,51 +680,392 @@ class OllamaRAG:
             )
             return {"response": "Query engine not initialized.", "sources": []}
 
-        try:
-            # Generate the response
-            logging.info(f"Running query: {query_text}")
-            response = self.query_engine.query(query_text)
-
-            # Extract source nodes and their metadata
-            source_nodes = response.source_nodes
-            sources = []
-            for node in source_nodes:
-                metadata = node.node.metadata
-                logging.debug(f"Node metadata: {metadata}")
-
-                source_info = {
-                    "document_id": metadata.get("file_name", "N/A"),
-                    "file_path": metadata.get("file_path", "N/A"),
-                    "page_number": metadata.get("page_label", "N/A"),
-                    "sheet_name": metadata.get("sheet_name", "N/A"),
-                    "text_snippet": node.node.get_text()[:200]
-                    + "...",  # get first 200 words
-                }
-                sources.append(source_info)
-
-            # Prepare the final response
-            result = {
-                "response": str(response),
-                "sources": sources,
+        query_engine = self._filtered_query_engine(filters)
+        if query_engine is None:
+            return {"response": NO_MATCHING_FILES, "sources": []}
+
+        with self._sync_query_semaphore:
+            try:
+                query_bundle = self._query_bundle(query_text)
+                result = self._get_cached_result(query_bundle, filters)
+                if result is not None:
+                    return result
+
+                # Generate the response
+                logging.info(f"Running query: {query_text}")
+                nodes, context = self._retrieve_context(query_engine, query_bundle)
+                response = query_engine.synthesize(query_bundle, nodes)
+                result = self._format_result(response)
+                result["context"] = context
+                self._cache_result(query_bundle, result, filters)
+                return result
+            except Exception as e:
+                logging.error(f"An error occurred during querying: {e}")
+                return {"response": QUERY_ERROR, "sources": []}
+
+    def _format_result(self, response):
+        """Turn a query engine response into the result dict returned by query()."""
+        sources = self._format_sources(response.source_nodes)
+
+        # Prepare the final response
+        result = {
+            "response": str(response),
+            "sources": sources,
+        }
+
+        return result
+
+    def _format_sources(self, source_nodes):
+        """Extract the metadata of the source nodes of a response."""
+        sources = []
+        for node in source_nodes:
+            metadata = node.node.metadata
+            logging.debug(f"Node metadata: {metadata}")
+
+            source_info = {
+                "document_id": metadata.get("file_name", "N/A"),
+                "file_path": metadata.get("file_path", "N/A"),
+                "page_number": metadata.get("page_label", "N/A"),
+                "sheet_name": metadata.get("sheet_name", "N/A"),
+                "source_paths": get_source_paths(metadata),
+                "rows": (
+                    f"{metadata['row_start']}-{metadata['row_end']}"
+                    if "row_start" in metadata
+                    else "N/A"
+                ),
+                "text_snippet": node.node.get_text()[:200]
+                + "...",  # get first 200 words
             }
+            sources.append(source_info)
+        return sources
+
+    def retrieve(self, query_text=None, top_k=None, pack=True, filters=None):
+        """
+        Retrieve the chunks relevant to a query without calling the LLM.
+
+        Parameters:
+        - query_text (str): The query to run.
+        - top_k (int, optional): Number of chunks to retrieve, before reranking if a
+          reranker is set. Defaults to similarity_top_k.
+        - pack (bool, optional): Deduplicate the chunks and fit them into the context
+          token budget, as query() does. Defaults to True.
+        - filters (dict, optional): Only search chunks matching these filters, as in
+          query().
+
+        Returns:
+        - dict: The scored ``nodes`` with their text and source metadata, the packed
+          ``context_str`` and the ``context`` token counts.
+        """
+        if query_text is None:
+            query_text = self.query_text
+
+        if self.index is None:
+            logging.error("No index available. Please run update_index() first.")
+            return {"nodes": [], "context_str": "", "context": None}
+
+        metadata_filters, file_paths = build_metadata_filters(filters, self.manifest)
+        if file_paths is not None and not file_paths:
+            logging.info(f"No indexed files match the filters {filters}")
+            return {"nodes": [], "context_str": "", "context": None}
+
+        if top_k is None:
+            top_k = self.similarity_top_k
+        retriever = create_retriever(
+            self.index,
+            similarity_top_k=top_k,
+            keyword_index=self.keyword_index,
+            keyword_top_k=self.keyword_top_k,
+            filters=metadata_filters,
+            file_paths=file_paths,
+        )
+        query_bundle = self._query_bundle(query_text)
+        nodes = retriever.retrieve(query_bundle)
+        if self.reranker is not None:
+            nodes = self.reranker.postprocess_nodes(nodes, query_bundle=query_bundle)
+        context = None
+        if pack:
+            nodes, context = self._pack_context(nodes)
+
+        results = []
+        for node, source in zip(nodes, self._format_sources(nodes)):
+            source.update(
+                node_id=node.node.node_id,
+                score=node.score,
+                text=node.node.get_content(),
+            )
+            del source["text_snippet"]
+            results.append(source)
+        return {
+            "nodes": results,
+            "context_str": "\n\n".join(
+                node.node.get_content(metadata_mode=MetadataMode.LLM) for node in nodes
+            ),
+            "context": context,
+        }
+
+    def _get_event_loop(self):
+        """Return the event loop that runs async queries, starting it if needed."""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever,
+                    name="ollama-rag-queries",
+                    daemon=True,
+                ).start()
+            return self._loop
+
+    async def _aquery(self, query_text, filters=None):
+        """Answer a query on the engine's event loop, at most query_concurrency at a time."""
+        if query_text is None:
+            query_text = self.query_text
+
+        if not hasattr(self, "query_engine"):
+            logging.error(
+                "Query engine not initialized. Please run update_index() first."
+            )
+            return {"response": "Query engine not initialized.", "sources": []}
+
+        query_engine = self._filtered_query_engine(filters)
+        if query_engine is None:
+            return {"response": NO_MATCHING_FILES, "sources": []}
+
+        if self._query_semaphore is None:
+            self._query_semaphore = asyncio.Semaphore(self.query_concurrency)
+
+        async with self._query_semaphore:
+            try:
+                # Embedding the query and searching Chroma block, so run them in a
+                # thread; generation uses the async Ollama client
+                loop = asyncio.get_running_loop()
+                query_bundle = await loop.run_in_executor(
+                    None, self._query_bundle, query_text
+                )
+                result = self._get_cached_result(query_bundle, filters)
+                if result is not None:
+                    return result
+
+                logging.info(f"Running query: {query_text}")
+                nodes, context = await loop.run_in_executor(
+                    None, self._retrieve_context, query_engine, query_bundle
+                )
+                response = await query_engine.asynthesize(query_bundle, nodes)
+                result = self._format_result(response)
+                result["context"] = context
+                self._cache_result(query_bundle, result, filters)
+                return result
+            except Exception as e:
+                logging.error(f"An error occurred during querying: {e}")
+                return {"response": QUERY_ERROR, "sources": []}
+
+    async def aquery(self, query_text=None, filters=None):
+        """
+        Asynchronous version of query().
+
+        Queries from any event loop run on the engine's own event loop, so they share its
+        pooled Ollama connections and at most ``query_concurrency`` are answered at once.
+
+        Parameters:
+        - query_text (str): The query to run.
+        - filters (dict, optional): Only search chunks matching these filters.
+
+        Returns:
+        - dict: A dictionary containing the response and source metadata.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self._aquery(query_text, filters), self._get_event_loop()
+        )
+        return await asyncio.wrap_future(future)
+
+    def query_many(self, query_texts, filters=None):
+        """
+        Answer several queries concurrently.
+
+        Parameters:
+        - query_texts (List[str]): The queries to run.
+        - filters (dict, optional): Only search chunks matching these filters.
+
+        Returns:
+        - List[dict]: The results of query(), in the order of query_texts.
+        """
+
+        async def run_queries():
+            return await asyncio.gather(
+                *(self._aquery(query_text, filters) for query_text in query_texts)
+            )
+
+        return asyncio.run_coroutine_threadsafe(
+            run_queries(), self._get_event_loop()
+        ).result()
+
+    def _not_ready_stream(self, start_time, loop=None):
+        """Return a stream answering that the query engine is not initialized."""
+        logging.error("Query engine not initialized. Please run update_index() first.")
+        message = "Query engine not initialized."
+        if loop is None:
+            return QueryStream([], iter([message]), start_time)
+
+        async def tokens():
+            yield message
+
+        return QueryStream([], tokens(), start_time, loop=loop)
 
-            return result
+    def stream_query(self, query_text=None, filters=None):
+        """
+        Run a query and stream the answer as the LLM generates it.
+
+        Parameters:
+        - query_text (str): The query to run.
+        - filters (dict, optional): Only search chunks matching these filters.
+
+        Returns:
+        - QueryStream: Iterable over the answer tokens, with the sources available
+          immediately and the time to first token once the first token arrives. The
+          query holds one of the ``query_concurrency`` slots of query() until the
+          stream is read to the end or closed.
+        """
+        if query_text is None:
+            query_text = self.query_text
+        start_time = time.perf_counter()
+
+        if not hasattr(self, "streaming_query_engine"):
+            return self._not_ready_stream(start_time)
+
+        query_engine = self._filtered_query_engine(filters, streaming=True)
+        if query_engine is None:
+            return QueryStream([], iter([NO_MATCHING_FILES]), start_time)
+
+        self._sync_query_semaphore.acquire()
+        try:
+            query_bundle = self._query_bundle(query_text)
+            result = self._get_cached_result(query_bundle, filters)
+            if result is not None:
+                self._sync_query_semaphore.release()
+                return QueryStream(
+                    result["sources"],
+                    iter([result["response"]]),
+                    start_time,
+                    context=result.get("context"),
+                )
+
+            logging.info(f"Streaming query: {query_text}")
+            nodes, context = self._retrieve_context(query_engine, query_bundle)
+            response = query_engine.synthesize(query_bundle, nodes)
+            sources = self._format_sources(response.source_nodes)
         except Exception as e:
+            self._sync_query_semaphore.release()
             logging.error(f"An error occurred during querying: {e}")
-            return {
-                "response": "An error occurred while processing your query.",
-                "sources": [],
-            }
+            return QueryStream([], iter([QUERY_ERROR]), start_time)
+        return QueryStream(
+            sources,
+            SlotTokens(response.response_gen, self._sync_query_semaphore.release),
+            start_time,
+            context=context,
+            on_complete=lambda stream: self._cache_result(
+                query_bundle, stream.to_dict(), filters
+            ),
+        )
 
+    async def _astream_query(self, query_text, query_engine, filters=None):
+        """
+        Retrieve on the engine's event loop and start streaming the answer.
 
-def main():
-    parser = argparse.ArgumentParser(description="Run the Ollama RAG query engine.")
-    parser.add_argument(
-        "--query",
-        type=str,
-        required=True,
-        help="The query to run against the index.",
-    )
+        The query's semaphore slot is held by the returned token generator until the
+        answer has been generated, so generation counts against query_concurrency.
+        """
+        if self._query_semaphore is None:
+            self._query_semaphore = asyncio.Semaphore(self.query_concurrency)
+
+        async def tokens(*items):
+            for item in items:
+                yield item
+
+        await self._query_semaphore.acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            query_bundle = await loop.run_in_executor(
+                None, self._query_bundle, query_text
+            )
+            result = self._get_cached_result(query_bundle, filters)
+            if result is not None:
+                self._query_semaphore.release()
+                return (
+                    query_bundle,
+                    result["sources"],
+                    result.get("context"),
+                    tokens(result["response"]),
+                    True,
+                )
+
+            logging.info(f"Streaming query: {query_text}")
+            nodes, context = await loop.run_in_executor(
+                None, self._retrieve_context, query_engine, query_bundle
+            )
+            response = await query_engine.asynthesize(query_bundle, nodes)
+            sources = self._format_sources(response.source_nodes)
+        except Exception as e:
+            self._query_semaphore.release()
+            logging.error(f"An error occurred during querying: {e}")
+            return None, [], None, tokens(QUERY_ERROR), True
+        return (
+            query_bundle,
+            sources,
+            context,
+            AsyncSlotTokens(response.response_gen, self._query_semaphore, loop),
+            False,
+        )
+
+    async def astream_query(self, query_text=None, filters=None):
+        """
+        Asynchronous version of stream_query(); read the returned stream with async for.
+
+        Parameters:
+        - query_text (str): The query to run.
+        - filters (dict, optional): Only search chunks matching these filters.
+
+        Returns:
+        - QueryStream: Async iterable over the answer tokens.
+        """
+        if query_text is None:
+            query_text = self.query_text
+        start_time = time.perf_counter()
+        loop = self._get_event_loop()
+
+        if not hasattr(self, "streaming_query_engine"):
+            return self._not_ready_stream(start_time, loop=loop)
+
+        query_engine = self._filtered_query_engine(filters, streaming=True)
+        if query_engine is None:
+
+            async def no_match():
+                yield NO_MATCHING_FILES
+
+            return QueryStream([], no_match(), start_time, loop=loop)
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._astream_query(query_text, query_engine, filters), loop
+        )
+        query_bundle, sources, context, token_gen, cached = await asyncio.wrap_future(
+            future
+        )
+        if cached:
+            return QueryStream(
+                sources, token_gen, start_time, loop=loop, context=context
+            )
+        return QueryStream(
+            sources,
+            token_gen,
+            start_time,
+            loop=loop,
+            context=context,
+            on_complete=lambda stream: self._cache_result(
+                query_bundle, stream.to_dict(), filters
+            ),
+        )
+
+
+def add_engine_arguments(parser):
+    """Add the index and storage options shared by the command line tools."""
     parser.add_argument(
         "--input_dirs",
         type=str,
@@ -278,16 +1120,60 @@ def main():
         "--indexed_files_path",
         type=str,
         default=INDEXED_FILES_PATH,
-        help="Path to the file tracking indexed documents.",
+        help="Path to a legacy indexed_files.json to import into the manifest.",
+    )
+    parser.add_argument(
+        "--manifest_path",
+        type=str,
+        default=MANIFEST_PATH,
+        help="Path to the SQLite manifest tracking indexed documents.",
+    )
+    parser.add_argument(
+        "--embedding_model_name",
+        type=str,
+        default=EMBEDDING_MODEL_NAME,
+        help="Name of the HuggingFace embedding model.",
+    )
+    parser.add_argument(
+        "--embedding_backend",
+        choices=["huggingface", "onnx"],
+        default=EMBEDDING_BACKEND,
+        help="Run the embedding model with PyTorch or with ONNX Runtime (int8).",
+    )
+    parser.add_argument(
+        "--shard_by",
+        choices=["input_dir", "file_type"],
+        default=SHARD_BY,
+        help="Split the index into one collection per input directory or file type.",
+    )
+    parser.add_argument(
+        "--keyword_index_path",
+        type=str,
+        default=KEYWORD_INDEX_PATH,
+        help="Path to the SQLite keyword index used for hybrid search.",
+    )
+    parser.add_argument(
+        "--no_hybrid_search",
+        dest="hybrid_search",
+        action="store_false",
+        help="Retrieve by vector similarity only, without the keyword index.",
     )
+    parser.add_argument(
+        "--no_deduplicate",
+        dest="deduplicate",
+        action="store_false",
+        default=DEDUPLICATE,
+        help="Index identical files and chunks once per path instead of once in total.",
+    )
+    return parser
 
-    args = parser.parse_args()
 
-    # Initialize the OllamaRAG engine with provided configurations
-    engine = OllamaRAG(
+def engine_from_args(args, query=None):
+    """Build an OllamaRAG engine from parsed command line arguments."""
+    return OllamaRAG(
         model_name=MODEL_NAME,
         request_timeout=120.0,
-        embedding_model_name=EMBEDDING_MODEL_NAME,
+        embedding_model_name=args.embedding_model_name,
         trust_remote_code=True,
         input_dirs=args.input_dirs,
         required_exts=args.required_exts,
@@ -296,15 +1182,50 @@ def main():
         chroma_db_dir=args.chroma_db_dir,
         chroma_collection_name=args.chroma_collection_name,
         indexed_files_path=args.indexed_files_path,
-        query=args.query,
+        manifest_path=args.manifest_path,
+        hybrid_search=args.hybrid_search,
+        keyword_index_path=args.keyword_index_path,
+        embedding_backend=args.embedding_backend,
+        shard_by=args.shard_by,
+        deduplicate=args.deduplicate,
+        query=query,
         qa_prompt_template=qa_prompt_template,
     )
 
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Ollama RAG query engine.")
+    parser.add_argument(
+        "--query",
+        type=str,
+        required=True,
+        help="The query to run against the index.",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Print the answer as it is generated.",
+    )
+    add_engine_arguments(parser)
+
+    args = parser.parse_args()
+
+    # Initialize the OllamaRAG engine with provided configurations
+    engine = engine_from_args(args, query=args.query)
+
     # Update the index with new or updated documents
     engine.update_index()
 
     # Run the query
-    result = engine.query()
+    if args.stream:
+        stream = engine.stream_query()
+        for token in stream:
+            print(token, end="", flush=True)
+        print()
+        result = stream.to_dict()
+        del result["response"]
+    else:
+        result = engine.query()
     print(result)
 
 
@@ -0,0 +1,124 @@
+# progress.py
+
+import time
+import logging
+import threading
+
+from ollama_rag.configs import PROGRESS_LOG_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+def format_duration(seconds):
+    """Format a number of seconds as H:MM:SS."""
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class IndexingProgress:
+    """
+    Progress of a bulk indexing run, counted in committed files.
+
+    A file counts as done once its chunks are in ChromaDB and it is recorded in the
+    manifest, so the counts never include work that would be lost in a crash. The ETA is
+    estimated from the bytes committed so far, which tracks the work left better than the
+    file count when file sizes vary. Snapshots can be read from other threads, e.g. by
+    the server's health endpoint, while the run is in progress.
+    """
+
+    def __init__(
+        self,
+        total_files,
+        total_bytes,
+        resumed_files=0,
+        log_interval=PROGRESS_LOG_INTERVAL,
+    ):
+        """
+        Parameters:
+        - total_files (int): Files to index in this run.
+        - total_bytes (int): Total size of those files.
+        - resumed_files (int, optional): Files committed by an interrupted earlier run.
+        - log_interval (float, optional): Seconds between progress log lines.
+        """
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.resumed_files = resumed_files
+        self.log_interval = log_interval
+        self.files_done = 0
+        self.bytes_done = 0
+        self.chunks_done = 0
+        self.finished = False
+        self._started = time.monotonic()
+        self._last_log = self._started
+        self._elapsed = None
+        self._lock = threading.Lock()
+
+    def commit(self, num_files, num_bytes, num_chunks=0):
+        """Count files whose chunks were committed, logging progress now and then."""
+        with self._lock:
+            self.files_done += num_files
+            self.bytes_done += num_bytes
+            self.chunks_done += num_chunks
+            now = time.monotonic()
+            if now - self._last_log < self.log_interval:
+                return
+            self._last_log = now
+        logger.info(self.describe())
+
+    def finish(self):
+        """Mark the run as finished and log the totals."""
+        with self._lock:
+            self.finished = True
+            self._elapsed = time.monotonic() - self._started
+        logger.info(self.describe())
+
+    def snapshot(self):
+        """
+        Return the progress of the run.
+
+        Returns:
+        - dict: Files, bytes and chunks done, percent done, elapsed seconds, files per
+          second and the estimated seconds left (None until the first commit).
+        """
+        with self._lock:
+            elapsed = self._elapsed
+            if elapsed is None:
+                elapsed = time.monotonic() - self._started
+            if self.total_bytes:
+                fraction = self.bytes_done / self.total_bytes
+            elif self.total_files:
+                fraction = self.files_done / self.total_files
+            else:
+                fraction = 1.0
+            eta = None
+            if self.finished:
+                eta = 0.0
+            elif fraction > 0:
+                eta = elapsed * (1 - fraction) / fraction
+            return {
+                "files_done": self.files_done,
+                "files_total": self.total_files,
+                "resumed_files": self.resumed_files,
+                "bytes_done": self.bytes_done,
+                "bytes_total": self.total_bytes,
+                "chunks_done": self.chunks_done,
+                "percent": round(100 * fraction, 1),
+                "elapsed_s": round(elapsed, 1),
+                "files_per_s": round(self.files_done / elapsed, 2) if elapsed else 0.0,
+                "eta_s": None if eta is None else round(eta, 1),
+                "finished": self.finished,
+            }
+
+    def describe(self):
+        """Return a one-line summary of the progress for the logs."""
+        stats = self.snapshot()
+        line = (
+            f"Indexed {stats['files_done']}/{stats['files_total']} files "
+            f"({stats['percent']}%, {stats['chunks_done']} chunks) in "
+            f"{format_duration(stats['elapsed_s'])}"
+        )
+        if not stats["finished"]:
+            line += f", {stats['files_per_s']} files/s"
+            if stats["eta_s"] is not None:
+                line += f", ETA {format_duration(stats['eta_s'])}"
+        return line
@@ -0,0 +1,176 @@
+# query_cache.py
+
+import re
+import copy
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from ollama_rag.configs import (
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_TTL,
+    QUERY_CACHE_SIMILARITY,
+)
+
+
+def normalize_query(query_text):
+    """Normalize a query for exact matching: lower case, single spaces, no end punctuation."""
+    query_text = re.sub(r"\s+", " ", query_text.lower()).strip()
+    return query_text.rstrip("?!. ")
+
+
+def _unit_vector(embedding):
+    """Return the embedding as a float32 vector of length 1."""
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class QueryCache:
+    """
+    In-memory cache of query results in front of the query engine.
+
+    Results are looked up by normalized query text and the ``settings`` they were
+    produced with (the LLM, prompt and retrieval settings), so changing any of them
+    never returns a result made with the old ones. If ``similarity_threshold`` is
+    set, a query whose embedding has at least that cosine similarity to a cached query
+    embedding reuses its result as well. Entries expire after ``ttl`` seconds and the
+    least recently used entry is evicted once ``max_entries`` are cached. Each entry
+    remembers the files its sources came from, so it can be dropped when one of them is
+    re-indexed, renamed or deleted.
+    """
+
+    def __init__(
+        self,
+        max_entries=QUERY_CACHE_SIZE,
+        ttl=QUERY_CACHE_TTL,
+        similarity_threshold=QUERY_CACHE_SIMILARITY,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.misses = 0
+        # (settings, normalized query) -> {"result", "file_paths", "embedding",
+        # "created_at"}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def semantic(self):
+        """Whether similar queries are matched by embedding."""
+        return self.similarity_threshold is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _is_expired(self, entry, now):
+        return self.ttl is not None and now - entry["created_at"] > self.ttl
+
+    def _find_similar(self, embedding, now, settings):
+        """Return the key of the most similar cached query above the threshold."""
+        keys, vectors = [], []
+        for key, entry in self._entries.items():
+            if (
+                key[0] == settings
+                and entry["embedding"] is not None
+                and not self._is_expired(entry, now)
+            ):
+                keys.append(key)
+                vectors.append(entry["embedding"])
+        if not keys:
+            return None
+        similarities = np.stack(vectors) @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.similarity_threshold:
+            return keys[best]
+        return None
+
+    def get(self, query_text, embedding=None, settings=None):
+        """
+        Return a copy of the cached result for a query, or None on a miss.
+
+        Parameters:
+        - query_text (str): The query.
+        - embedding (List[float], optional): The query embedding, used for the semantic
+          lookup when the exact lookup misses.
+        - settings (hashable, optional): The settings the result must have been produced
+          with, as passed to put().
+
+        Returns:
+        - dict or None: The cached result.
+        """
+        key = (settings, normalize_query(query_text))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry is None and self.semantic and embedding is not None:
+                key = self._find_similar(_unit_vector(embedding), now, settings)
+                entry = self._entries.get(key) if key is not None else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry["result"])
+
+    def put(self, query_text, result, embedding=None, settings=None):
+        """
+        Cache a copy of the result of a query.
+
+        The file paths of its sources are used for invalidation, and ``settings`` (any
+        hashable value) records what else the result depends on.
+        """
+        if not self.max_entries:
+            return
+        file_paths = {
+            source["file_path"]
+            for source in result.get("sources", [])
+            if source.get("file_path") not in (None, "N/A")
+        }
+        entry = {
+            "result": copy.deepcopy(result),
+            "file_paths": file_paths,
+            "embedding": (
+                _unit_vector(embedding)
+                if self.semantic and embedding is not None
+                else None
+            ),
+            "created_at": time.time(),
+        }
+        with self._lock:
+            key = (settings, normalize_query(query_text))
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_files(self, file_paths):
+        """
+        Drop the cached results that have a source in any of the given files.
+
+        Returns:
+        - int: The number of results dropped.
+        """
+        file_paths = set(file_paths)
+        if not file_paths:
+            return 0
+        with self._lock:
+            stale = [
+                key
+                for key, entry in self._entries.items()
+                if not entry["file_paths"].isdisjoint(file_paths)
+            ]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        """Drop every cached result."""
+        with self._lock:
+            self._entries.clear()
@@ -1,10 +1,333 @@
 # query_engine.py
 
+import time
+import asyncio
 
-def create_query_engine(index, qa_prompt_template=None):
-    """Set up the query engine."""
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore
+
+from ollama_rag.configs import SIMILARITY_TOP_K, KEYWORD_TOP_K, RRF_K
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever fusing vector search with BM25 keyword search by reciprocal rank.
+
+    Each chunk scores the sum of 1 / (rrf_k + rank) over the result lists it appears
+    in, so exact identifiers found only by the keyword index still reach the top.
+    With ``filters``, keyword search is limited to ``file_paths`` and only the chunks
+    matching the filters are kept.
+    """
+
+    def __init__(
+        self,
+        vector_retriever,
+        keyword_index,
+        vector_store,
+        similarity_top_k=SIMILARITY_TOP_K,
+        keyword_top_k=KEYWORD_TOP_K,
+        rrf_k=RRF_K,
+        filters=None,
+        file_paths=None,
+    ):
+        super().__init__()
+        self.vector_retriever = vector_retriever
+        self.keyword_index = keyword_index
+        self.vector_store = vector_store
+        self.similarity_top_k = similarity_top_k
+        self.keyword_top_k = keyword_top_k
+        self.rrf_k = rrf_k
+        self.filters = filters
+        self.file_paths = file_paths
+
+    def _retrieve(self, query_bundle):
+        vector_nodes = self.vector_retriever.retrieve(query_bundle)
+        keyword_hits = self.keyword_index.search(
+            query_bundle.query_str, self.keyword_top_k, file_paths=self.file_paths
+        )
+
+        scores, nodes = {}, {}
+        for rank, node_with_score in enumerate(vector_nodes):
+            node_id = node_with_score.node.node_id
+            scores[node_id] = scores.get(node_id, 0.0) + 1 / (self.rrf_k + rank + 1)
+            nodes[node_id] = node_with_score.node
+        for rank, (node_id, _) in enumerate(keyword_hits):
+            scores[node_id] = scores.get(node_id, 0.0) + 1 / (self.rrf_k + rank + 1)
+
+        # Fetch the chunks that only the keyword index found, if they match the filters
+        missing = [node_id for node_id in scores if node_id not in nodes]
+        if missing:
+            for node in self.vector_store.get_nodes(
+                node_ids=missing, filters=self.filters
+            ):
+                nodes[node.node_id] = node
+
+        ranked = sorted(
+            (node_id for node_id in scores if node_id in nodes),
+            key=scores.get,
+            reverse=True,
+        )
+        return [
+            NodeWithScore(node=nodes[node_id], score=scores[node_id])
+            for node_id in ranked[: self.similarity_top_k]
+        ]
+
+
+def create_retriever(
+    index,
+    similarity_top_k=SIMILARITY_TOP_K,
+    keyword_index=None,
+    filters=None,
+    file_paths=None,
+    keyword_top_k=None,
+):
+    """
+    Create the retriever of an index, hybrid if a keyword index is given.
+
+    ``filters`` (MetadataFilters) are applied by the vector store during the search,
+    and ``file_paths`` limits keyword search to the files the filters match. Keyword
+    search returns ``keyword_top_k`` chunks, by default as many as vector search but
+    at least KEYWORD_TOP_K.
+    """
+    vector_retriever = index.as_retriever(
+        similarity_top_k=similarity_top_k, filters=filters
+    )
+    if keyword_index is None:
+        return vector_retriever
+    if keyword_top_k is None:
+        keyword_top_k = max(KEYWORD_TOP_K, similarity_top_k)
+    return HybridRetriever(
+        vector_retriever,
+        keyword_index,
+        index.vector_store,
+        similarity_top_k=similarity_top_k,
+        keyword_top_k=keyword_top_k,
+        filters=filters,
+        file_paths=file_paths,
+    )
+
+
+def create_query_engine(
+    index,
+    qa_prompt_template=None,
+    llm=None,
+    streaming=False,
+    similarity_top_k=SIMILARITY_TOP_K,
+    keyword_index=None,
+    reranker=None,
+    filters=None,
+    file_paths=None,
+    keyword_top_k=None,
+):
+    """
+    Set up the query engine, answering with llm or Settings.llm if it is not given.
+
+    With ``streaming``, queries return the answer as a token generator. Each query
+    retrieves ``similarity_top_k`` chunks, fusing vector and keyword search results if
+    a ``keyword_index`` is given, among the chunks matching the metadata ``filters``
+    (see create_retriever). A ``reranker`` then narrows them down to the chunks passed
+    to the LLM.
+    """
     try:
-        query_engine = index.as_query_engine(text_qa_template=qa_prompt_template)
+        query_engine = RetrieverQueryEngine.from_args(
+            create_retriever(
+                index,
+                similarity_top_k,
+                keyword_index,
+                filters,
+                file_paths,
+                keyword_top_k,
+            ),
+            llm=llm,
+            text_qa_template=qa_prompt_template,
+            streaming=streaming,
+            node_postprocessors=[reranker] if reranker is not None else None,
+        )
         return query_engine
     except Exception as e:
         raise Exception(f"Failed to create query engine: {e}")
+
+
+class SlotTokens:
+    """
+    Iterator over answer tokens that holds a query slot until the answer is complete.
+
+    ``release`` is called once, when the tokens are exhausted, generation fails, or the
+    iterator is closed or garbage collected, so an abandoned stream never keeps its slot.
+    """
+
+    def __init__(self, tokens, release):
+        self._tokens = iter(tokens)
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._release is None:
+            raise StopIteration
+        try:
+            return next(self._tokens)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        release, self._release = self._release, None
+        if release is None:
+            return
+        try:
+            close = getattr(self._tokens, "close", None)
+            if close is not None:
+                close()
+        finally:
+            release()
+
+    def __del__(self):
+        self.close()
+
+
+class AsyncSlotTokens:
+    """
+    Async version of SlotTokens, holding an asyncio.Semaphore slot of ``loop``.
+
+    The semaphore is released on its own loop, also when the iterator is garbage
+    collected from another thread.
+    """
+
+    def __init__(self, tokens, semaphore, loop):
+        self._tokens = tokens
+        self._semaphore = semaphore
+        self._loop = loop
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._semaphore is None:
+            raise StopAsyncIteration
+        try:
+            return await self._tokens.__anext__()
+        except BaseException:
+            await self.aclose()
+            raise
+
+    async def aclose(self):
+        semaphore, self._semaphore = self._semaphore, None
+        if semaphore is None:
+            return
+        try:
+            aclose = getattr(self._tokens, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        finally:
+            semaphore.release()
+
+    def __del__(self):
+        semaphore, self._semaphore = self._semaphore, None
+        if semaphore is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(semaphore.release)
+
+
+class QueryStream:
+    """
+    The answer to a query, streamed token by token as the LLM generates it.
+
+    ``sources`` is available as soon as retrieval has finished, before any token. Iterate
+    over the stream to receive the tokens (with ``async for`` if it came from an async
+    query); afterwards ``response`` holds the whole answer. ``ttft_ms`` is the time from
+    the start of the query to the first token and ``latency_ms`` the time to the last.
+    A stream that is not read to the end should be closed with close() or aclose().
+    """
+
+    def __init__(
+        self,
+        sources,
+        token_gen,
+        start_time,
+        loop=None,
+        on_complete=None,
+        context=None,
+    ):
+        self.sources = sources
+        # Context packing stats of the retrieved chunks, as in query()'s "context"
+        self.context = context
+        self.response = ""
+        self.ttft_ms = None
+        self.latency_ms = None
+        self._token_gen = token_gen
+        self._start_time = start_time
+        # Event loop the async token generator has to run on
+        self._loop = loop
+        # Called with the stream once the whole answer has been generated
+        self._on_complete = on_complete
+
+    def _record(self, token):
+        if self.ttft_ms is None:
+            self.ttft_ms = (time.perf_counter() - self._start_time) * 1000
+        self.response += token
+
+    def _finish(self):
+        self.latency_ms = (time.perf_counter() - self._start_time) * 1000
+        if self.ttft_ms is None:
+            # Nothing was generated; the answer is empty
+            self.ttft_ms = self.latency_ms
+        if self._on_complete is not None:
+            self._on_complete(self)
+
+    def __iter__(self):
+        if self._loop is not None:
+            raise TypeError("Use 'async for' to read an async query stream.")
+        try:
+            for token in self._token_gen:
+                self._record(token)
+                yield token
+        finally:
+            # Also stops generation when the reader gives up early
+            self.close()
+        self._finish()
+
+    async def __aiter__(self):
+        if self._loop is None:
+            raise TypeError("Use 'for' to read a query stream.")
+        try:
+            while True:
+                future = asyncio.run_coroutine_threadsafe(
+                    self._token_gen.__anext__(), self._loop
+                )
+                try:
+                    token = await asyncio.wrap_future(future)
+                except StopAsyncIteration:
+                    break
+                self._record(token)
+                yield token
+        finally:
+            await self.aclose()
+        self._finish()
+
+    def close(self):
+        """Stop generating the answer of a stream that is not read to the end."""
+        close = getattr(self._token_gen, "close", None)
+        if close is not None:
+            close()
+
+    async def aclose(self):
+        """Async version of close(), for streams from async queries."""
+        aclose = getattr(self._token_gen, "aclose", None)
+        if aclose is not None:
+            await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(aclose(), self._loop)
+            )
+
+    def to_dict(self):
+        """Return the result in the format of OllamaRAG.query() plus its latencies."""
+        return {
+            "response": self.response,
+            "sources": self.sources,
+            "ttft_ms": None if self.ttft_ms is None else round(self.ttft_ms, 1),
+            "latency_ms": (
+                None if self.latency_ms is None else round(self.latency_ms, 1)
+            ),
+            "context": self.context,
+        }
@@ -0,0 +1,148 @@
+# reranker.py
+
+import logging
+import threading
+import importlib.util
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+
+from ollama_rag.configs import (
+    RERANK_MODEL_NAME,
+    RERANK_TOP_N,
+    RERANK_BATCH_SIZE,
+    RERANK_MAX_LENGTH,
+    RERANK_MIN_SCORE,
+    RERANK_CACHE_SIZE,
+)
+
+
+class CrossEncoderReranker(BaseNodePostprocessor):
+    """
+    Rerank retrieved nodes with a local cross-encoder and keep the best ``top_n``.
+
+    The cross-encoder is loaded on CPU the first time nodes are reranked. Candidates are
+    scored in batches of ``batch_size`` query/chunk pairs, and scores are cached per
+    (query, chunk content) so repeated queries only score chunks they have not seen.
+    Nodes scoring below ``min_score`` are cut as well, but the best node is always kept.
+    """
+
+    model_name: str = Field(default=RERANK_MODEL_NAME)
+    top_n: int = Field(default=RERANK_TOP_N)
+    batch_size: int = Field(default=RERANK_BATCH_SIZE)
+    max_length: int = Field(default=RERANK_MAX_LENGTH)
+    min_score: Optional[float] = Field(default=RERANK_MIN_SCORE)
+    cache_size: int = Field(default=RERANK_CACHE_SIZE)
+    device: str = Field(default="cpu")
+
+    _model: Any = PrivateAttr(default=None)
+    _model_lock: Any = PrivateAttr()
+    # (query, node hash) -> score, least recently used first
+    _scores: Any = PrivateAttr()
+    _scores_lock: Any = PrivateAttr()
+
+    def __init__(self, **kwargs):
+        # Check for the dependency now, but only import it when the model is loaded
+        if importlib.util.find_spec("sentence_transformers") is None:
+            raise ImportError(
+                "Reranking requires sentence-transformers. Install it with "
+                "`pip install ollama-rag[rerank]`, or set rerank=False."
+            )
+        super().__init__(**kwargs)
+        self._model_lock = threading.Lock()
+        self._scores = OrderedDict()
+        self._scores_lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CrossEncoderReranker"
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = self._load_model()
+        return self._model
+
+    def _load_model(self):
+        # Importing sentence_transformers pulls in torch and transformers
+        from sentence_transformers import CrossEncoder
+
+        logging.info(f"Loading reranker model {self.model_name}...")
+        return CrossEncoder(
+            self.model_name, max_length=self.max_length, device=self.device
+        )
+
+    def _cached_scores(self, keys):
+        """Return the cached scores of the given keys, None for the ones not cached."""
+        with self._scores_lock:
+            scores = []
+            for key in keys:
+                score = self._scores.get(key)
+                if score is not None:
+                    self._scores.move_to_end(key)
+                scores.append(score)
+            return scores
+
+    def _cache_scores(self, keys, scores):
+        if not self.cache_size:
+            return
+        with self._scores_lock:
+            for key, score in zip(keys, scores):
+                self._scores[key] = score
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+
+    def score(self, query_str, nodes):
+        """
+        Score how relevant each node is to a query.
+
+        Parameters:
+        - query_str (str): The query.
+        - nodes (List[NodeWithScore]): The nodes to score.
+
+        Returns:
+        - List[float]: The cross-encoder score of each node, higher is more relevant.
+        """
+        keys = [(query_str, node.node.hash) for node in nodes]
+        scores = self._cached_scores(keys)
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            pairs = [
+                (query_str, nodes[i].node.get_content(metadata_mode=MetadataMode.EMBED))
+                for i in missing
+            ]
+            new_scores = self.model.predict(
+                pairs, batch_size=self.batch_size, show_progress_bar=False
+            )
+            for i, score in zip(missing, new_scores):
+                scores[i] = float(score)
+            self._cache_scores([keys[i] for i in missing], [scores[i] for i in missing])
+        logging.debug(
+            f"Reranked {len(nodes)} nodes, {len(nodes) - len(missing)} scores cached"
+        )
+        return scores
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Reranking needs the query.")
+        if not nodes:
+            return []
+
+        scores = self.score(query_bundle.query_str, nodes)
+        ranked = sorted(zip(scores, nodes), key=lambda pair: pair[0], reverse=True)
+        reranked = []
+        for score, node in ranked[: self.top_n]:
+            if reranked and self.min_score is not None and score < self.min_score:
+                break
+            reranked.append(NodeWithScore(node=node.node, score=score))
+        return reranked
@@ -0,0 +1,528 @@
+# server.py
+
+import os
+import json
+import time
+import socket
+import logging
+import argparse
+import threading
+import http.client
+import socketserver
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ollama_rag.ollama_rag import add_engine_arguments, engine_from_args
+from ollama_rag.watcher import IndexWatcher
+from ollama_rag.configs import (
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_SOCKET,
+    REINDEX_INTERVAL,
+)
+
+LATENCY_WINDOW = 1000  # Number of recent requests used for latency percentiles
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(values, fraction):
+    """Return the value at the given fraction (0-1) of the sorted values."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class RAGService:
+    """
+    Keeps an OllamaRAG engine warm and re-indexes it in the background.
+
+    Queries are answered with the current query engine while a re-index runs; the new
+    query engine is swapped in once the update has finished. Re-indexing runs every
+    ``reindex_interval`` seconds and whenever it is requested. With ``watch``, an
+    IndexWatcher also updates the index with the files that change in between.
+    """
+
+    def __init__(self, engine, reindex_interval=REINDEX_INTERVAL, watch=False):
+        self.engine = engine
+        self.reindex_interval = reindex_interval
+        self.started_at = time.time()
+        self.watcher = IndexWatcher(engine, update=self.reindex) if watch else None
+
+        self._reindex_lock = threading.Lock()
+        self._reindex_requested = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._ttfts = deque(maxlen=LATENCY_WINDOW)
+        self._num_queries = 0
+        self._num_errors = 0
+        self._last_reindex = None
+
+        if getattr(engine, "index", None) is not None:
+            # Serve the existing index right away; the first re-index runs in the background
+            engine.setup_query_engine()
+
+    def query(self, query_text, filters=None):
+        """Run a query and add its latency in milliseconds to the result."""
+        start = time.perf_counter()
+        try:
+            result = self.engine.query(query_text, filters=filters)
+        except Exception:
+            with self._stats_lock:
+                self._num_errors += 1
+            raise
+        latency_ms = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self._num_queries += 1
+            self._latencies.append(latency_ms)
+        logger.info(f"Answered query in {latency_ms:.1f} ms")
+        return dict(result, latency_ms=round(latency_ms, 1))
+
+    def stream_query(self, query_text, filters=None):
+        """
+        Stream the answer to a query, recording its time to first token and latency.
+
+        Yields the list of sources first, then the answer tokens, then the QueryStream.
+        """
+        try:
+            stream = self.engine.stream_query(query_text, filters=filters)
+            yield stream.sources
+            for token in stream:
+                yield token
+        except Exception:
+            with self._stats_lock:
+                self._num_errors += 1
+            raise
+        with self._stats_lock:
+            self._num_queries += 1
+            self._latencies.append(stream.latency_ms)
+            self._ttfts.append(stream.ttft_ms)
+        logger.info(
+            f"Streamed answer, first token after {stream.ttft_ms:.1f} ms, "
+            f"last after {stream.latency_ms:.1f} ms"
+        )
+        yield stream
+
+    def reindex(self, file_paths=None):
+        """
+        Update the index now, waiting for a running update to finish first.
+
+        Parameters:
+        - file_paths (List[str], optional): Only update these files and folders.
+        """
+        with self._reindex_lock:
+            start = time.perf_counter()
+            try:
+                self.engine.update_index(file_paths)
+                error = None
+            except Exception as e:
+                logger.error(f"Re-indexing failed: {e}")
+                error = str(e)
+            duration = time.perf_counter() - start
+        with self._stats_lock:
+            self._last_reindex = {
+                "finished_at": time.time(),
+                "duration_s": round(duration, 3),
+                "error": error,
+            }
+        return self._last_reindex
+
+    def request_reindex(self):
+        """Ask the background thread to update the index as soon as possible."""
+        self._reindex_requested.set()
+
+    def _run(self):
+        """Background loop re-indexing on request or every reindex_interval seconds."""
+        while not self._stopped.is_set():
+            self.reindex()
+            timeout = self.reindex_interval if self.reindex_interval > 0 else None
+            self._reindex_requested.wait(timeout)
+            self._reindex_requested.clear()
+
+    def start(self):
+        """Start background re-indexing, beginning with an immediate update."""
+        self._thread = threading.Thread(
+            target=self._run, name="ollama-rag-reindex", daemon=True
+        )
+        self._thread.start()
+        if self.watcher is not None:
+            self.watcher.start()
+
+    def stop(self):
+        """Stop background re-indexing after the current update."""
+        self._stopped.set()
+        self._reindex_requested.set()
+        if self.watcher is not None:
+            self.watcher.stop(timeout=1.0)
+
+    def stats(self):
+        """Return uptime, request counts, latency percentiles and the indexing status."""
+        with self._stats_lock:
+            latencies = list(self._latencies)
+            ttfts = list(self._ttfts)
+            stats = {
+                "uptime_s": round(time.time() - self.started_at, 1),
+                "queries": self._num_queries,
+                "errors": self._num_errors,
+                "reindexing": self._reindex_lock.locked(),
+                "last_reindex": self._last_reindex,
+            }
+        stats["ready"] = hasattr(self.engine, "query_engine")
+        progress = getattr(self.engine, "indexing_progress", None)
+        if progress is not None:
+            stats["indexing"] = progress.snapshot()
+        if self.watcher is not None:
+            stats["watch"] = self.watcher.stats()
+        query_cache = getattr(self.engine, "query_cache", None)
+        if query_cache is not None:
+            stats["cache"] = {
+                "entries": len(query_cache),
+                "hits": query_cache.hits,
+                "misses": query_cache.misses,
+            }
+        for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            value = _percentile(latencies, fraction)
+            stats[f"latency_{name}_ms"] = None if value is None else round(value, 1)
+            value = _percentile(ttfts, fraction)
+            stats[f"ttft_{name}_ms"] = None if value is None else round(value, 1)
+        return stats
+
+
+class RAGRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON endpoints of the query server.
+
+    - GET /health: Service statistics.
+    - POST /query: Body {"query": "...", "stream": bool, "filters": {...}}; returns the
+      response, sources and latency_ms. With stream, the answer is sent as chunked JSON
+      lines: the sources, then one line per token, then the time to first token and
+      latency. Filters are passed on to OllamaRAG.query().
+    - POST /reindex: Body {"wait": bool}; runs or schedules a re-index.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # Unix socket clients have no (host, port) address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, payload):
+        data = json.dumps(payload).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream_query(self, service, query_text, filters=None):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            items = service.stream_query(query_text, filters)
+            self._send_chunk({"sources": next(items)})
+            for item in items:
+                if isinstance(item, str):
+                    self._send_chunk({"token": item})
+                else:
+                    result = item.to_dict()
+                    self._send_chunk(
+                        {
+                            "ttft_ms": result["ttft_ms"],
+                            "latency_ms": result["latency_ms"],
+                        }
+                    )
+        except Exception as e:
+            self._send_chunk({"error": str(e)})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, self.server.service.stats())
+        else:
+            self._send_json(404, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        try:
+            payload = self._read_json()
+        except ValueError as e:
+            self._send_json(400, {"error": f"Invalid JSON body: {e}"})
+            return
+
+        service = self.server.service
+        if self.path == "/query":
+            query_text = payload.get("query")
+            if not query_text:
+                self._send_json(400, {"error": "Missing 'query'."})
+                return
+            filters = payload.get("filters")
+            if payload.get("stream"):
+                self._stream_query(service, query_text, filters)
+                return
+            try:
+                self._send_json(200, service.query(query_text, filters))
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+        elif self.path == "/reindex":
+            if payload.get("wait"):
+                self._send_json(200, service.reindex())
+            else:
+                service.request_reindex()
+                self._send_json(202, {"scheduled": True})
+        else:
+            self._send_json(404, {"error": f"Unknown path: {self.path}"})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded HTTP server listening on a Unix domain socket."""
+
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+
+
+def make_server(service, host=SERVER_HOST, port=SERVER_PORT, socket_path=None):
+    """
+    Create the HTTP server for a RAGService.
+
+    Parameters:
+    - service (RAGService): The service answering requests.
+    - host (str, optional): Address to listen on. Defaults to SERVER_HOST.
+    - port (int, optional): Port to listen on. Defaults to SERVER_PORT.
+    - socket_path (str, optional): Listen on this Unix socket instead of TCP.
+
+    Returns:
+    - socketserver.BaseServer: The server, ready for serve_forever().
+    """
+    if socket_path:
+        server = UnixHTTPServer(socket_path, RAGRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RAGRequestHandler)
+    server.service = service
+    return server
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix domain socket."""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def _connect(host, port, socket_path, timeout):
+    if socket_path:
+        return UnixHTTPConnection(socket_path, timeout=timeout)
+    return http.client.HTTPConnection(host, port, timeout=timeout)
+
+
+def request(
+    method,
+    path,
+    payload=None,
+    host=SERVER_HOST,
+    port=SERVER_PORT,
+    socket_path=None,
+    timeout=None,
+):
+    """Send a JSON request to a running server and return (status, response)."""
+    conn = _connect(host, port, socket_path, timeout)
+    try:
+        body = None if payload is None else json.dumps(payload)
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b"{}")
+    finally:
+        conn.close()
+
+
+def stream_request(
+    query_text,
+    filters=None,
+    host=SERVER_HOST,
+    port=SERVER_PORT,
+    socket_path=None,
+    timeout=None,
+):
+    """Send a streaming query to a running server and yield its JSON lines as they arrive."""
+    conn = _connect(host, port, socket_path, timeout)
+    try:
+        conn.request(
+            "POST",
+            "/query",
+            body=json.dumps({"query": query_text, "stream": True, "filters": filters}),
+            headers={"Content-Type": "application/json"},
+        )
+        response = conn.getresponse()
+        if response.status >= 400:
+            yield json.loads(response.read() or b"{}")
+            return
+        for line in response:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        conn.close()
+
+
+def _add_address_arguments(parser):
+    parser.add_argument("--host", type=str, default=SERVER_HOST, help="Server address.")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="Server port.")
+    parser.add_argument(
+        "--socket",
+        type=str,
+        default=SERVER_SOCKET,
+        help="Unix socket path, used instead of host and port.",
+    )
+
+
+def serve_main():
+    parser = argparse.ArgumentParser(
+        description="Serve queries from a resident Ollama RAG engine."
+    )
+    add_engine_arguments(parser)
+    _add_address_arguments(parser)
+    parser.add_argument(
+        "--reindex_interval",
+        type=float,
+        default=REINDEX_INTERVAL,
+        help="Seconds between background re-indexing runs, 0 to only re-index on request.",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Also update the index as soon as files in the input directories change.",
+    )
+    args = parser.parse_args()
+
+    engine = engine_from_args(args)
+    service = RAGService(
+        engine, reindex_interval=args.reindex_interval, watch=args.watch
+    )
+    server = make_server(service, args.host, args.port, socket_path=args.socket)
+    service.start()
+
+    address = args.socket or f"http://{args.host}:{args.port}"
+    logging.info(f"Serving Ollama RAG on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+def client_main():
+    parser = argparse.ArgumentParser(description="Query a running Ollama RAG server.")
+    parser.add_argument("query", type=str, nargs="?", help="The query to run.")
+    parser.add_argument(
+        "--reindex", action="store_true", help="Ask the server to re-index."
+    )
+    parser.add_argument(
+        "--wait",
+        action="store_true",
+        help="With --reindex, wait for re-indexing to finish.",
+    )
+    parser.add_argument(
+        "--health", action="store_true", help="Print the server statistics."
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Print the answer as it is generated.",
+    )
+    parser.add_argument(
+        "--path_prefix",
+        type=str,
+        nargs="+",
+        help="Only search files in these folders.",
+    )
+    parser.add_argument(
+        "--extensions",
+        type=str,
+        nargs="+",
+        help="Only search files with these extensions, e.g. .pdf .docx",
+    )
+    parser.add_argument(
+        "--modified_after",
+        type=str,
+        help="Only search files modified after this ISO 8601 date, e.g. 2024-06-01.",
+    )
+    parser.add_argument(
+        "--sheet_name",
+        type=str,
+        nargs="+",
+        help="Only search these Excel sheets.",
+    )
+    _add_address_arguments(parser)
+    args = parser.parse_args()
+
+    filters = {
+        key: getattr(args, key)
+        for key in ("path_prefix", "extensions", "modified_after", "sheet_name")
+        if getattr(args, key) is not None
+    }
+    address = {"host": args.host, "port": args.port, "socket_path": args.socket}
+    if args.stream and args.query:
+        result, status = {}, 200
+        for line in stream_request(args.query, filters or None, **address):
+            if "token" in line:
+                print(line["token"], end="", flush=True)
+            else:
+                result.update(line)
+        print()
+        if "error" in result:
+            status = 500
+    elif args.health:
+        status, result = request("GET", "/health", **address)
+    elif args.reindex:
+        status, result = request("POST", "/reindex", {"wait": args.wait}, **address)
+    elif args.query:
+        status, result = request(
+            "POST", "/query", {"query": args.query, "filters": filters}, **address
+        )
+    else:
+        parser.error("Provide a query, --reindex or --health.")
+
+    print(json.dumps(result, indent=2))
+    if status >= 400:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    serve_main()
@@ -0,0 +1,227 @@
+# shards.py
+
+import os
+import re
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ollama_rag.configs import SHARD_SEARCH_WORKERS
+
+SHARD_KEYS = ("input_dir", "file_type")
+DEFAULT_SHARD = "default"  # Shard of files outside every input directory
+
+
+def warn_on_hnsw_mismatch(collection, hnsw_params):
+    """Log the HNSW parameters that an existing collection was created with differently."""
+    metadata = collection.metadata or {}
+    for key, value in (hnsw_params or {}).items():
+        if key in metadata and metadata[key] != value:
+            logging.warning(
+                f"Collection {collection.name} was created with {key}={metadata[key]}; "
+                f"{value} only applies to new collections."
+            )
+
+
+class ShardedCollection:
+    """
+    Several Chroma collections used as one, split by input directory or file type.
+
+    Implements the part of the Chroma collection API used by ChromaVectorStore and the
+    indexer. Chunks are added to the shard of their ``file_path``, searches run on every
+    shard in parallel and the results are merged into one top-k by distance, and lookups,
+    updates and deletes by id go to every shard. Each shard is a regular collection named
+    ``<name>-<shard>`` and tagged with ``shard_of`` in its metadata, so shards are found
+    again when the index is reopened.
+    """
+
+    def __init__(
+        self,
+        client,
+        name,
+        shard_by,
+        input_dirs=None,
+        metadata=None,
+        max_workers=SHARD_SEARCH_WORKERS,
+    ):
+        if shard_by not in SHARD_KEYS:
+            raise ValueError(f"Unknown shard key: {shard_by}")
+        self.name = name
+        self.shard_by = shard_by
+        self.metadata = metadata or {}
+        self.input_dirs = sorted(
+            (os.path.abspath(input_dir) for input_dir in input_dirs or []),
+            key=len,
+            reverse=True,
+        )
+        self._client = client
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self.shards = {
+            collection.metadata["shard"]: collection
+            for collection in client.list_collections()
+            if (collection.metadata or {}).get("shard_of") == name
+        }
+        for collection in self.shards.values():
+            warn_on_hnsw_mismatch(collection, self.metadata)
+
+    def shard_of(self, file_path):
+        """Return the shard a file's chunks belong to."""
+        if not file_path:
+            return DEFAULT_SHARD
+        if self.shard_by == "file_type":
+            ext = os.path.splitext(file_path)[1].lstrip(".").lower()
+            return ext or DEFAULT_SHARD
+        file_path = os.path.abspath(file_path)
+        for input_dir in self.input_dirs:
+            if file_path.startswith(input_dir + os.sep):
+                digest = hashlib.sha1(input_dir.encode("utf-8")).hexdigest()[:8]
+                return f"{os.path.basename(input_dir)[:20]}-{digest}"
+        return DEFAULT_SHARD
+
+    def _get_shard(self, shard):
+        """Return the collection of a shard, creating it on first use."""
+        with self._lock:
+            collection = self.shards.get(shard)
+            if collection is None:
+                collection_name = re.sub(r"[^a-zA-Z0-9_-]", "_", f"{self.name}-{shard}")
+                collection = self._client.get_or_create_collection(
+                    collection_name[:63].strip("_-"),
+                    metadata={**self.metadata, "shard_of": self.name, "shard": shard},
+                )
+                self.shards[shard] = collection
+            return collection
+
+    def _map(self, func):
+        """Call func on every shard collection in parallel and return the results."""
+        collections = list(self.shards.values())
+        if len(collections) <= 1:
+            return [func(collection) for collection in collections]
+        return list(self._executor.map(func, collections))
+
+    def count(self):
+        return sum(self._map(lambda collection: collection.count()))
+
+    def add(self, ids, embeddings, metadatas, documents):
+        groups = {}
+        for i, metadata in enumerate(metadatas):
+            shard = self.shard_of((metadata or {}).get("file_path"))
+            groups.setdefault(shard, []).append(i)
+        for shard, rows in groups.items():
+            self._get_shard(shard).add(
+                ids=[ids[i] for i in rows],
+                embeddings=[embeddings[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows],
+                documents=[documents[i] for i in rows],
+            )
+
+    def query(self, query_embeddings, n_results=10, where=None, **kwargs):
+        if query_embeddings and not isinstance(query_embeddings[0], (list, tuple)):
+            query_embeddings = [query_embeddings]
+
+        def search(collection):
+            # Asking a shard for more results than it holds only logs a warning
+            size = collection.count()
+            if not size:
+                return None
+            return collection.query(
+                query_embeddings=query_embeddings,
+                n_results=min(n_results, size),
+                where=where,
+                **kwargs,
+            )
+
+        results = [result for result in self._map(search) if result is not None]
+        merged = {key: [] for key in ("ids", "distances", "metadatas", "documents")}
+        for i in range(len(query_embeddings)):
+            hits = [
+                (result["distances"][i][j], result, j)
+                for result in results
+                for j in range(len(result["ids"][i]))
+            ]
+            hits.sort(key=lambda hit: hit[0])
+            for key in merged:
+                merged[key].append(
+                    [
+                        result[key][i][j] if result.get(key) is not None else None
+                        for _, result, j in hits[:n_results]
+                    ]
+                )
+        return merged
+
+    def get(self, ids=None, where=None, limit=None, offset=None, **kwargs):
+        merged = {"ids": [], "metadatas": [], "documents": [], "embeddings": []}
+
+        def extend(result):
+            for key in merged:
+                if result.get(key) is not None:
+                    merged[key].extend(result[key])
+
+        if limit is None and not offset:
+            for result in self._map(
+                lambda collection: collection.get(ids=ids, where=where, **kwargs)
+            ):
+                extend(result)
+            return merged
+
+        # Page through the shards one after the other
+        offset = offset or 0
+        for collection in list(self.shards.values()):
+            if limit is not None and len(merged["ids"]) >= limit:
+                break
+            size = collection.count()
+            if offset >= size:
+                offset -= size
+                continue
+            result = collection.get(
+                ids=ids,
+                where=where,
+                limit=None if limit is None else limit - len(merged["ids"]),
+                offset=offset,
+                **kwargs,
+            )
+            offset = 0
+            extend(result)
+        return merged
+
+    def delete(self, ids=None, where=None):
+        if ids is None:
+            self._map(lambda collection: collection.delete(where=where))
+            return
+
+        def delete_found(collection):
+            # Only delete the ids a shard holds; Chroma warns about the others
+            found = collection.get(ids=ids, where=where, include=[])["ids"]
+            if found:
+                collection.delete(ids=found)
+
+        self._map(delete_found)
+
+    def update(self, ids, metadatas):
+        """Update the metadata of chunks, moving those whose file changes shard."""
+        new_metadata = dict(zip(ids, metadatas))
+        for shard, collection in list(self.shards.items()):
+            found = collection.get(ids=ids, include=["embeddings", "documents"])
+            if not found["ids"]:
+                continue
+            stay, move = [], {}
+            for i, node_id in enumerate(found["ids"]):
+                target = self.shard_of(new_metadata[node_id].get("file_path"))
+                if target == shard:
+                    stay.append(node_id)
+                else:
+                    move.setdefault(target, []).append(i)
+            if stay:
+                collection.update(
+                    ids=stay, metadatas=[new_metadata[node_id] for node_id in stay]
+                )
+            for target, rows in move.items():
+                moved_ids = [found["ids"][i] for i in rows]
+                self._get_shard(target).add(
+                    ids=moved_ids,
+                    embeddings=[found["embeddings"][i] for i in rows],
+                    metadatas=[new_metadata[node_id] for node_id in moved_ids],
+                    documents=[found["documents"][i] for i in rows],
+                )
+                collection.delete(ids=moved_ids)
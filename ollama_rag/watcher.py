@@ -0,0 +1,377 @@
+# watcher.py
+
+import os
+import time
+import logging
+import argparse
+import threading
+
+from ollama_rag.document_tracker import scan_files
+from ollama_rag.configs import (
+    WATCH_DEBOUNCE_MS,
+    WATCH_MAX_PENDING,
+    WATCH_POLL_INTERVAL,
+    WATCH_FORCE_POLLING,
+)
+
+# Filesystems where inotify misses changes made on other machines (or by Windows, in WSL)
+NETWORK_FS_TYPES = {
+    "nfs",
+    "nfs4",
+    "cifs",
+    "smb3",
+    "smbfs",
+    "9p",
+    "drvfs",
+    "afs",
+    "fuse.sshfs",
+    "fuse.rclone",
+    "davfs",
+}
+
+logger = logging.getLogger(__name__)
+
+
+def _mount_fs_types():
+    """Return {mount point: filesystem type} from /proc/mounts, empty if unavailable."""
+    try:
+        with open("/proc/mounts") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return {}
+    mounts = {}
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 3:
+            mounts[fields[1].replace("\\040", " ")] = fields[2]
+    return mounts
+
+
+def needs_polling(path, mounts=None):
+    """Whether a directory is on a network filesystem, where change events are unreliable."""
+    if mounts is None:
+        mounts = _mount_fs_types()
+    path = os.path.realpath(path)
+    mount_point = max(
+        (
+            mount_point
+            for mount_point in mounts
+            if path == mount_point
+            or path.startswith(mount_point.rstrip(os.sep) + os.sep)
+        ),
+        key=len,
+        default=None,
+    )
+    return mounts.get(mount_point) in NETWORK_FS_TYPES
+
+
+class IndexWatcher:
+    """
+    Watch the input directories and update the index with the paths that changed.
+
+    Local directories are watched with inotify (through watchfiles); directories on
+    network mounts, where inotify does not see changes made elsewhere, are polled every
+    ``poll_interval`` seconds. Events within ``debounce_ms`` of each other are grouped,
+    and repeated events for a path are coalesced, so each update looks at every changed
+    path once and never rescans the input directories.
+
+    One update runs at a time, and changes arriving meanwhile are queued for the next
+    one. The watch threads never block, so the kernel event queue cannot overflow.
+    Instead, at most ``max_pending`` paths are queued; past that the queue is dropped
+    for a single full rescan, so a large burst (such as a folder being synced) costs
+    one update and bounded memory.
+    """
+
+    def __init__(
+        self,
+        engine,
+        update=None,
+        debounce_ms=WATCH_DEBOUNCE_MS,
+        max_pending=WATCH_MAX_PENDING,
+        poll_interval=WATCH_POLL_INTERVAL,
+        force_polling=WATCH_FORCE_POLLING,
+    ):
+        """
+        Parameters:
+        - engine (OllamaRAG): The engine whose input directories are watched.
+        - update (callable, optional): Called with the list of changed paths, or None
+          for a full rescan. Defaults to engine.update_index.
+        - debounce_ms (int, optional): Window in which changes are grouped.
+        - max_pending (int, optional): Changed paths queued before falling back to a
+          full rescan.
+        - poll_interval (float, optional): Seconds between scans of polled directories.
+        - force_polling (bool, optional): True to poll every directory, False to never
+          poll, None to poll only network mounts.
+        """
+        self.engine = engine
+        self.update = update or engine.update_index
+        self.input_dirs = [
+            input_dir for input_dir in engine.input_dirs if os.path.isdir(input_dir)
+        ]
+        self.required_exts = engine.required_exts
+        self.recursive = engine.recursive
+        self.debounce_ms = debounce_ms
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self.force_polling = force_polling
+
+        self._exts = {
+            ext.lower() if ext.startswith(".") else "." + ext.lower()
+            for ext in self.required_exts
+        }
+        # Events may report absolute or resolved paths; the manifest uses the input
+        # directories as given
+        self._roots = []
+        for input_dir in self.input_dirs:
+            for root in {
+                os.path.normpath(input_dir),
+                os.path.abspath(input_dir),
+                os.path.realpath(input_dir),
+            }:
+                self._roots.append((root, input_dir))
+
+        self._pending = set()
+        self._rescan = False
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        self._threads = []
+        self._default_filter = None
+        self._modified = None
+
+        self.num_events = 0
+        self.num_updates = 0
+        self.num_rescans = 0
+        self.last_update = None
+
+    def _to_input_path(self, path):
+        """Return a watched path as it is recorded in the manifest, None if outside."""
+        for root, input_dir in self._roots:
+            if path == root:
+                return input_dir
+            if path.startswith(root.rstrip(os.sep) + os.sep):
+                return os.path.join(input_dir, path[len(root.rstrip(os.sep)) + 1 :])
+        return None
+
+    def _is_relevant(self, change, path):
+        """Filter watchfiles events down to indexed files and directories."""
+        if not self._default_filter(change, path):
+            return False
+        if os.path.splitext(path)[1].lower() in self._exts:
+            return True
+        if os.path.isdir(path):
+            # Changes inside a directory are reported for the files themselves
+            return change != self._modified
+        # A directory that was moved or deleted, along with its files
+        return not os.path.exists(path)
+
+    def _add(self, paths):
+        """Queue changed paths for the next update."""
+        paths = list(paths)
+        with self._cond:
+            self.num_events += len(paths)
+            if not self._rescan:
+                self._pending.update(paths)
+                if len(self._pending) > self.max_pending:
+                    logger.warning(
+                        f"More than {self.max_pending} changed paths queued, "
+                        "falling back to a full rescan"
+                    )
+                    self._pending.clear()
+                    self._rescan = True
+            self._cond.notify()
+
+    def _watch(self, dirs, force_polling):
+        """Report the changes under dirs with watchfiles until stopped."""
+        from watchfiles import watch
+
+        for changes in watch(
+            *dirs,
+            watch_filter=self._is_relevant,
+            debounce=self.debounce_ms,
+            stop_event=self._stopped,
+            force_polling=force_polling,
+            poll_delay_ms=int(self.poll_interval * 1000),
+            recursive=self.recursive,
+            raise_interrupt=False,
+        ):
+            paths = {self._to_input_path(path) for _, path in changes}
+            paths.discard(None)
+            if paths:
+                self._add(paths)
+
+    def _poll(self, dirs):
+        """Report changes by comparing successive scans, when watchfiles is missing."""
+        previous = scan_files(dirs, self.required_exts, self.recursive)
+        while not self._stopped.wait(self.poll_interval):
+            current = scan_files(dirs, self.required_exts, self.recursive)
+            changed = [
+                path for path, stat in current.items() if previous.get(path) != stat
+            ]
+            changed.extend(path for path in previous if path not in current)
+            previous = current
+            if changed:
+                self._add(changed)
+
+    def _keep(self, path):
+        """Whether a queued path may hold indexed files."""
+        if os.path.splitext(path)[1].lower() in self._exts or os.path.isdir(path):
+            return True
+        # A deleted path without an indexed extension matters if it was a folder
+        manifest = getattr(self.engine, "manifest", None)
+        return manifest is None or bool(manifest.find_files(path_prefixes=[path]))
+
+    def _run_updates(self):
+        """Run one update at a time with everything queued since the last one."""
+        while True:
+            with self._cond:
+                while not (self._pending or self._rescan or self._stopped.is_set()):
+                    self._cond.wait()
+                if self._stopped.is_set():
+                    return
+                pending, rescan = self._pending, self._rescan
+                self._pending, self._rescan = set(), False
+            paths = [] if rescan else sorted(filter(self._keep, pending))
+            if not paths and not rescan:
+                continue
+
+            start = time.perf_counter()
+            try:
+                if rescan:
+                    logger.info("Rescanning the input directories...")
+                    self.update(None)
+                    self.num_rescans += 1
+                else:
+                    logger.info(f"Updating the index with {len(paths)} changed paths")
+                    self.update(paths)
+                error = None
+            except Exception as e:
+                logger.error(f"Watch update failed: {e}")
+                error = str(e)
+            self.num_updates += 1
+            self.last_update = {
+                "finished_at": time.time(),
+                "duration_s": round(time.perf_counter() - start, 3),
+                "paths": None if rescan else len(paths),
+                "error": error,
+            }
+
+    def start(self):
+        """Start watching the input directories and updating the index."""
+        self._stopped.clear()
+        mounts = _mount_fs_types()
+        polled = [
+            input_dir
+            for input_dir in self.input_dirs
+            if self.force_polling
+            or (self.force_polling is None and needs_polling(input_dir, mounts))
+        ]
+        local = [input_dir for input_dir in self.input_dirs if input_dir not in polled]
+
+        try:
+            from watchfiles import Change, DefaultFilter
+
+            self._default_filter = DefaultFilter()
+            self._modified = Change.modified
+            watchers = [
+                (self._watch, (dirs, force_polling))
+                for dirs, force_polling in ((local, False), (polled, True))
+                if dirs
+            ]
+        except ImportError:
+            logger.warning(
+                "watchfiles is not installed; polling the input directories every "
+                f"{self.poll_interval} s instead."
+            )
+            watchers = [(self._poll, (self.input_dirs,))] if self.input_dirs else []
+
+        for input_dir in polled:
+            logger.info(f"Polling {input_dir} every {self.poll_interval} s")
+        for target, args in watchers + [(self._run_updates, ())]:
+            thread = threading.Thread(
+                target=target, args=args, name="ollama-rag-watch", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Stop watching; an update that is running finishes first."""
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run(self):
+        """Watch until interrupted."""
+        self.start()
+        try:
+            while not self._stopped.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stats(self):
+        """Return the event and update counters."""
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            "events": self.num_events,
+            "pending": pending,
+            "updates": self.num_updates,
+            "rescans": self.num_rescans,
+            "last_update": self.last_update,
+        }
+
+
+def watch_main():
+    from ollama_rag.ollama_rag import add_engine_arguments, engine_from_args
+
+    parser = argparse.ArgumentParser(
+        description="Keep the Ollama RAG index up to date as files change."
+    )
+    add_engine_arguments(parser)
+    parser.add_argument(
+        "--debounce_ms",
+        type=int,
+        default=WATCH_DEBOUNCE_MS,
+        help="Group changes made within this many milliseconds into one update.",
+    )
+    parser.add_argument(
+        "--max_pending",
+        type=int,
+        default=WATCH_MAX_PENDING,
+        help="Changed paths queued before falling back to a full rescan.",
+    )
+    parser.add_argument(
+        "--poll_interval",
+        type=float,
+        default=WATCH_POLL_INTERVAL,
+        help="Seconds between scans of directories on network mounts.",
+    )
+    parser.add_argument(
+        "--force_polling",
+        action="store_true",
+        default=WATCH_FORCE_POLLING,
+        help="Poll every input directory instead of using inotify.",
+    )
+    args = parser.parse_args()
+
+    engine = engine_from_args(args)
+    # Catch up with the changes made while nothing was watching
+    engine.update_index()
+    watcher = IndexWatcher(
+        engine,
+        debounce_ms=args.debounce_ms,
+        max_pending=args.max_pending,
+        poll_interval=args.poll_interval,
+        force_polling=args.force_polling,
+    )
+    logging.info(f"Watching {', '.join(watcher.input_dirs)} for changes")
+    watcher.run()
+
+
+if __name__ == "__main__":
+    watch_main()
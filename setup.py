@@ -28,11 +28,25 @@ setup(
         "chromadb",
         "llama-index-vector-stores-chroma",
         "pandas",
+        "numpy",
+        "openpyxl",  # .xlsx files
+        "xlrd",  # Legacy .xls files
     ],
+    extras_require={
+        # ONNX Runtime embedding backend; optimum exports the model on first use
+        "onnx": ["onnxruntime", "tokenizers", "optimum[onnxruntime]"],
+        # inotify-based watch mode; without it changes are found by polling
+        "watch": ["watchfiles"],
+        # Cross-encoder reranking of retrieved chunks
+        "rerank": ["sentence-transformers"],
+    },
     include_package_data=True,  # Ensures files specified in MANIFEST.in are included
-    # entry_points={
-    #     "console_scripts": [
-    #         "ollama-rag=ollama_rag.ollama_rag:main",  # Points to the standalone main function
-    #     ],
-    # },
+    entry_points={
+        "console_scripts": [
+            "ollama-rag=ollama_rag.ollama_rag:main",  # Points to the standalone main function
+            "ollama-rag-server=ollama_rag.server:serve_main",  # Resident query server
+            "ollama-rag-client=ollama_rag.server:client_main",  # Client for the server
+            "ollama-rag-watch=ollama_rag.watcher:watch_main",  # Index files as they change
+        ],
+    },
 )
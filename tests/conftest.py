@@ -0,0 +1,46 @@
+# conftest.py
+
+import pytest
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.llms import MockLLM
+
+import ollama_rag.ollama_rag as engine_module
+
+
+@pytest.fixture
+def make_engine(tmp_path, monkeypatch):
+    """
+    Return a factory for OllamaRAG engines storing everything under tmp_path.
+
+    The engines answer with MockLLM and embed with MockEmbedding, so no model is
+    downloaded and Ollama does not need to run. Engines made by the same factory share
+    their index, manifest and keyword index, like restarts of one process.
+    """
+    monkeypatch.setattr(
+        engine_module, "setup_llm", lambda **kwargs: MockLLM(max_tokens=5)
+    )
+    monkeypatch.setattr(
+        engine_module,
+        "setup_embedding_model",
+        lambda **kwargs: MockEmbedding(embed_dim=8),
+    )
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+
+    def make_engine(**kwargs):
+        options = dict(
+            input_dirs=[str(docs_dir)],
+            required_exts=[".txt", ".csv"],
+            persist_dir=str(tmp_path / "storage"),
+            chroma_db_dir=str(tmp_path / "chroma_db"),
+            indexed_files_path=str(tmp_path / "indexed_files.json"),
+            manifest_path=str(tmp_path / "manifest.db"),
+            keyword_index_path=str(tmp_path / "keyword_index.db"),
+            embedding_cache_dir=None,
+            num_workers=1,
+        )
+        options.update(kwargs)
+        return engine_module.OllamaRAG(**options)
+
+    make_engine.docs_dir = docs_dir
+    return make_engine
@@ -0,0 +1,118 @@
+# test_converter.py
+
+import json
+import os
+import sys
+
+import pytest
+
+from ollama_rag.converter import FAILED_SUFFIX, cached_path, convert_files
+
+# Converts each file by copying its content, and fails on files containing "BROKEN"
+STUB_SOFFICE = """#!{python}
+import json, os, sys
+
+args = sys.argv[1:]
+with open({calls!r}, "a") as f:
+    f.write(json.dumps(args) + "\\n")
+target = args[args.index("--convert-to") + 1]
+output_dir = args[args.index("--outdir") + 1]
+for path in args[args.index("--outdir") + 2 :]:
+    with open(path) as f:
+        content = f.read()
+    if "BROKEN" in content:
+        sys.exit(1)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    with open(os.path.join(output_dir, stem + "." + target), "w") as f:
+        f.write("converted " + content)
+"""
+
+
+@pytest.fixture
+def soffice(tmp_path, monkeypatch):
+    """Put a stub soffice on PATH and return the list of its calls' file arguments."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    calls_path = tmp_path / "calls.jsonl"
+    script = bin_dir / "soffice"
+    script.write_text(STUB_SOFFICE.format(python=sys.executable, calls=str(calls_path)))
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+
+    def calls():
+        if not calls_path.exists():
+            return []
+        with open(calls_path) as f:
+            return [
+                [os.path.basename(arg) for arg in args[args.index("--outdir") + 2 :]]
+                for args in map(json.loads, f)
+            ]
+
+    return calls
+
+
+@pytest.fixture
+def docs(tmp_path):
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+
+    def write(name, content):
+        path = docs_dir / name
+        path.write_text(content)
+        return str(path)
+
+    return write
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="The stub soffice is a script")
+def test_converted_files_are_cached_by_content(tmp_path, soffice, docs):
+    cache_dir = str(tmp_path / "cache")
+    slides = docs("slides.ppt", "slides v1")
+    copy = docs("copy.ppt", "slides v1")
+    letter = docs("letter.doc", "a letter")
+    notes = docs("notes.txt", "not a legacy format")
+
+    converted = convert_files([slides, copy, letter, notes], cache_dir=cache_dir)
+
+    assert sorted(converted) == sorted([slides, copy, letter])
+    assert converted[slides] == converted[copy] == cached_path(slides, cache_dir)
+    assert converted[letter].endswith(".docx")
+    with open(converted[slides]) as f:
+        assert f.read() == "converted slides v1"
+    # One call per target format, and identical files are converted once
+    assert sorted(soffice()) == [["letter.doc"], ["slides.ppt"]]
+
+    assert convert_files([slides, copy, letter], cache_dir=cache_dir) == converted
+    assert len(soffice()) == 2
+
+    # A changed file is converted again
+    with open(slides, "w") as f:
+        f.write("slides v2")
+    converted = convert_files([slides, copy], cache_dir=cache_dir)
+    assert soffice()[2:] == [["slides.ppt"]]
+    with open(converted[slides]) as f:
+        assert f.read() == "converted slides v2"
+    with open(converted[copy]) as f:
+        assert f.read() == "converted slides v1"
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="The stub soffice is a script")
+def test_failed_files_are_marked_until_they_change(tmp_path, soffice, docs):
+    cache_dir = str(tmp_path / "cache")
+    good = docs("good.doc", "fine")
+    bad = docs("bad.doc", "BROKEN")
+
+    converted = convert_files([good, bad], cache_dir=cache_dir, batch_size=2)
+
+    assert list(converted) == [good]
+    # The failed batch is retried one file at a time
+    assert soffice() == [["good.doc", "bad.doc"], ["good.doc"], ["bad.doc"]]
+    assert os.path.exists(cached_path(bad, cache_dir) + FAILED_SUFFIX)
+
+    assert list(convert_files([good, bad], cache_dir=cache_dir)) == [good]
+    assert len(soffice()) == 3
+
+    with open(bad, "w") as f:
+        f.write("fixed")
+    assert sorted(convert_files([good, bad], cache_dir=cache_dir)) == [bad, good]
+    assert soffice()[3:] == [["bad.doc"]]
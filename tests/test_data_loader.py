@@ -0,0 +1,172 @@
+# test_data_loader.py
+
+import os
+import sys
+import time
+
+import openpyxl
+import pytest
+from llama_index.core import Document
+from llama_index.core.readers.base import BaseReader
+
+from ollama_rag import data_loader
+from ollama_rag.data_loader import CustomExcelReader, iter_load_files, iter_row_blocks
+
+# Pool workers inherit the readers patched in by the tests
+fork_only = pytest.mark.skipif(
+    not sys.platform.startswith("linux"),
+    reason="Worker processes only inherit the patched readers through fork",
+)
+
+
+class HangingReader(BaseReader):
+    """Records the worker's pid next to the file, then never returns."""
+
+    def load_data(self, file, extra_info=None):
+        with open(f"{file}.pid", "w") as f:
+            f.write(str(os.getpid()))
+        time.sleep(600)
+
+
+class CrashingReader(BaseReader):
+    """Kills the worker process, like a segfault in a parser."""
+
+    def load_data(self, file, extra_info=None):
+        os._exit(1)
+
+
+class TextReader(BaseReader):
+    def load_data(self, file, extra_info=None):
+        with open(file) as f:
+            return [Document(text=f.read(), metadata=dict(extra_info or {}))]
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    """Write files whose extension picks a hanging, crashing or normal reader."""
+    extractor = data_loader.get_file_extractor()
+    extractor.update(
+        {".hang": HangingReader(), ".crash": CrashingReader(), ".txt": TextReader()}
+    )
+    monkeypatch.setattr(data_loader, "get_file_extractor", lambda: extractor)
+
+    def files(*names):
+        paths = []
+        for name in names:
+            path = tmp_path / name
+            path.write_text(f"content of {name}")
+            paths.append(str(path))
+        # Import the readers before the workers are forked, so they start quickly
+        data_loader._load_file(paths[0])
+        return paths
+
+    return files
+
+
+def is_running(pid):
+    """Whether a process exists and is not a zombie waiting to be reaped."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] not in ("Z", "X")
+    except FileNotFoundError:
+        return False
+
+
+def loaded_names(docs):
+    return sorted(os.path.basename(doc.metadata["file_path"]) for doc in docs)
+
+
+@fork_only
+def test_hanging_file_times_out_and_its_worker_is_killed(files):
+    paths = files("a.txt", "slow.hang", "b.txt", "c.txt")
+
+    started = time.monotonic()
+    docs = list(iter_load_files(paths, num_workers=2, timeout=2))
+
+    assert loaded_names(docs) == ["a.txt", "b.txt", "c.txt"]
+    assert time.monotonic() - started < 30
+    with open(paths[1] + ".pid") as f:
+        pid = int(f.read())
+    deadline = time.monotonic() + 5
+    while is_running(pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not is_running(pid)
+
+
+@fork_only
+def test_crashing_file_is_skipped_without_losing_others(files, caplog):
+    paths = files("a.txt", "b.txt", "bad.crash", "c.txt", "d.txt")
+
+    docs = list(iter_load_files(paths, num_workers=3, timeout=30))
+
+    assert loaded_names(docs) == ["a.txt", "b.txt", "c.txt", "d.txt"]
+    assert "bad.crash" in caplog.text
+
+
+@fork_only
+def test_pool_workers_exit_after_loading(files, monkeypatch):
+    paths = files("a.txt", "b.txt", "c.txt")
+    stopped = []
+    stop_pool = data_loader._stop_pool
+
+    def recording_stop_pool(executor, worker_pids, kill=True):
+        stopped.append(kill)
+        stop_pool(executor, worker_pids, kill)
+
+    monkeypatch.setattr(data_loader, "_stop_pool", recording_stop_pool)
+    docs = list(iter_load_files(paths, num_workers=2, timeout=30))
+
+    assert loaded_names(docs) == ["a.txt", "b.txt", "c.txt"]
+    # Nothing was left running, so the workers were shut down without being killed
+    assert stopped == [False]
+
+
+def test_former_reader_names_are_kept():
+    assert data_loader.PPTReader is data_loader.LegacyFormatReader
+    assert data_loader.CSVReader is data_loader.CustomCSVReader
+
+
+def test_row_blocks_repeat_the_header():
+    rows = [("id", "name"), (None, None), (1, "a"), (2.0, "b"), (3, "c,d"), (4, "e")]
+
+    blocks = list(iter_row_blocks(rows, rows_per_chunk=3))
+
+    assert blocks == [
+        (1, 3, 'id,name\n1,a\n2,b\n3,"c,d"\n'),
+        (4, 4, "id,name\n4,e\n"),
+    ]
+    # A block is also closed once it reaches max_chars
+    assert [block[:2] for block in iter_row_blocks(rows, max_chars=6)] == [
+        (1, 2),
+        (3, 3),
+        (4, 4),
+    ]
+    assert list(iter_row_blocks(rows[:1])) == [(0, 0, "id,name\n")]
+
+
+def test_excel_sheets_are_read_in_row_blocks(tmp_path):
+    workbook = openpyxl.Workbook()
+    workbook.active.title = "Sales"
+    workbook.active.append(("region", "amount"))
+    for i in range(1, 121):
+        workbook.active.append((f"region {i}", i))
+    workbook.create_sheet("Empty")
+    workbook.create_sheet("Costs").append(("item", "cost"))
+    workbook["Costs"].append(("rent", 10.0))
+    path = tmp_path / "book.xlsx"
+    workbook.save(path)
+
+    docs = CustomExcelReader().load_data(str(path), extra_info={"source": "test"})
+
+    assert [
+        (doc.metadata["sheet_name"], doc.metadata["row_start"], doc.metadata["row_end"])
+        for doc in docs
+    ] == [("Sales", 1, 50), ("Sales", 51, 100), ("Sales", 101, 120), ("Costs", 1, 1)]
+    for doc in docs[:3]:
+        lines = doc.text.splitlines()
+        assert lines[0] == "region,amount"
+        row_start, row_end = doc.metadata["row_start"], doc.metadata["row_end"]
+        assert lines[1:] == [f"region {i},{i}" for i in range(row_start, row_end + 1)]
+    assert docs[3].text == "item,cost\nrent,10\n"
+    assert all(doc.metadata["file_path"] == str(path) for doc in docs)
+    assert all(doc.metadata["source"] == "test" for doc in docs)
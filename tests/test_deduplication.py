@@ -0,0 +1,104 @@
+# test_deduplication.py
+
+import os
+
+from ollama_rag.indexer import get_source_paths
+
+
+def stored_chunks(engine):
+    result = engine.index.vector_store.client.get(include=["metadatas"])
+    return dict(zip(result["ids"], result["metadatas"]))
+
+
+def keyword_file_paths(engine):
+    return dict(
+        engine.keyword_index._conn.execute("SELECT node_id, file_path FROM chunks")
+    )
+
+
+def test_identical_files_share_chunks_until_the_last_copy_goes(make_engine):
+    docs_dir = make_engine.docs_dir
+    first = str(docs_dir / "first.txt")
+    second = str(docs_dir / "second.txt")
+    for path in (first, second):
+        with open(path, "w") as f:
+            f.write("the same report, saved twice")
+    engine = make_engine()
+    engine.update_index()
+
+    chunks = stored_chunks(engine)
+    assert len(chunks) == 1
+    ((node_id, metadata),) = chunks.items()
+    assert sorted(get_source_paths(metadata)) == [first, second]
+    assert len(engine.keyword_index) == 1
+    node_ids = engine.manifest.get_node_ids([first, second])
+    assert node_ids == {first: [node_id], second: [node_id]}
+
+    # Deleting the copy the chunk is attributed to moves it to the other one
+    attributed = metadata["file_path"]
+    other = second if attributed == first else first
+    os.remove(attributed)
+    engine.update_index()
+    metadata = stored_chunks(engine)[node_id]
+    assert get_source_paths(metadata) == [other]
+    assert metadata["file_path"] == other
+    assert keyword_file_paths(engine) == {node_id: other}
+
+    # Renaming the remaining copy keeps the chunk without re-embedding it
+    renamed = str(docs_dir / "renamed.txt")
+    os.rename(other, renamed)
+    engine.update_index()
+    metadata = stored_chunks(engine)[node_id]
+    assert get_source_paths(metadata) == [renamed]
+    assert metadata["file_path"] == renamed
+    assert metadata["file_name"] == "renamed.txt"
+    assert keyword_file_paths(engine) == {node_id: renamed}
+    assert engine.manifest.get_node_ids([renamed]) == {renamed: [node_id]}
+
+    os.remove(renamed)
+    engine.update_index()
+    assert stored_chunks(engine) == {}
+    assert len(engine.keyword_index) == 0
+
+
+def test_shared_chunk_of_different_files(make_engine):
+    docs_dir = make_engine.docs_dir
+    rows = "".join(f"{i},value {i}\n" for i in range(100))
+    (docs_dir / "full.csv").write_text("row,value\n" + rows)
+    # The same first block of 50 rows as full.csv
+    (docs_dir / "part.csv").write_text("row,value\n" + rows[: rows.index("50,")])
+    full, part = str(docs_dir / "full.csv"), str(docs_dir / "part.csv")
+    engine = make_engine()
+    engine.update_index()
+
+    chunks = stored_chunks(engine)
+    assert len(chunks) == 2
+    shared = [
+        node_id
+        for node_id, metadata in chunks.items()
+        if len(get_source_paths(metadata)) == 2
+    ]
+    assert len(shared) == 1
+    assert engine.manifest.get_node_ids([part]) == {part: shared}
+
+    os.remove(full)
+    engine.update_index()
+    chunks = stored_chunks(engine)
+    assert list(chunks) == shared
+    assert get_source_paths(chunks[shared[0]]) == [part]
+    assert keyword_file_paths(engine) == {shared[0]: part}
+
+
+def test_deduplication_can_be_turned_off(make_engine):
+    docs_dir = make_engine.docs_dir
+    for name in ("first.txt", "second.txt"):
+        (docs_dir / name).write_text("the same report, saved twice")
+    engine = make_engine(deduplicate=False)
+    engine.update_index()
+
+    chunks = stored_chunks(engine)
+    assert len(chunks) == 2
+    assert {metadata["file_name"] for metadata in chunks.values()} == {
+        "first.txt",
+        "second.txt",
+    }
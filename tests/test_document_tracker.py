@@ -0,0 +1,169 @@
+# test_document_tracker.py
+
+import os
+
+import pytest
+
+from ollama_rag.document_tracker import (
+    LEGACY_SIZE,
+    compute_file_hash,
+    diff_indexed_files,
+    get_new_or_updated_files,
+    load_indexed_files,
+    save_indexed_files,
+    update_indexed_files,
+)
+
+
+@pytest.fixture
+def docs(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    return docs
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def entry(file_path):
+    stat = os.stat(file_path)
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash": compute_file_hash(file_path),
+    }
+
+
+def diff(docs, indexed_files, **kwargs):
+    return diff_indexed_files([str(docs)], [".txt"], True, indexed_files, **kwargs)
+
+
+def test_unchanged_files_are_not_reported(docs):
+    file_path = write(docs / "a.txt", "alpha")
+
+    changes = diff(docs, {file_path: entry(file_path)})
+    for kind in ("added", "modified", "touched", "deleted", "renamed"):
+        assert changes[kind] == []
+
+
+def test_added_modified_and_deleted(docs):
+    kept = write(docs / "kept.txt", "kept")
+    changed = write(docs / "changed.txt", "before")
+    indexed_files = {
+        kept: entry(kept),
+        changed: entry(changed),
+        str(docs / "gone.txt"): {"size": 4, "mtime_ns": 1, "hash": "gone"},
+    }
+    write(docs / "changed.txt", "after, and longer")
+    added = write(docs / "new.txt", "new")
+    write(docs / "skipped.md", "not a required extension")
+
+    changes = diff(docs, indexed_files)
+    assert changes["added"] == [added]
+    assert changes["modified"] == [changed]
+    assert changes["deleted"] == [str(docs / "gone.txt")]
+    assert changes["hashes"][changed] == compute_file_hash(changed)
+
+
+def test_touched_file_is_not_modified(docs):
+    file_path = write(docs / "a.txt", "alpha")
+    indexed_files = {file_path: entry(file_path)}
+    stat = os.stat(file_path)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    changes = diff(docs, indexed_files)
+    assert changes["touched"] == [file_path]
+    assert changes["modified"] == []
+    assert changes["stats"][file_path][1] == stat.st_mtime_ns + 10**9
+
+
+def test_rename_is_detected_by_content(docs):
+    old_path = write(docs / "old.txt", "same content")
+    indexed_files = {old_path: entry(old_path)}
+    (docs / "sub").mkdir()
+    new_path = str(docs / "sub" / "new.txt")
+    os.rename(old_path, new_path)
+
+    changes = diff(docs, indexed_files)
+    assert changes["renamed"] == [(old_path, new_path)]
+    assert changes["added"] == []
+    assert changes["deleted"] == []
+
+
+def test_copy_of_a_deleted_file_is_renamed_once(docs):
+    old_path = write(docs / "old.txt", "same content")
+    indexed_files = {old_path: entry(old_path)}
+    os.remove(old_path)
+    first = write(docs / "first.txt", "same content")
+    second = write(docs / "second.txt", "same content")
+
+    changes = diff(docs, indexed_files)
+    assert len(changes["renamed"]) == 1
+    assert changes["renamed"][0][0] == old_path
+    assert changes["renamed"][0][1] in (first, second)
+    assert len(changes["added"]) == 1
+
+
+def test_legacy_entry_with_matching_mtime_is_touched(docs):
+    unchanged = write(docs / "unchanged.txt", "alpha")
+    edited = write(docs / "edited.txt", "beta")
+    indexed_files = {
+        file_path: {
+            "size": LEGACY_SIZE,
+            "mtime_ns": int(os.stat(file_path).st_mtime_ns / 1e9 * 1e9),
+            "hash": None,
+        }
+        for file_path in (unchanged, edited)
+    }
+    stat = os.stat(edited)
+    os.utime(edited, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    changes = diff(docs, indexed_files)
+    assert changes["touched"] == [unchanged]
+    assert changes["modified"] == [edited]
+    assert set(changes["hashes"]) == {unchanged, edited}
+
+
+def test_new_or_updated_files_accepts_legacy_mtimes(docs):
+    unchanged = write(docs / "unchanged.txt", "alpha")
+    edited = write(docs / "edited.txt", "beta")
+    added = write(docs / "added.txt", "gamma")
+    indexed_files = {
+        unchanged: os.path.getmtime(unchanged),
+        edited: os.path.getmtime(edited) - 10,
+    }
+
+    assert sorted(
+        get_new_or_updated_files([str(docs)], [".txt"], True, indexed_files)
+    ) == sorted([added, edited])
+    manifest_entries = {unchanged: entry(unchanged), edited: entry(edited)}
+    assert get_new_or_updated_files([str(docs)], [".txt"], True, manifest_entries) == [
+        added
+    ]
+
+
+def test_deprecated_indexed_files_helpers(docs, tmp_path):
+    file_path = write(docs / "a.txt", "alpha")
+    indexed_files = {}
+    indexed_files_path = str(tmp_path / "indexed_files.json")
+
+    with pytest.deprecated_call():
+        update_indexed_files(indexed_files, [file_path])
+    with pytest.deprecated_call():
+        save_indexed_files(indexed_files, indexed_files_path)
+
+    assert indexed_files == {file_path: os.path.getmtime(file_path)}
+    loaded = load_indexed_files(indexed_files_path)
+    assert loaded[file_path]["size"] == LEGACY_SIZE
+    assert diff(docs, loaded)["touched"] == [file_path]
+
+
+def test_only_given_paths_are_diffed(docs):
+    first = write(docs / "first.txt", "first")
+    second = write(docs / "second.txt", "second")
+
+    changes = diff(docs, {}, paths=[second, str(docs.parent / "outside.txt")])
+    assert changes["added"] == [second]
+    assert first not in changes["stats"]
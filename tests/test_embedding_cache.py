@@ -0,0 +1,99 @@
+# test_embedding_cache.py
+
+from typing import List
+
+import numpy as np
+import pytest
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+from ollama_rag.embedding_cache import CachedEmbedding, EmbeddingCache, text_key
+
+DIM = 4
+ROW_BYTES = DIM * np.dtype("float32").itemsize
+
+
+class CountingEmbedding(BaseEmbedding):
+    """Embeds each text as a vector derived from its length, counting the texts."""
+
+    embedded: List[str] = []
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CountingEmbedding"
+
+    def _embed(self, text: str) -> List[float]:
+        return [float(len(text)), 1.0, 2.0, 3.0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [self._embed(text) for text in texts]
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    def make_cache(max_entries=100, model_name="counting"):
+        return EmbeddingCache(
+            str(tmp_path),
+            model_name,
+            max_bytes=max_entries * ROW_BYTES,
+            dtype="float32",
+        )
+
+    return make_cache
+
+
+def test_cached_embedding_only_embeds_misses(make_cache):
+    model = CountingEmbedding(model_name="counting", embedded=[])
+    embedding = CachedEmbedding(model, make_cache())
+
+    first = embedding.get_text_embedding_batch(["a", "bb", "a"])
+    assert first == [model._embed("a"), model._embed("bb"), model._embed("a")]
+    assert model.embedded == ["a", "bb"]
+
+    second = embedding.get_text_embedding_batch(["bb", "ccc", "a"])
+    assert second == [model._embed("bb"), model._embed("ccc"), model._embed("a")]
+    assert model.embedded == ["a", "bb", "ccc"]
+
+
+def test_least_recently_used_rows_are_evicted_at_capacity(make_cache, monkeypatch):
+    cache = make_cache(max_entries=3)
+    now = [1000.0]
+    monkeypatch.setattr("ollama_rag.embedding_cache.time.time", lambda: now[0])
+    keys = [text_key(str(i)) for i in range(4)]
+
+    for i, key in enumerate(keys[:3]):
+        now[0] += 1
+        cache.put_many([key], [[float(i)] * DIM])
+    now[0] += 1
+    cache.get_many([keys[0]])
+    now[0] += 1
+    cache.put_many([keys[3]], [[3.0] * DIM])
+
+    assert cache.capacity == 3
+    assert cache.num_rows == 3
+    assert set(cache.get_many(keys)) == {keys[0], keys[2], keys[3]}
+    assert cache.get_many([keys[3]])[keys[3]] == [3.0] * DIM
+    # The vectors file never grows past the size budget
+    assert cache._vectors.shape[0] == 3
+
+
+def test_persisted_cache_is_reopened(make_cache):
+    cache = make_cache()
+    keys = [text_key("first"), text_key("second")]
+    cache.put_many(keys, [[1.0] * DIM, [2.0] * DIM])
+    cache._conn.close()
+
+    reopened = make_cache()
+    assert (reopened.dim, reopened.num_rows) == (DIM, 2)
+    assert reopened.get_many(keys) == {keys[0]: [1.0] * DIM, keys[1]: [2.0] * DIM}
+    # Each model has its own cache
+    assert make_cache(model_name="other").get_many(keys) == {}
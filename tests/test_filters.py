@@ -0,0 +1,141 @@
+# test_filters.py
+
+import os
+from datetime import datetime
+
+import openpyxl
+import pytest
+from llama_index.core.vector_stores import FilterOperator
+
+from ollama_rag.filters import build_metadata_filters
+from ollama_rag.manifest import IndexManifest
+from ollama_rag.ollama_rag import NO_MATCHING_FILES
+
+OLD = datetime(2020, 1, 1).timestamp()
+NEW = datetime(2024, 1, 1).timestamp()
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = IndexManifest(str(tmp_path / "manifest.db"))
+    manifest.upsert_files(
+        {
+            "/docs/reports/q1.pdf": (1, int(OLD * 1e9)),
+            "/docs/reports/q2.PDF": (1, int(NEW * 1e9)),
+            "/docs/reports/copy.pdf": (1, int(OLD * 1e9)),
+            "/docs/sheets/budget.xlsx": (1, int(NEW * 1e9)),
+            "/docs/reports-old/q0.pdf": (1, int(NEW * 1e9)),
+        },
+        {"/docs/reports/q2.PDF": "q2", "/docs/reports/copy.pdf": "q2"},
+    )
+    return manifest
+
+
+def file_filter(filters, manifest):
+    metadata_filters, file_paths = build_metadata_filters(filters, manifest)
+    (metadata_filter,) = metadata_filters.filters
+    assert metadata_filter.key == "file_path"
+    assert metadata_filter.operator == FilterOperator.IN
+    assert metadata_filter.value == file_paths
+    return file_paths
+
+
+def test_path_prefix_matches_folders_not_name_prefixes(manifest):
+    assert file_filter({"path_prefix": "/docs/reports"}, manifest) == [
+        "/docs/reports/copy.pdf",
+        "/docs/reports/q1.pdf",
+        "/docs/reports/q2.PDF",
+    ]
+    assert file_filter(
+        {"path_prefix": ["/docs/sheets", "/docs/reports/q1.pdf"]}, manifest
+    ) == ["/docs/reports/q1.pdf", "/docs/sheets/budget.xlsx"]
+
+
+def test_extensions_ignore_case_and_leading_dot(manifest):
+    assert file_filter({"extensions": ["xlsx"]}, manifest) == [
+        "/docs/sheets/budget.xlsx"
+    ]
+    assert len(file_filter({"extensions": ".pdf"}, manifest)) == 4
+
+
+def test_modified_after_accepts_dates_and_includes_copies(manifest):
+    expected = [
+        "/docs/reports-old/q0.pdf",
+        # Same content as q2.PDF, which the chunks may be attributed to
+        "/docs/reports/copy.pdf",
+        "/docs/reports/q2.PDF",
+    ]
+    for modified_after in ("2023-06-01", datetime(2023, 6, 1), NEW - 1):
+        filters = {"modified_after": modified_after, "extensions": ".pdf"}
+        assert file_filter(filters, manifest) == expected
+
+
+def test_sheet_name_and_unmatched_filters(manifest):
+    metadata_filters, file_paths = build_metadata_filters(
+        {"sheet_name": "Q1"}, manifest
+    )
+    (metadata_filter,) = metadata_filters.filters
+    assert (metadata_filter.key, metadata_filter.value) == ("sheet_name", ["Q1"])
+    assert file_paths is None
+
+    assert build_metadata_filters({"path_prefix": "/elsewhere"}, manifest)[1] == []
+    assert build_metadata_filters({}, manifest) == (None, None)
+    with pytest.raises(ValueError, match="Unknown filters: author"):
+        build_metadata_filters({"author": "me"}, manifest)
+
+
+@pytest.fixture
+def engine(make_engine):
+    docs_dir = make_engine.docs_dir
+    (docs_dir / "reports").mkdir()
+    (docs_dir / "reports" / "summary.txt").write_text("quarterly summary of sales")
+    (docs_dir / "notes.csv").write_text("topic,note\nsales,up this quarter\n")
+    os.utime(docs_dir / "notes.csv", (OLD, OLD))
+    workbook = openpyxl.Workbook()
+    workbook.active.title = "Q1"
+    workbook.active.append(["region", "sales"])
+    workbook.active.append(["north", 10])
+    workbook.create_sheet("Q2").append(["region", "sales"])
+    workbook["Q2"].append(["south", 20])
+    workbook.save(docs_dir / "sales.xlsx")
+
+    engine = make_engine(required_exts=[".txt", ".csv", ".xlsx"])
+    engine.update_index()
+    return engine
+
+
+def retrieved(engine, filters):
+    nodes = engine.retrieve("sales", top_k=10, pack=False, filters=filters)["nodes"]
+    return sorted(
+        (os.path.basename(node["file_path"]), node["sheet_name"]) for node in nodes
+    )
+
+
+def test_engine_only_searches_matching_chunks(engine):
+    docs_dir = str(engine.input_dirs[0])
+    assert retrieved(engine, {"path_prefix": os.path.join(docs_dir, "reports")}) == [
+        ("summary.txt", "N/A")
+    ]
+    assert retrieved(engine, {"extensions": [".csv", ".xlsx"]}) == [
+        ("notes.csv", "N/A"),
+        ("sales.xlsx", "Q1"),
+        ("sales.xlsx", "Q2"),
+    ]
+    assert retrieved(engine, {"modified_after": "2021-01-01"}) == [
+        ("sales.xlsx", "Q1"),
+        ("sales.xlsx", "Q2"),
+        ("summary.txt", "N/A"),
+    ]
+    assert retrieved(engine, {"sheet_name": "Q2"}) == [("sales.xlsx", "Q2")]
+
+
+def test_engine_answers_without_searching_when_no_file_matches(engine):
+    assert engine._filtered_query_engine({"extensions": ".pdf"}) is None
+    assert engine._filtered_query_engine(None) is engine.query_engine
+    assert engine.query("sales", filters={"extensions": ".pdf"}) == {
+        "response": NO_MATCHING_FILES,
+        "sources": [],
+    }
+    assert engine.retrieve("sales", filters={"path_prefix": "/nowhere"})["nodes"] == []
+    stream = engine.stream_query("sales", filters={"extensions": ".pdf"})
+    assert "".join(stream) == NO_MATCHING_FILES
@@ -0,0 +1,145 @@
+# test_indexing_resume.py
+
+import pytest
+
+from ollama_rag import indexer
+
+
+def write_table(docs_dir, version, num_rows=200):
+    """Write a CSV read as num_rows / 50 documents, one per block of rows."""
+    rows = [f"{i},{version} value {i}" for i in range(num_rows)]
+    path = docs_dir / "table.csv"
+    path.write_text("row,value\n" + "\n".join(rows) + "\n")
+    return str(path)
+
+
+def stored_chunks(engine):
+    result = engine.index.vector_store.client.get(include=["metadatas"])
+    return dict(zip(result["ids"], result["metadatas"]))
+
+
+@pytest.fixture
+def crash_on_batch(monkeypatch):
+    """Make the nth batch inserted into the index raise, as if the process died."""
+
+    def crash_on_batch(n):
+        insert_batch = indexer._insert_batch
+        calls = []
+
+        def crashing(*args, **kwargs):
+            calls.append(None)
+            if len(calls) == n:
+                raise RuntimeError("interrupted")
+            return insert_batch(*args, **kwargs)
+
+        monkeypatch.setattr(indexer, "_insert_batch", crashing)
+        return lambda: monkeypatch.setattr(indexer, "_insert_batch", insert_batch)
+
+    return crash_on_batch
+
+
+@pytest.mark.parametrize("deduplicate", [False, True])
+def test_resumed_run_replaces_chunks_of_interrupted_file(
+    make_engine, crash_on_batch, deduplicate
+):
+    docs_dir = make_engine.docs_dir
+    (docs_dir / "notes.txt").write_text("notes that are indexed once")
+    table = write_table(docs_dir, "v1")
+    engine = make_engine(insert_batch_size=1, deduplicate=deduplicate)
+    engine.update_index()
+    assert len(stored_chunks(engine)) == 5
+
+    # The modified table is interrupted after its first block of rows is stored
+    write_table(docs_dir, "v2")
+    restore = crash_on_batch(2)
+    with pytest.raises(RuntimeError):
+        engine.update_index()
+    restore()
+    assert engine.manifest.start_run() is not None
+
+    # The table changes again before the run is resumed by a new process
+    write_table(docs_dir, "v3")
+    engine = make_engine(insert_batch_size=1, deduplicate=deduplicate)
+    engine.update_index()
+
+    chunks = stored_chunks(engine)
+    table_chunks = {
+        node_id
+        for node_id, metadata in chunks.items()
+        if metadata["file_path"] == table
+    }
+    assert len(chunks) == 5
+    assert len(table_chunks) == 4
+    assert len(engine.keyword_index) == 5
+    assert engine.keyword_index.search("v2", 10) == []
+    assert set(engine.manifest.get_node_ids([table])[table]) == table_chunks
+    assert engine.manifest.start_run() is None
+
+
+def test_resumed_run_skips_committed_files(make_engine, crash_on_batch, monkeypatch):
+    docs_dir = make_engine.docs_dir
+    for i in range(4):
+        (docs_dir / f"file{i}.txt").write_text(f"document number {i}")
+    engine = make_engine(insert_batch_size=1)
+    restore = crash_on_batch(3)
+    with pytest.raises(RuntimeError):
+        engine.update_index()
+    restore()
+    committed = set(engine.manifest.load_files())
+    assert len(committed) == 1
+
+    engine = make_engine(insert_batch_size=1)
+    inserted = []
+    insert_batch = indexer._insert_batch
+
+    def recording(index, docs, *args, **kwargs):
+        inserted.extend(doc.metadata["file_path"] for doc in docs)
+        return insert_batch(index, docs, *args, **kwargs)
+
+    monkeypatch.setattr(indexer, "_insert_batch", recording)
+    engine.update_index()
+
+    assert not committed & set(inserted)
+    assert len(engine.manifest.load_files()) == 4
+    assert len(stored_chunks(engine)) == 4
+    assert len(engine.keyword_index) == 4
+    assert engine.indexing_progress.snapshot()["resumed_files"] == 1
+
+
+def test_resumed_run_unlinks_chunks_shared_by_interrupted_file(
+    make_engine, crash_on_batch
+):
+    docs_dir = make_engine.docs_dir
+    table = write_table(docs_dir, "v1")
+    # Same first block of rows as the modified table below
+    other = str(docs_dir / "other.csv")
+    (docs_dir / "other.csv").write_text(
+        "row,value\n" + "".join(f"{i},v2 value {i}\n" for i in range(50))
+    )
+    engine = make_engine(insert_batch_size=1)
+    engine.update_index()
+
+    # The first block of the modified table is linked to the other file's chunk
+    write_table(docs_dir, "v2")
+    restore = crash_on_batch(2)
+    with pytest.raises(RuntimeError):
+        engine.update_index()
+    restore()
+    shared = [
+        metadata
+        for metadata in stored_chunks(engine).values()
+        if metadata["file_path"] == other
+    ]
+    assert indexer.get_source_paths(shared[0]) == [other, table]
+
+    write_table(docs_dir, "v3")
+    engine = make_engine(insert_batch_size=1)
+    engine.update_index()
+
+    chunks = stored_chunks(engine)
+    assert len(chunks) == 5
+    assert [
+        indexer.get_source_paths(metadata)
+        for metadata in chunks.values()
+        if metadata["file_path"] == other
+    ] == [[other]]
@@ -0,0 +1,143 @@
+# test_keyword_index.py
+
+import pytest
+
+from ollama_rag import keyword_index
+from ollama_rag.keyword_index import KeywordIndex, tokenize
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = KeywordIndex(str(tmp_path / "keyword_index.db"))
+    yield index
+    index.close()
+
+
+def chunk(i, file_path="a.txt"):
+    return (f"node-{i}", file_path, f"common words chunk{i} ERR-{i}")
+
+
+def test_tokenize_keeps_compound_identifiers_and_their_parts():
+    tokens = tokenize("The ERR-404 came from os.path.join")
+    assert "the" not in tokens
+    assert {"err-404", "err", "404", "os.path.join", "path", "join"} <= set(tokens)
+
+
+def test_add_and_search(index):
+    index.add_chunks([chunk(1), chunk(2, "b.txt"), chunk(3)])
+
+    assert len(index) == 3
+    assert index.search("chunk2", 5)[0][0] == "node-2"
+    assert {node_id for node_id, _ in index.search("common", 5)} == {
+        "node-1",
+        "node-2",
+        "node-3",
+    }
+    assert index.search("missing", 5) == []
+
+
+def test_search_within_files(index):
+    index.add_chunks([chunk(1), chunk(2, "b.txt"), chunk(3, "c.txt")])
+
+    results = index.search("common", 5, file_paths=["b.txt", "c.txt"])
+    assert {node_id for node_id, _ in results} == {"node-2", "node-3"}
+    assert index.search("chunk1", 5, file_paths=["b.txt"]) == []
+
+
+def test_readding_a_chunk_replaces_it(index):
+    index.add_chunks([chunk(1)])
+    index.add_chunks([("node-1", "a.txt", "replacement text")])
+
+    assert len(index) == 1
+    assert index.search("chunk1", 5) == []
+    assert index.search("replacement", 5)[0][0] == "node-1"
+
+
+def test_remove_nodes_and_files(index):
+    index.add_chunks([chunk(1), chunk(2, "b.txt"), chunk(3, "b.txt"), chunk(4)])
+
+    assert index.remove_nodes(["node-1", "unknown"]) == 1
+    assert index.remove_files(["b.txt"]) == 2
+    assert len(index) == 1
+    assert [node_id for node_id, _ in index.search("common", 5)] == ["node-4"]
+
+
+def test_compaction_drops_deleted_postings(index, monkeypatch):
+    monkeypatch.setattr(keyword_index, "COMPACT_FRACTION", 0.5)
+    index.add_chunks([chunk(i) for i in range(1, 9)])
+
+    index.remove_nodes(["node-1", "node-2", "node-3"])
+    nums, _ = index._read_postings("common")
+    assert len(nums) == 8  # Below the threshold, postings are left as they are
+    index.remove_nodes(["node-4"])
+
+    nums, _ = index._read_postings("common")
+    assert len(nums) == 4
+    assert index._get_meta("num_deleted") == 0
+    assert index._read_postings("chunk1") == (None, None)
+    assert {node_id for node_id, _ in index.search("common", 10)} == {
+        f"node-{i}" for i in range(5, 9)
+    }
+
+
+def test_compaction_commits_in_batches_of_terms(index, monkeypatch):
+    monkeypatch.setattr(keyword_index, "COMPACT_FRACTION", 1.0)
+    index.add_chunks([chunk(i) for i in range(1, 9)])
+    index.remove_nodes(["node-1", "node-2", "node-3", "node-4"])
+    num_terms = index._conn.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+    statements = []
+    index._conn.set_trace_callback(statements.append)
+
+    index._compact(batch_terms=5)
+
+    index._conn.set_trace_callback(None)
+    # One transaction per batch, and a last one that finds no terms left
+    assert statements.count("BEGIN IMMEDIATE") == -(-num_terms // 5) + 1
+    assert index._get_meta("num_deleted") == 0
+    assert len(index._read_postings("common")[0]) == 4
+    assert index._read_postings("chunk1") == (None, None)
+    assert index._read_postings("chunk8")[0].tolist() == [8]
+
+
+def test_segments_are_merged(index, monkeypatch):
+    monkeypatch.setattr(keyword_index, "MAX_SEGMENTS", 4)
+    for i in range(1, 11):
+        index.add_chunks([chunk(i)])
+
+    segments = index._conn.execute(
+        "SELECT COUNT(*) FROM postings WHERE term = 'common'"
+    ).fetchone()[0]
+    assert segments <= 4
+    nums, freqs = index._read_postings("common")
+    assert list(nums) == list(range(1, 11))
+    assert list(freqs) == [1] * 10
+
+
+def test_index_persists_across_reopen(tmp_path):
+    index_path = str(tmp_path / "keyword_index.db")
+    index = KeywordIndex(index_path)
+    index.add_chunks([chunk(1), chunk(2), chunk(3)])
+    index.remove_nodes(["node-2"])
+    scores = index.search("common", 5)
+    index.close()
+
+    index = KeywordIndex(index_path)
+    assert len(index) == 2
+    assert index.search("common", 5) == scores
+    index.clear()
+    assert len(index) == 0
+    assert index.search("common", 5) == []
+    index.close()
+
+
+def test_chunk_count_is_backfilled_for_older_indexes(tmp_path):
+    index_path = str(tmp_path / "keyword_index.db")
+    index = KeywordIndex(index_path)
+    index.add_chunks([chunk(1), chunk(2)])
+    index._conn.execute("DELETE FROM meta WHERE name = 'num_chunks'")
+    index.close()
+
+    index = KeywordIndex(index_path)
+    assert len(index) == 2
+    assert index.search("chunk1", 5)[0][0] == "node-1"
+    index.close()
@@ -0,0 +1,115 @@
+# test_manifest.py
+
+import json
+
+import pytest
+
+from ollama_rag.manifest import IndexManifest
+
+
+@pytest.fixture
+def manifest_path(tmp_path):
+    return str(tmp_path / "manifest.db")
+
+
+def batch(*names):
+    stats = {name: (10, 1000) for name in names}
+    hashes = {name: f"hash-{name}" for name in names}
+    node_ids = {name: [f"{name}-0", f"{name}-1"] for name in names}
+    return stats, hashes, node_ids
+
+
+def test_upsert_keeps_recorded_node_ids(manifest_path):
+    manifest = IndexManifest(manifest_path)
+    manifest.upsert_files(*batch("a.txt"))
+    manifest.upsert_files({"a.txt": (20, 2000)}, {"a.txt": "new-hash"})
+
+    assert manifest.load_files()["a.txt"] == {
+        "size": 20,
+        "mtime_ns": 2000,
+        "hash": "new-hash",
+    }
+    assert manifest.get_node_ids(["a.txt"]) == {"a.txt": ["a.txt-0", "a.txt-1"]}
+    manifest.close()
+
+
+def test_finished_run_is_not_resumed(manifest_path):
+    manifest = IndexManifest(manifest_path)
+    assert manifest.start_run() is None
+    manifest.checkpoint(*batch("a.txt"))
+    manifest.end_run()
+
+    assert manifest.start_run() is None
+    manifest.close()
+
+
+def test_interrupted_run_resumes_with_committed_files(manifest_path):
+    manifest = IndexManifest(manifest_path)
+    assert manifest.start_run() is None
+    manifest.checkpoint(*batch("a.txt", "b.txt"))
+    manifest.checkpoint(*batch("c.txt"))
+    # The process dies before the run ends
+    manifest.close()
+
+    manifest = IndexManifest(manifest_path)
+    run = manifest.start_run()
+    assert run is not None
+    assert run["files_done"] == 3
+    assert set(manifest.load_files()) == {"a.txt", "b.txt", "c.txt"}
+    assert manifest.get_node_ids(["c.txt"]) == {"c.txt": ["c.txt-0", "c.txt-1"]}
+
+    # The resumed run keeps counting until it finishes
+    manifest.checkpoint(*batch("d.txt"))
+    assert manifest.start_run()["files_done"] == 4
+    manifest.end_run()
+    assert manifest.start_run() is None
+    manifest.close()
+
+
+def test_failed_checkpoint_is_rolled_back(manifest_path):
+    manifest = IndexManifest(manifest_path)
+    manifest.start_run()
+    manifest.checkpoint(*batch("a.txt"))
+
+    with pytest.raises(RuntimeError):
+        with manifest.transaction():
+            manifest.checkpoint(*batch("b.txt"))
+            raise RuntimeError("crash while committing")
+
+    assert set(manifest.load_files()) == {"a.txt"}
+    assert manifest.start_run()["files_done"] == 1
+    manifest.close()
+
+
+def test_clear_forgets_interrupted_run(manifest_path):
+    manifest = IndexManifest(manifest_path)
+    manifest.start_run()
+    manifest.checkpoint(*batch("a.txt"))
+    manifest.clear()
+
+    assert manifest.is_empty()
+    assert manifest.start_run() is None
+    manifest.close()
+
+
+def test_rename_keeps_hash_and_node_ids(manifest_path):
+    manifest = IndexManifest(manifest_path)
+    manifest.upsert_files(*batch("a.txt"))
+    manifest.rename_files([("a.txt", "b.txt")], {"b.txt": (10, 3000)})
+
+    files = manifest.load_files()
+    assert list(files) == ["b.txt"]
+    assert files["b.txt"]["hash"] == "hash-a.txt"
+    assert manifest.get_node_ids(["b.txt"]) == {"b.txt": ["a.txt-0", "a.txt-1"]}
+    manifest.close()
+
+
+def test_legacy_manifest_is_imported(tmp_path, manifest_path):
+    legacy_path = tmp_path / "indexed_files.json"
+    legacy_path.write_text(json.dumps({"a.txt": 1.5, "b.txt": {"mtime": 2.0}}))
+
+    manifest = IndexManifest(manifest_path, str(legacy_path))
+    files = manifest.load_files()
+    assert files["a.txt"]["mtime_ns"] == 1_500_000_000
+    assert files["b.txt"]["hash"] is None
+    manifest.close()
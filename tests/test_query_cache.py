@@ -0,0 +1,138 @@
+# test_query_cache.py
+
+import pytest
+
+from ollama_rag import query_cache
+from ollama_rag.query_cache import QueryCache, normalize_query
+
+
+def result(answer, *file_paths):
+    return {
+        "response": answer,
+        "sources": [{"file_path": file_path} for file_path in file_paths],
+    }
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace the cache's clock with one the test moves forward."""
+    now = [1000.0]
+    monkeypatch.setattr(query_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_normalize_query():
+    assert normalize_query("  What is  RAG?? ") == "what is rag"
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    cache = QueryCache(max_entries=4)
+    cache.put("What is RAG?", result("an answer", "a.txt"))
+
+    assert cache.get("what is rag")["response"] == "an answer"
+    assert cache.get("what is a RAG") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_results_are_copied():
+    cache = QueryCache(max_entries=4)
+    original = result("an answer", "a.txt")
+    cache.put("query", original)
+    original["response"] = "changed by the caller"
+
+    cached = cache.get("query")
+    cached["sources"].clear()
+    assert cache.get("query") == result("an answer", "a.txt")
+
+
+def test_results_are_kept_per_settings():
+    cache = QueryCache(max_entries=4)
+    cache.put("query", result("from llama"), settings=("llama3.2", 5))
+
+    assert cache.get("query", settings=("llama3.2", 5))["response"] == "from llama"
+    assert cache.get("query", settings=("mistral", 5)) is None
+    assert cache.get("query") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryCache(max_entries=2)
+    cache.put("first", result("1"))
+    cache.put("second", result("2"))
+    cache.get("first")
+    cache.put("third", result("3"))
+
+    assert len(cache) == 2
+    assert cache.get("second") is None
+    assert cache.get("first")["response"] == "1"
+    assert cache.get("third")["response"] == "3"
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = QueryCache(max_entries=4, ttl=60)
+    cache.put("query", result("an answer"))
+
+    clock[0] += 59
+    assert cache.get("query") is not None
+    clock[0] += 2
+    assert cache.get("query") is None
+    assert len(cache) == 0
+
+
+def test_disabled_cache_stores_nothing():
+    cache = QueryCache(max_entries=0)
+    cache.put("query", result("an answer"))
+    assert cache.get("query") is None
+
+
+def test_similar_query_above_threshold_reuses_result(clock):
+    cache = QueryCache(max_entries=4, ttl=60, similarity_threshold=0.9)
+    cache.put("how do I reset my password", result("reset it"), embedding=[1.0, 0.0])
+
+    # cos = 0.995 and 0.707
+    assert cache.get("password reset steps", [1.0, 0.1])["response"] == "reset it"
+    assert cache.get("unrelated", [1.0, 1.0]) is None
+    assert cache.get("no embedding") is None
+    assert cache.get("same, other settings", [1.0, 0.1], settings="other") is None
+    clock[0] += 61
+    assert cache.get("password reset steps", [1.0, 0.1]) is None
+
+
+def test_exact_only_cache_ignores_embeddings():
+    cache = QueryCache(max_entries=4)
+    cache.put("query", result("an answer"), embedding=[1.0, 0.0])
+
+    assert not cache.semantic
+    assert cache.get("other query", [1.0, 0.0]) is None
+
+
+def test_invalidate_files_drops_results_with_those_sources():
+    cache = QueryCache(max_entries=4)
+    cache.put("first", result("1", "a.txt", "b.txt"))
+    cache.put("second", result("2", "c.txt"))
+    cache.put("third", result("3", "N/A"))
+
+    assert cache.invalidate_files([]) == 0
+    assert cache.invalidate_files(["b.txt", "d.txt"]) == 1
+    assert cache.get("first") is None
+    assert cache.get("second") is not None
+    assert cache.get("third") is not None
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_engine_cache_is_off_by_default_and_keyed_on_settings(make_engine):
+    (make_engine.docs_dir / "a.txt").write_text("alpha beta gamma " * 20)
+    engine = make_engine()
+    assert engine.query_cache is None
+
+    engine = make_engine(query_cache_size=8)
+    engine.update_index()
+    first = engine.query("alpha")
+    first["response"] = "mutated by the caller"
+    assert engine.query("alpha")["response"] != "mutated by the caller"
+    assert engine.query_cache.hits == 1
+
+    engine.similarity_top_k = 1
+    engine.query("alpha")
+    assert engine.query_cache.hits == 1
+    assert engine.query_cache.misses == 2
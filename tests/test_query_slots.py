@@ -0,0 +1,92 @@
+# test_query_slots.py
+
+import asyncio
+import gc
+import time
+
+import pytest
+
+CONCURRENCY = 2
+
+
+def wait_for_free_slots(semaphore, timeout=5):
+    """Wait until every slot of the semaphore is free again, and say whether it was."""
+    deadline = time.monotonic() + timeout
+    while semaphore._value != CONCURRENCY and time.monotonic() < deadline:
+        gc.collect()
+        time.sleep(0.01)
+    return semaphore._value == CONCURRENCY
+
+
+async def await_free_slots(semaphore, timeout=5):
+    """Like wait_for_free_slots, letting the running loop close dropped generators."""
+    deadline = time.monotonic() + timeout
+    while semaphore._value != CONCURRENCY and time.monotonic() < deadline:
+        gc.collect()
+        await asyncio.sleep(0.01)
+    return semaphore._value == CONCURRENCY
+
+
+@pytest.fixture
+def engine(make_engine):
+    (make_engine.docs_dir / "a.txt").write_text("alpha beta gamma " * 50)
+    engine = make_engine(query_concurrency=CONCURRENCY)
+    engine.update_index()
+    return engine
+
+
+def test_half_read_stream_gives_back_its_slot(engine):
+    semaphore = engine._sync_query_semaphore
+
+    stream = engine.stream_query("alpha")
+    tokens = iter(stream)
+    next(tokens)
+    assert semaphore._value == CONCURRENCY - 1
+    del stream, tokens
+    assert wait_for_free_slots(semaphore)
+
+    # Left unread, then dropped
+    engine.stream_query("alpha")
+    assert wait_for_free_slots(semaphore)
+
+    stream = engine.stream_query("alpha")
+    for _ in stream:
+        break
+    stream.close()
+    assert semaphore._value == CONCURRENCY
+
+    # A full read still works once the dropped streams are gone
+    assert "".join(engine.stream_query("alpha"))
+    assert semaphore._value == CONCURRENCY
+
+
+def test_half_read_async_stream_gives_back_its_slot(engine):
+    async def main():
+        stream = await engine.astream_query("alpha")
+        tokens = stream.__aiter__()
+        await tokens.__anext__()
+        assert engine._query_semaphore._value == CONCURRENCY - 1
+        del stream, tokens
+        assert await await_free_slots(engine._query_semaphore)
+
+        await engine.astream_query("alpha")
+        assert await await_free_slots(engine._query_semaphore)
+
+        stream = await engine.astream_query("alpha")
+        async for _ in stream:
+            break
+        await stream.aclose()
+        assert await await_free_slots(engine._query_semaphore)
+
+        # Every slot can be taken at once again
+        streams = await asyncio.wait_for(
+            asyncio.gather(
+                *(engine.astream_query("alpha") for _ in range(CONCURRENCY))
+            ),
+            timeout=5,
+        )
+        for stream in streams:
+            assert [token async for token in stream]
+
+    asyncio.run(main())
+    assert wait_for_free_slots(engine._query_semaphore)
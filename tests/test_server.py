@@ -0,0 +1,103 @@
+# test_server.py
+
+import socket
+import threading
+import time
+
+import pytest
+
+from ollama_rag.query_engine import QueryStream
+from ollama_rag.server import RAGService, make_server, request, stream_request
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(socket, "AF_UNIX"), reason="Unix sockets are not available"
+)
+
+
+class StubEngine:
+    """Answers every query with its own text and records the updates asked for."""
+
+    def __init__(self):
+        self.queries = []
+        self.updates = []
+
+    def query(self, query_text, filters=None):
+        self.queries.append((query_text, filters))
+        if filters and "author" in filters:
+            raise ValueError("Unknown filters: author")
+        return {"response": f"answer to {query_text}", "sources": [{"file": "a.txt"}]}
+
+    def stream_query(self, query_text, filters=None):
+        self.queries.append((query_text, filters))
+        return QueryStream(
+            [{"file": "a.txt"}],
+            iter(["answer ", "to ", query_text]),
+            time.perf_counter(),
+        )
+
+    def update_index(self, file_paths=None):
+        self.updates.append(file_paths)
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Serve a stub engine on a Unix socket and return (engine, socket path)."""
+    engine = StubEngine()
+    socket_path = str(tmp_path / "rag.sock")
+    server = make_server(RAGService(engine), socket_path=socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield engine, socket_path
+    server.shutdown()
+    server.server_close()
+    thread.join(5)
+
+
+def test_query_round_trip_over_unix_socket(server):
+    engine, socket_path = server
+
+    status, result = request(
+        "POST",
+        "/query",
+        {"query": "what?", "filters": {"extensions": [".txt"]}},
+        socket_path=socket_path,
+        timeout=10,
+    )
+
+    assert status == 200
+    assert result["response"] == "answer to what?"
+    assert result["sources"] == [{"file": "a.txt"}]
+    assert result["latency_ms"] >= 0
+    assert engine.queries == [("what?", {"extensions": [".txt"]})]
+
+    status, result = request("POST", "/query", {}, socket_path=socket_path)
+    assert (status, result) == (400, {"error": "Missing 'query'."})
+    status, result = request(
+        "POST",
+        "/query",
+        {"query": "q", "filters": {"author": "me"}},
+        socket_path=socket_path,
+    )
+    assert (status, result) == (400, {"error": "Unknown filters: author"})
+
+
+def test_streamed_query_and_service_endpoints(server):
+    engine, socket_path = server
+
+    lines = list(stream_request("why?", socket_path=socket_path, timeout=10))
+
+    assert lines[0] == {"sources": [{"file": "a.txt"}]}
+    assert [line["token"] for line in lines[1:-1]] == ["answer ", "to ", "why?"]
+    assert set(lines[-1]) == {"ttft_ms", "latency_ms"}
+
+    status, result = request(
+        "POST", "/reindex", {"wait": True}, socket_path=socket_path
+    )
+    assert status == 200 and result["error"] is None
+    assert engine.updates == [None]
+
+    status, stats = request("GET", "/health", socket_path=socket_path)
+    assert status == 200
+    assert (stats["queries"], stats["errors"]) == (1, 0)
+    assert stats["last_reindex"] == result
+    assert request("GET", "/missing", socket_path=socket_path)[0] == 404
@@ -0,0 +1,122 @@
+# test_shards.py
+
+import os
+
+import chromadb
+import pytest
+
+from ollama_rag.indexer import get_source_paths
+from ollama_rag.shards import ShardedCollection
+
+
+@pytest.fixture
+def collection(tmp_path):
+    """A collection sharded over the input directories a/ and b/ under tmp_path."""
+    client = chromadb.PersistentClient(path=str(tmp_path / "chroma_db"))
+    input_dirs = [str(tmp_path / "a"), str(tmp_path / "b")]
+    return ShardedCollection(client, "docs", "input_dir", input_dirs=input_dirs)
+
+
+def add_chunks(collection, tmp_path, rows):
+    """Add chunks given as (id, input directory, embedding) tuples."""
+    collection.add(
+        ids=[node_id for node_id, _, _ in rows],
+        embeddings=[embedding for _, _, embedding in rows],
+        metadatas=[
+            {"file_path": str(tmp_path / input_dir / f"{node_id}.txt")}
+            for node_id, input_dir, _ in rows
+        ],
+        documents=[f"text of {node_id}" for node_id, _, _ in rows],
+    )
+
+
+def shard_ids(collection):
+    return {
+        shard: sorted(shard_collection.get(include=[])["ids"])
+        for shard, shard_collection in collection.shards.items()
+    }
+
+
+def test_query_merges_top_k_across_shards(collection, tmp_path):
+    add_chunks(
+        collection,
+        tmp_path,
+        [
+            ("a1", "a", [1.0, 0.0]),
+            ("a2", "a", [0.0, 1.0]),
+            ("b1", "b", [0.9, 0.1]),
+            ("b2", "b", [-1.0, 0.0]),
+        ],
+    )
+    assert len(collection.shards) == 2
+    assert collection.count() == 4
+
+    result = collection.query(query_embeddings=[[1.0, 0.0]], n_results=3)
+    assert result["ids"] == [["a1", "b1", "a2"]]
+    distances = result["distances"][0]
+    assert distances == sorted(distances)
+    assert result["documents"][0][1] == "text of b1"
+
+
+def test_paged_get_walks_through_every_shard(collection, tmp_path):
+    add_chunks(
+        collection,
+        tmp_path,
+        [(f"a{i}", "a", [1.0, float(i)]) for i in range(3)]
+        + [(f"b{i}", "b", [0.0, float(i)]) for i in range(2)],
+    )
+
+    pages = [
+        collection.get(limit=2, offset=offset, include=[])["ids"]
+        for offset in (0, 2, 4, 6)
+    ]
+    assert [len(page) for page in pages] == [2, 2, 1, 0]
+    assert sorted(sum(pages, [])) == ["a0", "a1", "a2", "b0", "b1"]
+
+
+def test_update_moves_chunk_to_the_shard_of_its_new_file(collection, tmp_path):
+    add_chunks(collection, tmp_path, [("x", "a", [1.0, 0.0]), ("y", "a", [0.0, 1.0])])
+    new_path = str(tmp_path / "b" / "x.txt")
+
+    collection.update(ids=["x"], metadatas=[{"file_path": new_path}])
+
+    shard_a = collection.shard_of(str(tmp_path / "a" / "y.txt"))
+    shard_b = collection.shard_of(new_path)
+    assert shard_ids(collection) == {shard_a: ["y"], shard_b: ["x"]}
+    moved = collection.get(ids=["x"], include=["metadatas", "documents", "embeddings"])
+    assert moved["metadatas"] == [{"file_path": new_path}]
+    assert moved["documents"] == ["text of x"]
+    assert list(moved["embeddings"][0]) == [1.0, 0.0]
+
+    collection.delete(ids=["x", "y"])
+    assert collection.count() == 0
+
+
+def test_engine_moves_deduplicated_chunk_between_shards(make_engine, tmp_path):
+    input_dirs = [tmp_path / "first", tmp_path / "second"]
+    for input_dir in input_dirs:
+        input_dir.mkdir()
+        (input_dir / "report.txt").write_text("the same report in both folders")
+    engine = make_engine(
+        input_dirs=[str(input_dir) for input_dir in input_dirs], shard_by="input_dir"
+    )
+    engine.update_index()
+    collection = engine.index.vector_store.client
+    ((node_id,),) = [ids for ids in shard_ids(collection).values() if ids]
+    attributed = collection.get(ids=[node_id])["metadatas"][0]["file_path"]
+    other = [
+        str(input_dir / "report.txt")
+        for input_dir in input_dirs
+        if str(input_dir / "report.txt") != attributed
+    ][0]
+
+    os.remove(attributed)
+    engine.update_index()
+
+    assert shard_ids(collection) == {
+        collection.shard_of(attributed): [],
+        collection.shard_of(other): [node_id],
+    }
+    metadata = collection.get(ids=[node_id])["metadatas"][0]
+    assert metadata["file_path"] == other
+    assert get_source_paths(metadata) == [other]